@@ -0,0 +1,84 @@
+"""
+Fuel use over time per driver, answered from the user_daily_totals rollups.
+
+Days come from one range query on the rollup table; weeks (starting Monday)
+and months are summed from those days, so no query touches the rides table.
+Buckets at the edges of the range only include the days inside it.
+"""
+from datetime import date, timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """First day of the day/week/month bucket containing day."""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def daily_rows(db: Session, start: date, end: date, user_id: Optional[int] = None):
+    """Rows of (user_id, name, color, day, distance, fuel, ride_count, cost) for start <= day <= end."""
+    query = (
+        db.query(
+            models.UserDailyTotals.user_id,
+            models.User.name,
+            models.User.color,
+            models.UserDailyTotals.day,
+            models.UserDailyTotals.total_distance,
+            models.UserDailyTotals.total_fuel,
+            models.UserDailyTotals.ride_count,
+            models.UserDailyTotals.total_cost,
+        )
+        # Rides of a driver that no longer exists have nobody to chart them for
+        .join(models.User, models.User.id == models.UserDailyTotals.user_id)
+        .filter(
+            models.UserDailyTotals.day >= start,
+            models.UserDailyTotals.day <= end,
+            models.UserDailyTotals.ride_count > 0,
+        )
+    )
+    if user_id is not None:
+        query = query.filter(models.UserDailyTotals.user_id == user_id)
+    return query.all()
+
+
+def build_buckets(rows, bucket: str) -> List[schemas.ConsumptionBucket]:
+    """Sum (user_id, name, color, day, distance, fuel, ride_count, cost) rows into per-driver buckets, oldest first."""
+    totals = {}
+    for uid, name, color, day, dist, fuel, count, cost in rows:
+        key = (bucket_start(day, bucket), uid)
+        if key not in totals:
+            totals[key] = [name, color, 0.0, 0.0, 0, 0.0]
+        entry = totals[key]
+        entry[2] += dist
+        entry[3] += fuel
+        entry[4] += count
+        entry[5] += cost
+
+    return [
+        schemas.ConsumptionBucket(
+            bucket_start=first_day,
+            user_id=uid,
+            user_name=name,
+            user_color=color,
+            ride_count=count,
+            total_distance=round(dist, 2),
+            total_fuel=round(fuel, 2),
+            total_cost=round(cost, 2),
+            avg_consumption=round(fuel * 100 / dist, 2) if dist > 0 else 0,
+        )
+        for (first_day, uid), (name, color, dist, fuel, count, cost) in sorted(totals.items())
+    ]
+
+
+def consumption_buckets(
+    db: Session, start: date, end: date, bucket: str, user_id: Optional[int] = None
+) -> List[schemas.ConsumptionBucket]:
+    """Per-driver totals for every bucket between start and end (inclusive)."""
+    return build_buckets(daily_rows(db, start, end, user_id), bucket)
@@ -0,0 +1,288 @@
+"""
+Cold storage for the rides of closed tank cycles.
+
+Archiving a closed cycle moves its rides out of the rides table into one
+cycle_archives row: the rides as zlib-compressed JSON columns, plus frozen
+per-driver and per-driver-day totals. The rollups are left as they are, so
+/api/stats?cycle_id=, /api/cycles, the history view and the analytics read
+archived cycles exactly as before, while the rides table and its index only
+hold the cycles still in use. The admin ride list and the rides export read
+archived cycles from the archive. Archived rides cannot be edited or deleted
+one by one; restore the cycle first, which puts the rides back with their
+original ids.
+
+From backend/:
+    python -m app.archive list
+    python -m app.archive archive --keep 12        # all but the 12 newest closed cycles
+    python -m app.archive archive --before 2024-01-01
+    python -m app.archive archive --cycle-id N
+    python -m app.archive restore --cycle-id N
+
+SQLite does not give freed pages back to the file system; run VACUUM after
+archiving a large share of the rides to shrink fuel.db.
+"""
+import argparse
+import json
+import sys
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from . import database, migrations, models, pagination, state
+
+COLUMNS = ("id", "user_id", "timestamp", "distance_km", "consumption_l100km", "fuel_liters", "cost")
+COMPRESSION_LEVEL = 9
+
+
+def encode(rides) -> bytes:
+    """Compress ride dicts (COLUMNS keys) column by column."""
+    columns = {name: [ride[name] for ride in rides] for name in COLUMNS}
+    columns["timestamp"] = [ts.isoformat() if ts is not None else None for ts in columns["timestamp"]]
+    return zlib.compress(json.dumps(columns, separators=(",", ":")).encode(), COMPRESSION_LEVEL)
+
+
+def decode(data: bytes) -> list:
+    """The ride dicts stored by encode, in their original order."""
+    columns = json.loads(zlib.decompress(data))
+    columns["timestamp"] = [datetime.fromisoformat(ts) if ts is not None else None for ts in columns["timestamp"]]
+    # Archived before rides had a cost
+    columns.setdefault("cost", [None] * len(columns["id"]))
+    return [dict(zip(COLUMNS, values)) for values in zip(*(columns[name] for name in COLUMNS))]
+
+
+def summarize(rides) -> dict:
+    """Per-driver and per-driver-day (distance, fuel, count, cost) of rides, as stored in the archive."""
+    users = defaultdict(lambda: [0.0, 0.0, 0, 0.0])
+    days = defaultdict(lambda: [0.0, 0.0, 0, 0.0])
+    for ride in rides:
+        keys = [users[ride["user_id"]]]
+        if ride["timestamp"] is not None:
+            keys.append(days[ride["user_id"], ride["timestamp"].date().isoformat()])
+        for totals in keys:
+            totals[0] += ride["distance_km"] or 0.0
+            totals[1] += ride["fuel_liters"] or 0.0
+            totals[2] += 1
+            totals[3] += ride["cost"] or 0.0
+    return {
+        "users": [[uid, *totals] for uid, totals in sorted(users.items())],
+        "days": [[uid, day, *totals] for (uid, day), totals in sorted(days.items())],
+    }
+
+
+def get_archive(db: Session, cycle_id: int) -> Optional[models.CycleArchive]:
+    return db.get(models.CycleArchive, cycle_id)
+
+
+def archive_cycle(db: Session, cycle_id: int) -> models.CycleArchive:
+    """Move the rides of a closed cycle into the archive. Does not commit."""
+    # Serializes with admin edits of the cycle's rides and with a concurrent archive/restore
+    state.bump(db, state.cycle_rides(cycle_id))
+    cycle = db.get(models.TankCycle, cycle_id)
+    if cycle is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Cycle not found")
+    if cycle.is_active:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cannot archive the active cycle")
+    if get_archive(db, cycle_id) is not None:
+        raise HTTPException(status.HTTP_409_CONFLICT, "Cycle is already archived")
+
+    columns = [getattr(models.Ride, name) for name in COLUMNS]
+    rides = [
+        dict(zip(COLUMNS, row))
+        for row in db.query(*columns).filter(models.Ride.tank_cycle_id == cycle_id).order_by(models.Ride.id)
+    ]
+    archive = models.CycleArchive(tank_cycle_id=cycle_id)
+    store(archive, rides)
+    db.add(archive)
+    db.query(models.Ride).filter(models.Ride.tank_cycle_id == cycle_id).delete(synchronize_session=False)
+    db.flush()
+    return archive
+
+
+def store(archive: models.CycleArchive, rides):
+    """Set the rides of an archive row and the totals derived from them."""
+    summary = summarize(rides)
+    archive.ride_count = len(rides)
+    archive.total_distance = sum(totals[1] for totals in summary["users"])
+    archive.total_fuel = sum(totals[2] for totals in summary["users"])
+    archive.total_cost = sum(totals[4] for totals in summary["users"])
+    archive.summary = json.dumps(summary, separators=(",", ":"))
+    archive.rides = encode(rides)
+
+
+def reprice(db: Session, cycle_id: int, prices, everything: bool = False) -> int:
+    """Cost the archived rides of a cycle that have none (or all of them) from a prices.PriceHistory.
+
+    Returns the number of rides costed. Does not commit.
+    """
+    archive = get_archive(db, cycle_id)
+    rides = decode(archive.rides)
+    costed = 0
+    for ride in rides:
+        if everything or ride["cost"] is None:
+            ride["cost"] = prices.cost(ride["timestamp"], ride["fuel_liters"])
+            costed += 1
+    if costed:
+        store(archive, rides)
+        db.flush()
+    # One cycle's rides in memory at a time
+    db.expunge(archive)
+    return costed
+
+
+def restore_cycle(db: Session, cycle_id: int) -> int:
+    """Put an archived cycle's rides back into the rides table. Returns the number of rides. Does not commit."""
+    state.bump(db, state.cycle_rides(cycle_id))
+    archive = get_archive(db, cycle_id)
+    if archive is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Cycle is not archived")
+    rides = decode(archive.rides)
+    for ride in rides:
+        ride["tank_cycle_id"] = cycle_id
+    if rides:
+        db.execute(insert(models.Ride), rides)
+    db.delete(archive)
+    db.flush()
+    return len(rides)
+
+
+def delete_archive(db: Session, cycle_id: int):
+    """Drop a cycle's archive row, if any (when the cycle itself is deleted). Does not commit."""
+    db.query(models.CycleArchive).filter(models.CycleArchive.tank_cycle_id == cycle_id).delete(
+        synchronize_session=False
+    )
+
+
+def rides_page(db: Session, archive: models.CycleArchive, user_id: int, after=None, limit=None, with_user=True):
+    """A driver's archived rides as detached Ride objects, newest first, paged like pagination.keyset_page."""
+    rows = [ride for ride in decode(archive.rides) if ride["user_id"] == user_id]
+    rows.sort(key=lambda ride: (ride["timestamp"] or datetime.min, ride["id"]), reverse=True)
+    if after:
+        ts, row_id = pagination.parse_cursor(after)
+        rows = [ride for ride in rows if (ride["timestamp"] or datetime.min, ride["id"]) < (ts, row_id)]
+    if limit is not None:
+        rows = rows[:limit]
+    user = db.get(models.User, user_id) if with_user and rows else None
+    rides = []
+    for row in rows:
+        ride = models.Ride(tank_cycle_id=archive.tank_cycle_id, **row)
+        if with_user:
+            ride.user = user
+        rides.append(ride)
+    return rides
+
+
+def export_rows(db: Session, cycle_id: Optional[int] = None, user_id: Optional[int] = None,
+                start: Optional[date] = None, end: Optional[date] = None):
+    """Archived rides in export.RIDE_COLUMNS order, cycle by cycle; start/end are inclusive days."""
+    archives = db.query(models.CycleArchive.tank_cycle_id).order_by(models.CycleArchive.tank_cycle_id)
+    if cycle_id is not None:
+        archives = archives.filter(models.CycleArchive.tank_cycle_id == cycle_id)
+    if start is None and end is None:
+        cycle_ids = [row[0] for row in archives]
+    else:
+        # Skip cycles with no ride in the day range. Ride timestamps need not
+        # lie within their cycle's dates, so go by the ride days in the summary
+        first, last = (start or date.min).isoformat(), (end or date.max).isoformat()
+        cycle_ids = [
+            archived_id for archived_id, summary in archives.add_columns(models.CycleArchive.summary)
+            if any(first <= day <= last for _, day, *_ in json.loads(summary)["days"])
+        ]
+    if not cycle_ids:
+        return
+    names = dict(db.query(models.User.id, models.User.name).all())
+    start_ts = datetime.combine(start, datetime.min.time()) if start else None
+    end_ts = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    for archived_id in cycle_ids:
+        # One cycle decoded at a time
+        data = db.query(models.CycleArchive.rides).filter(models.CycleArchive.tank_cycle_id == archived_id).scalar()
+        for ride in decode(data):
+            if user_id is not None and ride["user_id"] != user_id:
+                continue
+            ts = ride["timestamp"]
+            if (start_ts and (ts is None or ts < start_ts)) or (end_ts and (ts is None or ts >= end_ts)):
+                continue
+            yield (ride["id"], ts, ride["user_id"], names.get(ride["user_id"]), archived_id,
+                   ride["distance_km"], ride["consumption_l100km"], ride["fuel_liters"], ride["cost"])
+
+
+def candidates(db: Session, before: Optional[date] = None, keep: Optional[int] = None):
+    """Ids of closed, not yet archived cycles that ended before `before` or are older than the `keep` newest."""
+    query = (
+        db.query(models.TankCycle.id)
+        .outerjoin(models.CycleArchive, models.CycleArchive.tank_cycle_id == models.TankCycle.id)
+        .filter(models.TankCycle.is_active == False, models.CycleArchive.tank_cycle_id.is_(None))
+    )
+    if before is not None:
+        query = query.filter(models.TankCycle.end_date < before)
+    ids = [row[0] for row in query.order_by(models.TankCycle.start_date.desc(), models.TankCycle.id.desc())]
+    if keep is not None:
+        # The keep newest closed cycles are left alone, archived or not
+        newest = [row[0] for row in db.query(models.TankCycle.id).filter(models.TankCycle.is_active == False)
+                  .order_by(models.TankCycle.start_date.desc(), models.TankCycle.id.desc()).limit(keep)]
+        ids = [cycle_id for cycle_id in ids if cycle_id not in newest]
+    return sorted(ids)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.archive", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["list", "archive", "restore"])
+    parser.add_argument("--cycle-id", type=int, default=None, help="The cycle to archive or restore")
+    parser.add_argument("--before", type=date.fromisoformat, default=None,
+                        help="Archive closed cycles that ended before this day (YYYY-MM-DD)")
+    parser.add_argument("--keep", type=int, default=None, help="Archive all but this many newest closed cycles")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        if args.command == "list":
+            rows = db.query(
+                models.CycleArchive.tank_cycle_id, models.CycleArchive.archived_at, models.CycleArchive.ride_count,
+                func.length(models.CycleArchive.rides),
+            ).order_by(models.CycleArchive.tank_cycle_id).all()
+            for cycle_id, archived_at, ride_count, size in rows:
+                print(f"cycle {cycle_id}: {ride_count} rides in {size} bytes, archived {archived_at:%Y-%m-%d %H:%M}")
+            print(f"{len(rows)} archived cycle(s), {db.query(models.Ride.id).count()} ride(s) in the rides table")
+            return 0
+
+        if args.command == "restore":
+            if args.cycle_id is None:
+                parser.error("restore needs --cycle-id")
+            try:
+                count = restore_cycle(db, args.cycle_id)
+            except HTTPException as exc:
+                print(exc.detail)
+                return 1
+            db.commit()
+            print(f"Restored {count} ride(s) of cycle {args.cycle_id}")
+            return 0
+
+        if args.cycle_id is not None:
+            cycle_ids = [args.cycle_id]
+        elif args.before is not None or args.keep is not None:
+            cycle_ids = candidates(db, args.before, args.keep)
+        else:
+            parser.error("archive needs --cycle-id, --before or --keep")
+        archived = 0
+        for cycle_id in cycle_ids:
+            try:
+                archive = archive_cycle(db, cycle_id)
+            except HTTPException as exc:
+                print(f"cycle {cycle_id}: {exc.detail}")
+                db.rollback()
+                return 1
+            ride_count = archive.ride_count
+            # One transaction per cycle keeps locks and the write-ahead log short
+            db.commit()
+            archived += ride_count
+            print(f"cycle {cycle_id}: archived {ride_count} ride(s)")
+        print(f"Archived {len(cycle_ids)} cycle(s), {archived} ride(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,11 @@
-from passlib.context import CryptContext
-from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 import hashlib
-from . import models, database
-
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+import os
+import time
+from . import models, database, passwords, cache, state
 
 # JWT settings
 # NOTE: In production, use environment variable: os.getenv("SECRET_KEY")
@@ -18,6 +15,15 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
 security = HTTPBearer()
 
+# Verified principals keyed by token, so authenticated requests skip the DB lookup.
+# Each entry remembers the version of the state counter its row was loaded at
+# (state.USERS for drivers, state.ADMIN for the admin); driver updates/deletes
+# and admin password changes bump it, so every worker reloads the row on its
+# next request. The process that made the change also drops its entries at once.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+principal_cache = cache.TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
 
 def _pre_hash_password(password: str) -> str:
     """Pre-hash password with SHA-256 to handle bcrypt's 72-byte limit.
@@ -45,7 +51,7 @@ def hash_password(password: str) -> str:
     the 72-byte bcrypt limit securely.
     """
     pre_hashed = _pre_hash_password(password)
-    return pwd_context.hash(pre_hashed)
+    return passwords.hash_sync(pre_hashed)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -55,7 +61,17 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     the hashing process.
     """
     pre_hashed = _pre_hash_password(plain_password)
-    return pwd_context.verify(pre_hashed, hashed_password)
+    return passwords.verify_sync(pre_hashed, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """Like hash_password, but runs bcrypt on the password process pool."""
+    return await passwords.run(passwords.hash_sync, _pre_hash_password(password))
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Like verify_password, but runs bcrypt on the password process pool."""
+    return await passwords.run(passwords.verify_sync, _pre_hash_password(plain_password), hashed_password)
 
 
 def create_access_token(data: dict) -> str:
@@ -63,12 +79,14 @@ def create_access_token(data: dict) -> str:
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    from jose import jwt  # imported on first use; jose is slow to import
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 def verify_token(token: str) -> dict:
     """Verify and decode a JWT token."""
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         return payload
@@ -80,13 +98,52 @@ def verify_token(token: str) -> dict:
         )
 
 
+def _versions(db: Session) -> dict:
+    """Versions of the state counters of cached principals; read before loading a principal."""
+    return {name: state.version(db, name) for name in (state.USERS, state.ADMIN)}
+
+
+def _cached(kind: str, token: str, db: Session):
+    """The cached principal of token, unless its state counter moved since it was loaded."""
+    entry = principal_cache.get((kind, token), valid=lambda entry: state.version(db, entry[0]) == entry[1])
+    return entry[2] if entry is not None else None
+
+
+def _remember(kind: str, token: str, payload: dict, principal, db: Session, versions: dict):
+    """Cache a verified principal, detached from the request session, until the token expires."""
+    db.expunge(principal)
+    tag = ("admin", principal.id) if isinstance(principal, models.Admin) else ("user", principal.id)
+    name = state.ADMIN if tag[0] == "admin" else state.USERS
+    expires_in = payload.get("exp", time.time() + AUTH_CACHE_TTL) - time.time()
+    value = principal
+    if kind == "any":
+        value = {"type": tag[0], tag[0]: principal}
+    principal_cache.set((kind, token), (name, versions[name], value), tag=tag, expires_in=expires_in)
+    return value
+
+
+def invalidate_user(user_id: int):
+    """Forget cached principals of a user (after update, delete or password change)."""
+    principal_cache.invalidate_tag(("user", user_id))
+
+
+def invalidate_admin(admin_id: int):
+    """Forget cached admin principals (after a password change)."""
+    principal_cache.invalidate_tag(("admin", admin_id))
+
+
 def get_current_admin(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: Session = Depends(database.get_db)
 ):
     """Dependency to verify admin authentication."""
     token = credentials.credentials
+    cached = _cached("admin", token, db)
+    if cached is not None:
+        return cached
+
     payload = verify_token(token)
+    versions = _versions(db)
     
     # Verify admin exists in database
     admin = db.query(models.Admin).first()
@@ -96,7 +153,7 @@ def get_current_admin(
             detail="Admin not found",
         )
     
-    return admin
+    return _remember("admin", token, payload, admin, db, versions)
 
 
 def ensure_admin(db: Session):
@@ -121,7 +178,12 @@ def get_current_user(
 ):
     """Dependency to verify user authentication."""
     token = credentials.credentials
+    cached = _cached("user", token, db)
+    if cached is not None:
+        return cached
+
     payload = verify_token(token)
+    versions = _versions(db)
     
     user_id = payload.get("user_id")
     if not user_id:
@@ -137,7 +199,7 @@ def get_current_user(
             detail="User not found or inactive",
         )
     
-    return user
+    return _remember("user", token, payload, user, db, versions)
 
 
 def get_current_user_or_admin(
@@ -146,7 +208,12 @@ def get_current_user_or_admin(
 ):
     """Dependency to verify user or admin authentication."""
     token = credentials.credentials
+    cached = _cached("any", token, db)
+    if cached is not None:
+        return cached
+
     payload = verify_token(token)
+    versions = _versions(db)
     
     is_admin = payload.get("sub") == "admin"
     user_id = payload.get("user_id")
@@ -158,7 +225,7 @@ def get_current_user_or_admin(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Admin not found",
             )
-        return {"type": "admin", "admin": admin}
+        return _remember("any", token, payload, admin, db, versions)
     elif user_id:
         user = db.query(models.User).filter(models.User.id == user_id).first()
         if not user or not user.is_active:
@@ -166,7 +233,7 @@ def get_current_user_or_admin(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User not found or inactive",
             )
-        return {"type": "user", "user": user}
+        return _remember("any", token, payload, user, db, versions)
     else:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,94 @@
+"""
+Small thread-safe in-process caches.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    LRU cache whose entries expire after ttl seconds (or an explicit deadline).
+    Entries can carry a tag so that every entry about the same object can be
+    invalidated at once. Hit/miss/invalidation counters are kept for metrics.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, valid=None):
+        """The value of key, or None if it is missing, expired or fails valid(value).
+
+        valid runs outside the cache lock (it may query the database); an entry
+        it rejects is dropped and counted as a miss and an invalidation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            if valid is None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+        if not valid(entry[2]):
+            with self._lock:
+                if self._data.get(key) is entry:
+                    del self._data[key]
+                    self.invalidations += 1
+                self.misses += 1
+            return None
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+            self.hits += 1
+        return entry[2]
+
+    def __contains__(self, key):
+        """Whether key holds an unexpired entry, without counting a hit or miss or refreshing its LRU position."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] > time.monotonic()
+
+    def set(self, key, value, tag=None, expires_in=None):
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, tag, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate_tag(self, tag):
+        """Drop every entry stored with tag."""
+        with self._lock:
+            stale = [key for key, entry in self._data.items() if entry[1] == tag]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
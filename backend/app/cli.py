@@ -0,0 +1,36 @@
+"""
+Command line tasks for the backend (from backend/):
+    python -m app.cli init-db
+
+init-db creates missing tables, columns and indexes, the default admin, the
+statistics rollups and the fuel price history. Workers do the same on startup unless
+INIT_DB_ON_STARTUP=0, so a deployment can run it once before starting them.
+"""
+import argparse
+import sys
+
+from . import database, migrations, auth, rollups, prices
+
+
+def init_db():
+    """Bring the database up to date. Safe to run repeatedly."""
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        auth.ensure_admin(db)
+        rollups.ensure_populated(db)
+        prices.ensure_populated(db)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["init-db"])
+    args = parser.parse_args(argv)
+
+    if args.command == "init-db":
+        init_db()
+        print(f"Database ready: {database.engine.url.render_as_string(hide_password=True)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
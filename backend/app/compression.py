@@ -0,0 +1,104 @@
+"""
+Response compression.
+
+Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli
+when the client accepts it and the optional brotli package is installed,
+and with gzip (Starlette's GZipMiddleware) otherwise. Streams are compressed
+chunk by chunk and flushed after every chunk. Event streams and formats that
+are compressed already are sent as they are.
+"""
+import os
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware.gzip import GZipMiddleware
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+# Quality 4 matches the ratio of gzip -6 on JSON in less time; 11 is meant for static files
+BROTLI_QUALITY = 4
+# Bodies this large are compressed on a worker thread instead of the event loop
+THREAD_MIN_SIZE = 128 * 1024
+UNCOMPRESSED_TYPES = ("text/event-stream", "application/vnd.apache.parquet", "application/zip", "application/gzip")
+
+
+def accepts(scope, encoding: str) -> bool:
+    for item in Headers(scope=scope).get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        if name.strip().lower() == encoding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+class BrotliMiddleware:
+    """Brotli-encode responses for clients that accept br. Does nothing without the brotli package."""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, quality: int = BROTLI_QUALITY):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.quality = quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or brotli is None or not accepts(scope, "br"):
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+        passthrough = False
+
+        async def compress(body: bytes, more_body: bool) -> bytes:
+            def run():
+                data = compressor.process(body)
+                return data + (compressor.flush() if more_body else compressor.finish())
+            if len(body) >= THREAD_MIN_SIZE:
+                return await anyio.to_thread.run_sync(run)
+            return run()
+
+        async def send_compressed(message):
+            nonlocal start, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+                passthrough = ("content-encoding" in headers or message["status"] in (204, 206, 304)
+                               or media_type in UNCOMPRESSED_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start)
+                    await send(message)
+                    return
+                compressor = brotli.Compressor(quality=self.quality)
+                headers["Content-Encoding"] = "br"
+                del headers["Content-Length"]
+                await send(start)
+                start = None
+            message["body"] = await compress(body, more_body)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+def add_compression(app):
+    """Install brotli and gzip compression; call after the other middleware so it runs outermost."""
+    # GZip is added last so it wraps brotli and skips bodies brotli already encoded
+    app.add_middleware(BrotliMiddleware)
+    app.add_middleware(GZipMiddleware, minimum_size=COMPRESSION_MIN_SIZE, compresslevel=GZIP_LEVEL)
@@ -0,0 +1,80 @@
+"""
+The active tank cycle.
+
+A unique partial index allows at most one active cycle. Code that creates or
+closes cycles first bumps the active-cycle state counter, whose row lock
+serializes it across workers. Ride writers hold that counter row shared
+(lock_active_id), so a close waits for rides in flight and no ride is added
+to a cycle after it was closed.
+"""
+from datetime import datetime
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, rollups, state
+
+
+def find_active(db: Session):
+    return db.query(models.TankCycle).filter(models.TankCycle.is_active == True).first()
+
+
+def get_active(db: Session) -> models.TankCycle:
+    """Return the active cycle, creating (and committing) the first one if there is none."""
+    cycle = find_active(db)
+    if cycle:
+        return cycle
+
+    # Lock the active-cycle counter, then look again: another worker may have created it
+    state.bump(db, state.ACTIVE_CYCLE)
+    cycle = find_active(db)
+    if not cycle:
+        cycle = models.TankCycle()
+        db.add(cycle)
+    try:
+        db.commit()
+    except IntegrityError:
+        # The unique index caught a concurrent creator that bypassed the lock
+        db.rollback()
+        return find_active(db)
+    db.refresh(cycle)
+    return cycle
+
+
+def lock_active_id(db: Session) -> int:
+    """Id of the active cycle, which cannot be closed until the transaction ends."""
+    state.hold(db, state.ACTIVE_CYCLE)
+    cycle_id = db.query(models.TankCycle.id).filter(models.TankCycle.is_active == True).scalar()
+    if cycle_id is None:
+        # First ride ever: create the cycle (this commits), then lock again
+        get_active(db)
+        state.hold(db, state.ACTIVE_CYCLE)
+        cycle_id = db.query(models.TankCycle.id).filter(models.TankCycle.is_active == True).scalar()
+    return cycle_id
+
+
+def close_and_open(db: Session) -> models.TankCycle:
+    """Close the active cycle and open the next one in one transaction. Returns the closed cycle. Does not commit."""
+    state.bump(db, state.ACTIVE_CYCLE)
+
+    now = datetime.now()
+    closed_id = db.execute(
+        update(models.TankCycle)
+        .where(models.TankCycle.is_active == True)
+        .values(is_active=False, end_date=now)
+        .returning(models.TankCycle.id),
+        execution_options={"synchronize_session": False},
+    ).scalar()
+    if closed_id is None:
+        # Nothing was active yet: record an empty closed cycle, as closing a fresh one would
+        empty = models.TankCycle(start_date=now, end_date=now, is_active=False)
+        db.add(empty)
+        db.flush()
+        closed_id = empty.id
+
+    db.add(models.TankCycle())  # Auto creates active=True
+    # Freeze exact totals for the closed cycle, discarding any accumulated drift
+    rollups.rebuild(db, closed_id)
+    db.flush()
+    return db.get(models.TankCycle, closed_id, populate_existing=True)
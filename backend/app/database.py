@@ -1,15 +1,128 @@
-from sqlalchemy import create_engine
+import functools
+import inspect
+import os
+
+from fastapi import Depends
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.responses import Response
+
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./fuel.db")
+
+# Serve database routes from the event loop through an AsyncSession (aiosqlite
+# or psycopg) instead of one threadpool worker per request
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "0") == "1"
+
+# Connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Server databases (PostgreSQL): test connections on checkout, cap query time
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "30000"))  # ms, 0 = none
+
+# SQLite pragmas applied to every new connection. WAL lets /api/stats readers
+# run while a ride is being written. With NORMAL in WAL mode the database stays
+# consistent, and commits survive an application crash, but the last commits
+# can be lost on power loss or an OS crash; FULL syncs every commit to disk
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(128 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-16000"))  # negative = KiB
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))  # ms
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def async_url(url: str) -> str:
+    """URL of the asyncio driver for the same database."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql" and parsed.get_driver_name() != "asyncpg":
+        # psycopg 3 serves both the sync and the async engine
+        return parsed.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    return url
+
+
+def engine_options(url: str) -> dict:
+    """create_engine keyword arguments for url (the same for the async engine)."""
+    options = {}
+    if is_sqlite(url):
+        # connect_args={"check_same_thread": False} is required for SQLite
+        options["connect_args"] = {"check_same_thread": False}
+        if make_url(url).database in (None, "", ":memory:"):
+            # In-memory databases use a single-connection pool
+            return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if not is_sqlite(url):
+        options["pool_pre_ping"] = DB_POOL_PRE_PING
+    if make_url(url).get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT:
+        if make_url(url).get_driver_name() == "asyncpg":
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+        else:
+            options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+    return options
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+    finally:
+        cursor.close()
+
+
+def configure(engine):
+    """Install the per-connection setup for engine's dialect."""
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", apply_sqlite_pragmas)
+    return engine
+
+
+def upsert(db, model, values: dict, increments: dict):
+    """INSERT values into model, or add increments to the columns of the existing row.
+
+    One statement in SQLite and PostgreSQL (ON CONFLICT on the primary key), so
+    concurrent writers of the same row serialize on it instead of racing to insert.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = model.__table__
+    statement = insert(table).values(**values)
+    return db.execute(statement.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={name: table.c[name] + amount for name, amount in increments.items()},
+    ))
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./fuel.db"
 
-# connect_args={"check_same_thread": False} is required for SQLite
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+engine = configure(create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL)))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ASYNC_DATABASE_URL = async_url(SQLALCHEMY_DATABASE_URL)
+async_engine = None
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+    configure(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,4 +130,63 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# Dependency for handlers that pass their session to run_db
+get_session = get_async_db if DATABASE_ASYNC else get_db
+
+
+async def run_db(db, fn, *args):
+    """Await fn(*args, session) with a sync Session, without blocking the event loop.
+
+    db is whatever get_session yielded: an AsyncSession runs fn through run_sync
+    (I/O is awaited on aiosqlite), a plain Session runs fn on the threadpool.
+    """
+    if DATABASE_ASYNC:
+        return await db.run_sync(lambda session: fn(*args, session))
+    return await run_in_threadpool(fn, *args, db)
+
+
+async def run_in_session(fn, *args):
+    """Await fn(*args, session) on a session of its own, for work outside a request."""
+    if DATABASE_ASYNC:
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(lambda session: fn(*args, session))
+    db = SessionLocal()
+    try:
+        return await run_in_threadpool(fn, *args, db)
+    finally:
+        db.close()
+
+
+def async_endpoint(fn, response_model=None):
+    """Wrap a sync handler taking db: Session into an async one backed by get_async_db.
+
+    The body runs via AsyncSession.run_sync, and the result is converted to
+    response_model there, while lazy loads can still reach the database.
+    """
+    adapter = TypeAdapter(response_model) if response_model is not None else None
+    signature = inspect.signature(fn)
+    parameters = [
+        param.replace(default=Depends(get_async_db)) if name == "db" else param
+        for name, param in signature.parameters.items()
+    ]
+
+    def call(kwargs, session):
+        result = fn(db=session, **kwargs)
+        if adapter is not None and not isinstance(result, Response):
+            result = adapter.validate_python(result, from_attributes=True)
+        return result
+
+    @functools.wraps(fn)
+    async def endpoint(db, **kwargs):
+        return await db.run_sync(functools.partial(call, kwargs))
+
+    endpoint.__signature__ = signature.replace(parameters=parameters)
+    return endpoint
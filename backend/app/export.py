@@ -0,0 +1,206 @@
+"""
+Streaming export of rides and tank cycles as CSV or Parquet.
+
+Rows are fetched in yield_per batches from a session owned by the stream and
+written out as they arrive, so memory use does not grow with the number of
+rows exported. Parquet output needs the optional pyarrow package.
+"""
+import csv
+import io
+import itertools
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .pagination import STREAM_BATCH_SIZE
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "parquet": "application/vnd.apache.parquet"}
+# Rows per Parquet row group, which is also the most rows held in memory at once
+PARQUET_ROW_GROUP = 20_000
+
+# (column, pyarrow type) of each exported table, in query order
+RIDE_COLUMNS = [
+    ("ride_id", "int64"),
+    ("timestamp", "timestamp[us]"),
+    ("user_id", "int64"),
+    ("user_name", "string"),
+    ("tank_cycle_id", "int64"),
+    ("distance_km", "double"),
+    ("consumption_l100km", "double"),
+    ("fuel_liters", "double"),
+    ("cost", "double"),
+]
+CYCLE_COLUMNS = [
+    ("cycle_id", "int64"),
+    ("start_date", "timestamp[us]"),
+    ("end_date", "timestamp[us]"),
+    ("is_active", "bool"),
+    ("ride_count", "int64"),
+    ("total_distance", "double"),
+    ("total_fuel", "double"),
+    ("total_cost", "double"),
+]
+
+
+def rides_query(db: Session, cycle_id: Optional[int] = None, user_id: Optional[int] = None,
+                start: Optional[date] = None, end: Optional[date] = None):
+    """Rides with their driver's name in RIDE_COLUMNS order, oldest first; start/end are inclusive days."""
+    query = (
+        db.query(
+            models.Ride.id,
+            models.Ride.timestamp,
+            models.Ride.user_id,
+            models.User.name,
+            models.Ride.tank_cycle_id,
+            models.Ride.distance_km,
+            models.Ride.consumption_l100km,
+            models.Ride.fuel_liters,
+            models.Ride.cost,
+        )
+        .outerjoin(models.User, models.User.id == models.Ride.user_id)
+    )
+    if cycle_id is not None:
+        query = query.filter(models.Ride.tank_cycle_id == cycle_id)
+    if user_id is not None:
+        query = query.filter(models.Ride.user_id == user_id)
+    if start is not None:
+        query = query.filter(models.Ride.timestamp >= start)
+    if end is not None:
+        query = query.filter(models.Ride.timestamp < end + timedelta(days=1))
+    return query.order_by(models.Ride.id)
+
+
+def cycles_query(db: Session):
+    """Tank cycles with their ride totals (from the rollups) in CYCLE_COLUMNS order, oldest first."""
+    totals = (
+        db.query(
+            models.CycleUserTotals.tank_cycle_id,
+            func.sum(models.CycleUserTotals.ride_count).label("ride_count"),
+            func.sum(models.CycleUserTotals.total_distance).label("total_distance"),
+            func.sum(models.CycleUserTotals.total_fuel).label("total_fuel"),
+            func.sum(models.CycleUserTotals.total_cost).label("total_cost"),
+        )
+        .group_by(models.CycleUserTotals.tank_cycle_id)
+        .subquery()
+    )
+    return (
+        db.query(
+            models.TankCycle.id,
+            models.TankCycle.start_date,
+            models.TankCycle.end_date,
+            models.TankCycle.is_active,
+            func.coalesce(totals.c.ride_count, 0),
+            func.coalesce(totals.c.total_distance, 0.0),
+            func.coalesce(totals.c.total_fuel, 0.0),
+            func.coalesce(totals.c.total_cost, 0.0),
+        )
+        .outerjoin(totals, totals.c.tank_cycle_id == models.TankCycle.id)
+        .order_by(models.TankCycle.id)
+    )
+
+
+def check_format(format: str):
+    """Fail before the stream starts when the format cannot be produced."""
+    if format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise HTTPException(status.HTTP_501_NOT_IMPLEMENTED, "Parquet export needs the pyarrow package")
+
+
+def stream(query, columns, format: str, session: Session, filename: str, before=None):
+    """
+    Stream the rows of query as a CSV or Parquet download. The session is
+    owned by the stream and closed when it finishes. before(session), if
+    given, returns rows to send ahead of the query's (archived rides).
+    """
+    try:
+        check_format(format)
+    except HTTPException:
+        session.close()
+        raise
+
+    def generate():
+        try:
+            rows = query.with_session(session).yield_per(STREAM_BATCH_SIZE)
+            if before is not None:
+                rows = itertools.chain(before(session), rows)
+            if format == "parquet":
+                yield from _parquet_chunks(rows, columns)
+            else:
+                yield from _csv_chunks(rows, columns)
+        finally:
+            session.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+
+def _csv_chunks(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for count, row in enumerate(rows, 1):
+        writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+        if count % STREAM_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file object that collects what ParquetWriter writes until the stream drains it."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_chunks(rows, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(type_name)) for name, type_name in columns])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        # Collect each row group column by column, without keeping the row objects
+        values = [[] for _ in columns]
+        for row in rows:
+            for column, value in zip(values, row):
+                column.append(value)
+            if len(values[0]) == PARQUET_ROW_GROUP:
+                writer.write_table(pa.table(values, schema=schema))
+                values = [[] for _ in columns]
+                yield sink.drain()
+        if values[0]:
+            writer.write_table(pa.table(values, schema=schema))
+    yield sink.drain()
@@ -0,0 +1,65 @@
+"""
+Opt-in fast JSON path for large ride lists (FAST_JSON=1).
+
+Rides are selected as plain row tuples joined to their driver instead of ORM
+objects, turned into dicts in the RideOut shape and serialized with orjson,
+skipping both the identity map and pydantic validation. The output is the
+same JSON the RideOut response model produces. Needs the optional orjson
+package.
+"""
+import os
+
+from fastapi import Response
+
+from . import models
+
+FAST_JSON = os.getenv("FAST_JSON", "0") == "1"
+
+if FAST_JSON:
+    import orjson
+
+# Row layout read by ride_dicts
+RIDE_COLUMNS = (
+    models.Ride.id,
+    models.Ride.user_id,
+    models.Ride.tank_cycle_id,
+    models.Ride.timestamp,
+    models.Ride.distance_km,
+    models.Ride.consumption_l100km,
+    models.Ride.fuel_liters,
+    models.Ride.cost,
+    models.User.name.label("user_name"),
+    models.User.color.label("user_color"),
+    models.User.is_active.label("user_is_active"),
+)
+
+
+class ORJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+def rides_query(db, *criteria):
+    """Row tuples in RIDE_COLUMNS order for the rides matching criteria."""
+    return db.query(*RIDE_COLUMNS).join(models.User, models.User.id == models.Ride.user_id).filter(*criteria)
+
+
+def ride_dicts(rows):
+    """RideOut-shaped dicts, keys in schema order, from RIDE_COLUMNS rows."""
+    return [
+        {
+            "id": ride_id,
+            "user_id": user_id,
+            "tank_cycle_id": tank_cycle_id,
+            "timestamp": timestamp,
+            "distance_km": float(distance_km),
+            "consumption_l100km": float(consumption_l100km),
+            "fuel_liters": float(fuel_liters),
+            "cost": None if cost is None else round(float(cost), 2),
+            "user": {"name": name, "color": color, "id": user_id, "is_active": bool(is_active)},
+        }
+        for (ride_id, user_id, tank_cycle_id, timestamp, distance_km, consumption_l100km, fuel_liters, cost,
+             name, color, is_active) in rows
+    ]
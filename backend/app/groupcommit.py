@@ -0,0 +1,184 @@
+"""
+Group commit for POST /api/rides (GROUP_COMMIT=1).
+
+Every commit ends in a sync to disk (a WAL fsync on SQLite with
+SQLITE_SYNCHRONOUS=FULL, a WAL flush on PostgreSQL), so committing each ride
+on its own caps ingest at one ride per disk sync. In group-commit mode ride
+requests are queued to a single writer task per worker, which inserts
+everything that queued up while the previous group was committing (at most
+GROUP_COMMIT_MAX_ROWS rides) in one transaction; GROUP_COMMIT_WINDOW_MS
+makes it wait that long after the first ride for more to arrive. Each
+request is answered with its RideOut only after that transaction has
+committed. If a group's insert fails, its rides are retried one by one, so
+a bad ride fails only its own request; once a group has committed, it is
+never written again.
+
+Configuration (environment variables):
+    GROUP_COMMIT              1 to enable (default 0: one transaction per request)
+    GROUP_COMMIT_WINDOW_MS    how long the writer waits for more rides after the first (default 0)
+    GROUP_COMMIT_MAX_ROWS     most rides per transaction (default 256)
+    GROUP_COMMIT_QUEUE_LIMIT  rides waiting for the writer before rejecting with 503 (default 1024)
+"""
+import asyncio
+import contextvars
+import os
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy.orm import Session, joinedload
+
+from . import cycles, database, ingest, live, models, schemas
+
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "256"))
+GROUP_COMMIT_QUEUE_LIMIT = int(os.getenv("GROUP_COMMIT_QUEUE_LIMIT", "1024"))
+
+# Writer state, bound to the event loop that created it
+_loop = None
+_queue = None
+_full = None
+_writer = None
+_counters = {"submitted": 0, "committed": 0, "failed": 0, "rejected": 0, "transactions": 0, "max_group": 0}
+
+
+def read_group(ids, db: Session):
+    """The RideOut of each committed ride id in order, or the ValidationError
+    of a ride that cannot be shown (e.g. its driver does not exist)."""
+    rides = db.query(models.Ride).options(joinedload(models.Ride.user)).filter(models.Ride.id.in_(ids)).all()
+    by_id = {ride.id: ride for ride in rides}
+    results = []
+    for ride_id in ids:
+        try:
+            results.append(schemas.RideOut.model_validate(by_id[ride_id]))
+        except ValidationError as exc:
+            results.append(exc)
+    return results
+
+
+def write_group(rows, db: Session):
+    """Insert rows (prepared ride dicts) in one transaction.
+
+    Returns the ids of the committed rides and their read_group results, or
+    None for the results if reading them back failed after the commit.
+    Raises only if nothing was committed.
+    """
+    ids = ingest.insert_rows(db, rows, cycles.lock_active_id(db), returning=True)
+    db.commit()
+    try:
+        return ids, read_group(ids, db)
+    except Exception:
+        db.rollback()
+        return ids, None
+
+
+async def _commit(group):
+    """Write a group of (row, future) and resolve the futures."""
+    try:
+        ids, results = await database.run_in_session(write_group, [row for row, _ in group])
+    except Exception as exc:
+        if len(group) > 1:
+            for item in group:
+                await _commit([item])
+            return
+        _counters["failed"] += 1
+        if not group[0][1].done():
+            group[0][1].set_exception(exc)
+        return
+    if results is None:
+        # The rides are stored, so writing the group again would store them
+        # twice; read them back on a session of their own instead
+        try:
+            results = await database.run_in_session(read_group, ids)
+        except Exception as exc:
+            results = [exc] * len(ids)
+    live.notify()
+    _counters["transactions"] += 1
+    _counters["committed"] += len(group)
+    _counters["max_group"] = max(_counters["max_group"], len(group))
+    for (_, future), result in zip(group, results):
+        # A request that went away still got its ride written
+        if future.done():
+            continue
+        if isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+
+async def _write_loop(queue, full):
+    """Commit queued rides group by group until shutdown queues None."""
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        group = [item]
+        if GROUP_COMMIT_WINDOW_MS > 0 and queue.qsize() < GROUP_COMMIT_MAX_ROWS - 1:
+            full.clear()
+            try:
+                await asyncio.wait_for(full.wait(), GROUP_COMMIT_WINDOW_MS / 1000)
+            except asyncio.TimeoutError:
+                pass
+        stop = False
+        while len(group) < GROUP_COMMIT_MAX_ROWS and not queue.empty():
+            item = queue.get_nowait()
+            if item is None:
+                stop = True
+                break
+            group.append(item)
+        await _commit(group)
+        if stop:
+            return
+
+
+def _ensure_writer():
+    global _loop, _queue, _full, _writer
+    loop = asyncio.get_running_loop()
+    if _writer is None or _loop is not loop:
+        _loop = loop
+        _queue = asyncio.Queue(maxsize=GROUP_COMMIT_QUEUE_LIMIT)
+        _full = asyncio.Event()
+        # Start from an empty context, so the writer does not inherit the
+        # per-request state (such as metrics) of the request that started it
+        _writer = contextvars.Context().run(loop.create_task, _write_loop(_queue, _full))
+    return _queue
+
+
+async def submit(row: dict) -> schemas.RideOut:
+    """Queue a prepared ride for the next group and wait until it is committed."""
+    queue = _ensure_writer()
+    future = asyncio.get_running_loop().create_future()
+    try:
+        queue.put_nowait((row, future))
+    except asyncio.QueueFull:
+        _counters["rejected"] += 1
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many rides waiting to be written, try again",
+            headers={"Retry-After": "1"},
+        )
+    _counters["submitted"] += 1
+    if queue.qsize() >= GROUP_COMMIT_MAX_ROWS - 1:
+        _full.set()
+    return await future
+
+
+def stats() -> dict:
+    """Snapshot of the group-commit counters; queued = rides waiting for the writer."""
+    snapshot = dict(_counters)
+    snapshot["enabled"] = GROUP_COMMIT
+    snapshot["queued"] = _queue.qsize() if _queue is not None else 0
+    snapshot["queue_limit"] = GROUP_COMMIT_QUEUE_LIMIT
+    snapshot["window_ms"] = GROUP_COMMIT_WINDOW_MS
+    snapshot["max_rows"] = GROUP_COMMIT_MAX_ROWS
+    return snapshot
+
+
+async def shutdown():
+    """Write what is still queued, then stop the writer."""
+    global _loop, _queue, _full, _writer
+    if _writer is None or _loop is not asyncio.get_running_loop():
+        return
+    await _queue.put(None)
+    await _writer
+    _loop = _queue = _full = _writer = None
@@ -0,0 +1,46 @@
+"""
+Conditional GET for read endpoints.
+
+ETags are derived from the state_versions counters of everything a response
+depends on (plus the request's path and query), so checking If-None-Match
+costs the one counter query per request and a matching client gets 304
+without the endpoint loading anything. Responses are marked no-cache: the
+browser keeps them but revalidates on every use. Stats of a closed cycle may
+be reused for CLOSED_STATS_MAX_AGE seconds without asking; they only change
+by admin edits or a new fuel price.
+"""
+import hashlib
+import os
+from typing import Optional
+
+from fastapi import Request, Response, status
+from sqlalchemy.orm import Session
+
+from . import state
+
+REVALIDATE = "no-cache"
+CLOSED_STATS_MAX_AGE = int(os.getenv("CLOSED_STATS_MAX_AGE", "60"))
+CLOSED_STATS = f"private, max-age={CLOSED_STATS_MAX_AGE}" if CLOSED_STATS_MAX_AGE > 0 else REVALIDATE
+
+
+def etag(db: Session, request: Request, *names: str) -> str:
+    """Strong ETag for request from the current versions of names."""
+    key = "|".join([request.url.path, request.url.query] + [f"{name}={state.version(db, name)}" for name in names])
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:20] + '"'
+
+
+def matches(if_none_match: Optional[str], tag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or tag in candidates or f"W/{tag}" in candidates
+
+
+def not_modified(request: Request, response: Response, tag: str, cache_control: str = REVALIDATE) -> Optional[Response]:
+    """Set ETag and Cache-Control on response; return a 304 response if the client's copy is current."""
+    headers = {"ETag": tag, "Cache-Control": cache_control}
+    if matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
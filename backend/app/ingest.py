@@ -0,0 +1,157 @@
+"""
+Bulk ride ingestion.
+
+Parses a batch of rides (JSON array, NDJSON or CSV), validates every row and
+completes the whole batch with logic.calculate_ride_data_batch, and inserts the valid rows with a
+single executemany in one transaction. Invalid rows are reported by index
+and do not abort the rest of the batch.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from math import nan
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models, schemas, logic, prices, rollups
+
+MAX_BATCH_ROWS = 10000
+CSV_FIELDS = ["user_id", "timestamp", "distance_km", "consumption_l100km", "fuel_liters"]
+
+
+def parse_records(body: bytes, content_type: str):
+    """Split a request body into raw row dicts according to its content type."""
+    media_type = content_type.split(";")[0].strip().lower()
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Body must be UTF-8 encoded")
+
+    if media_type in ("application/x-ndjson", "application/ndjson"):
+        records = []
+        for line in text.splitlines():
+            if line.strip():
+                records.append(_json_row(line))
+        return records
+
+    if media_type in ("text/csv", "application/csv"):
+        reader = csv.DictReader(io.StringIO(text))
+        missing = {"user_id", "timestamp"} - set(reader.fieldnames or [])
+        if missing:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"CSV header must include {', '.join(CSV_FIELDS)}")
+        # Empty cells mean "not provided", like a missing JSON key
+        return [{k: v for k, v in row.items() if k in CSV_FIELDS and v not in ("", None)} for row in reader]
+
+    try:
+        records = json.loads(text)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Body must be a JSON array of rides")
+    if not isinstance(records, list):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Body must be a JSON array of rides")
+    return records
+
+
+def upload_media_type(filename: str, content_type: str) -> str:
+    """Media type of an uploaded file, guessed from its extension when the client sent a generic one."""
+    if content_type and content_type not in ("application/octet-stream", "text/plain"):
+        return content_type
+    name = (filename or "").lower()
+    if name.endswith(".csv"):
+        return "text/csv"
+    if name.endswith((".ndjson", ".jsonl")):
+        return "application/x-ndjson"
+    return "application/json"
+
+
+def _json_row(line: str):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        # Keep the row so that its index is reported instead of failing the batch
+        return ValueError(f"Invalid JSON: {e}")
+
+
+def _error_detail(exc: Exception) -> str:
+    if isinstance(exc, ValidationError):
+        return "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+            for err in exc.errors()
+        )
+    return str(exc)
+
+
+def prepare_rows(records):
+    """Validate and complete rows. Returns (insert params, list of RideBatchError)."""
+    if len(records) > MAX_BATCH_ROWS:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_ROWS} rides per batch")
+
+    valid = []
+    errors = []
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise record
+            valid.append((index, schemas.RideInput.model_validate(record)))
+        except (ValidationError, ValueError) as e:
+            errors.append(schemas.RideBatchError(index=index, detail=_error_detail(e)))
+
+    column = lambda attr: [nan if getattr(r, attr) is None else getattr(r, attr) for _, r in valid]
+    d, c, f, codes = logic.calculate_ride_data_batch(
+        column("distance_km"), column("consumption_l100km"), column("fuel_liters")
+    )
+
+    rows = []
+    for i, (index, ride_in) in enumerate(valid):
+        if codes[i] != logic.RIDE_OK:
+            detail = logic.batch_error_detail(
+                codes[i], ride_in.distance_km, ride_in.consumption_l100km, ride_in.fuel_liters
+            )
+            errors.append(schemas.RideBatchError(index=index, detail=detail))
+            continue
+        rows.append({
+            "user_id": ride_in.user_id,
+            "timestamp": ride_in.timestamp,
+            "distance_km": float(d[i]),
+            "consumption_l100km": float(c[i]),
+            "fuel_liters": float(f[i]),
+        })
+    errors.sort(key=lambda e: e.index)
+    return rows, errors
+
+
+def insert_rows(db: Session, rows, cycle_id: int, returning: bool = False):
+    """Insert prepared rows into cycle_id with one executemany and update rollups. Does not commit.
+
+    Each ride's cost is resolved from the price history. With returning=True,
+    returns the new ride ids in the order of rows.
+    """
+    if not rows:
+        return []
+    history = prices.history(db)
+    for row in rows:
+        row["tank_cycle_id"] = cycle_id
+        row["cost"] = history.cost(row["timestamp"], row["fuel_liters"])
+    ids = None
+    if returning:
+        statement = insert(models.Ride).returning(models.Ride.id, sort_by_parameter_order=True)
+        ids = db.execute(statement, rows).scalars().all()
+    else:
+        db.execute(insert(models.Ride), rows)
+
+    deltas = defaultdict(lambda: [0.0, 0.0, 0, 0.0])
+    daily = defaultdict(lambda: [0.0, 0.0, 0, 0.0])
+    for row in rows:
+        for delta in (deltas[row["user_id"]], daily[row["user_id"], row["timestamp"].date()]):
+            delta[0] += row["distance_km"]
+            delta[1] += row["fuel_liters"]
+            delta[2] += 1
+            delta[3] += row["cost"]
+    for user_id, (dist, fuel, count, cost) in deltas.items():
+        rollups.apply_ride_delta(db, cycle_id, user_id, dist, fuel, count, cost)
+    for (user_id, day), (dist, fuel, count, cost) in daily.items():
+        rollups.apply_daily_delta(db, user_id, day, dist, fuel, count, cost)
+    return ids
@@ -0,0 +1,193 @@
+"""
+Live dashboard updates over Server-Sent Events (GET /api/live).
+
+One hub per worker holds the dashboard state: the active cycle's stats, the
+drivers and the settings. It reloads that state once per change, not once
+per subscriber, and pushes the same encoded message to every open stream.
+A stream starts with the full state and then receives:
+
+    event: stats     full CycleStats (also when a new cycle starts)
+    event: delta     {"cycle_id", "total_distance", "total_fuel", "total_cost",
+                      "user_stats": [changed UserStat], "removed": [user_id]}
+    event: users     full list of active drivers
+    event: settings  full settings
+
+Writers call notify() after committing. The hub also reloads every
+LIVE_POLL_INTERVAL seconds while anyone is subscribed, which picks up writes
+made by other workers. A subscriber that falls LIVE_QUEUE_SIZE messages
+behind is disconnected; EventSource reconnects and starts from the full
+state again.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+
+from . import database
+
+logger = logging.getLogger(__name__)
+
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "2"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "32"))
+# Comment line sent on idle streams so proxies do not time them out
+KEEPALIVE_INTERVAL = 15.0
+
+
+def message(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def stats_delta(old: dict, new: dict) -> Optional[dict]:
+    """Changes from old to new CycleStats (as dicts) of the same cycle, or None if there are none."""
+    old_users = {user["user_id"]: user for user in old["user_stats"]}
+    new_users = {user["user_id"]: user for user in new["user_stats"]}
+    changed = [user for user_id, user in new_users.items() if old_users.get(user_id) != user]
+    removed = [user_id for user_id in old_users if user_id not in new_users]
+    totals = ("total_distance", "total_fuel", "total_cost")
+    if not changed and not removed and all(old[name] == new[name] for name in totals):
+        return None
+    delta = {"cycle_id": new["cycle_id"], **{name: new[name] for name in totals}}
+    delta["user_stats"] = changed
+    delta["removed"] = removed
+    return delta
+
+
+class Hub:
+    """
+    Fans dashboard changes out to subscriber queues. load(db) returns the
+    current {"stats", "users", "settings"} as pydantic models or lists of them.
+    """
+
+    def __init__(self, load: Callable):
+        self.load = load
+        self.subscribers = set()
+        self.state = None
+        self.loop = None
+        self.wake = None
+        self.ready = None
+        self.task = None
+        self.counters = {"reloads": 0, "broadcasts": 0, "dropped": 0}
+
+    def notify(self):
+        """Reload soon; safe to call from any thread, and a no-op without subscribers."""
+        loop, wake = self.loop, self.wake
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    async def subscribe(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if self.task is None or self.loop is not loop:
+            self.loop = loop
+            self.wake = asyncio.Event()
+            self.ready = asyncio.Event()
+            self.state = None
+            self.subscribers = set()
+            # Empty context: the hub must not inherit the first subscriber's request state
+            self.task = contextvars.Context().run(loop.create_task, self.run())
+        await self.ready.wait()
+        if self.state is None:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Live updates are unavailable, try again")
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        for event in ("stats", "users", "settings"):
+            queue.put_nowait(message(event, self.state[event]))
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    async def run(self):
+        try:
+            await self.reload()
+            self.ready.set()
+            while True:
+                try:
+                    await asyncio.wait_for(self.wake.wait(), LIVE_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self.wake.clear()
+                if not self.subscribers:
+                    return
+                await self.reload()
+        except Exception:
+            logger.exception("live hub stopped")
+            for queue in list(self.subscribers):
+                self.disconnect(queue)
+        finally:
+            # The next subscriber starts the hub again
+            self.task = self.loop = self.wake = self.state = None
+            self.ready.set()
+
+    async def reload(self):
+        loaded = await database.run_in_session(self.load)
+        self.counters["reloads"] += 1
+        new = {
+            "stats": loaded["stats"].model_dump(mode="json"),
+            "users": [user.model_dump(mode="json") for user in loaded["users"]],
+            "settings": loaded["settings"].model_dump(mode="json"),
+        }
+        old, self.state = self.state, new
+        if old is None:
+            return
+        if old["stats"]["cycle_id"] != new["stats"]["cycle_id"]:
+            self.broadcast(message("stats", new["stats"]))
+        else:
+            delta = stats_delta(old["stats"], new["stats"])
+            if delta is not None:
+                self.broadcast(message("delta", delta))
+        for event in ("users", "settings"):
+            if old[event] != new[event]:
+                self.broadcast(message(event, new[event]))
+
+    def broadcast(self, data: bytes):
+        self.counters["broadcasts"] += 1
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # Too far behind: the client reconnects and starts from the full state
+                self.counters["dropped"] += 1
+                self.disconnect(queue)
+
+    def disconnect(self, queue: asyncio.Queue):
+        """End a subscriber's stream."""
+        self.subscribers.discard(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    def stats(self) -> dict:
+        snapshot = dict(self.counters)
+        snapshot["subscribers"] = len(self.subscribers)
+        snapshot["poll_interval"] = LIVE_POLL_INTERVAL
+        return snapshot
+
+
+async def stream(hub: Hub, queue: asyncio.Queue):
+    """SSE body for one subscriber; unsubscribes when the client goes away."""
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if data is None:
+                return
+            yield data
+    finally:
+        hub.unsubscribe(queue)
+
+
+hub: Optional[Hub] = None
+
+
+def notify():
+    """Tell the live hub that dashboard data may have changed. Call after commit."""
+    if hub is not None:
+        hub.notify()
@@ -46,4 +46,83 @@ def calculate_ride_data(dist, cons, fuel):
             raise HTTPException(status_code=400, detail="Distance cannot be zero when calculating consumption.")
         final_c = (fuel * 100.0) / dist
 
-    return r(final_d), r(final_c), r(final_f)
\ No newline at end of file
+    return r(final_d), r(final_c), r(final_f)
+
+
+# --- Batch (array) API ---
+# Same rules as calculate_ride_data, applied to whole columns at once.
+# Missing values are NaN; instead of raising, each row gets an error code.
+
+RIDE_OK = 0
+RIDE_TOO_FEW_VALUES = 1
+RIDE_INCONSISTENT = 2
+RIDE_ZERO_DIVISOR = 3
+
+
+def _round2(values):
+    """Round to 2 decimals exactly like Python's round(), which np.round does not do for near-ties."""
+    import numpy as np
+
+    rounded = np.round(values, 2)
+    scaled = values * 100.0
+    near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-7
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), 2)
+    return rounded
+
+
+def calculate_ride_data_batch(dist, cons, fuel):
+    """
+    Vectorized calculate_ride_data.
+    Takes equally long columns of distance/consumption/fuel with NaN for missing values.
+    Returns (dist, cons, fuel, errors): rounded float64 arrays (NaN on error rows) and an
+    int8 array of RIDE_* codes; errors != RIDE_OK is the per-row error mask.
+    """
+    import numpy as np  # imported on first use; numpy is slow to import
+
+    d = np.asarray(dist, dtype=np.float64)
+    c = np.asarray(cons, dtype=np.float64)
+    f = np.asarray(fuel, dtype=np.float64)
+
+    has_d = ~np.isnan(d)
+    has_c = ~np.isnan(c)
+    has_f = ~np.isnan(f)
+    count = has_d.astype(np.int8) + has_c + has_f
+
+    errors = np.full(d.shape, RIDE_OK, dtype=np.int8)
+    errors[count < 2] = RIDE_TOO_FEW_VALUES
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected_f = (d * c) / 100.0
+        errors[(count == 3) & (np.abs(f - expected_f) > 0.1)] = RIDE_INCONSISTENT
+
+        calc_f = (count == 2) & ~has_f
+        calc_d = (count == 2) & ~has_d
+        calc_c = (count == 2) & ~has_c
+        errors[calc_d & (c == 0)] = RIDE_ZERO_DIVISOR
+        errors[calc_c & (d == 0)] = RIDE_ZERO_DIVISOR
+
+        final_f = np.where(calc_f, expected_f, f)
+        final_d = np.where(calc_d, (f * 100.0) / c, d)
+        final_c = np.where(calc_c, (f * 100.0) / d, c)
+
+    failed = errors != RIDE_OK
+    final_d[failed] = np.nan
+    final_c[failed] = np.nan
+    final_f[failed] = np.nan
+    return _round2(final_d), _round2(final_c), _round2(final_f), errors
+
+
+def batch_error_detail(code, dist, cons, fuel) -> str:
+    """The message calculate_ride_data would raise for a row with the given error code."""
+    if code == RIDE_TOO_FEW_VALUES:
+        return "At least two of Distance, Consumption, or Fuel must be provided."
+    if code == RIDE_INCONSISTENT:
+        expected_f = (dist * cons) / 100.0
+        return (f"Inconsistent data. Based on Dist ({dist}) and Cons ({cons}), "
+                f"Fuel should be approx {round(expected_f, 2)}, but got {fuel}.")
+    if code == RIDE_ZERO_DIVISOR:
+        if dist == 0:
+            return "Distance cannot be zero when calculating consumption."
+        return "Consumption cannot be zero when calculating distance."
+    return ""
@@ -1,22 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
-from typing import List, Optional
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.orm import Session, defer, joinedload
+from typing import List, Optional, Union
+from datetime import date
 import os
-from datetime import datetime
+from contextlib import asynccontextmanager
 
-from . import models, schemas, database, logic, auth
+from . import models, schemas, database, logic, auth, stats, analytics, export, httpcache, rollups, pagination, passwords, state, ingest, cycles, cli, compression, fastjson, metrics, groupcommit, live, archive, prices
 
-# Initialize DB
-models.Base.metadata.create_all(bind=database.engine)
+# Create tables, indexes and the default admin when a worker starts. Set to 0
+# when `python -m app.cli init-db` runs once before the workers instead.
+INIT_DB_ON_STARTUP = os.getenv("INIT_DB_ON_STARTUP", "1") == "1"
 
-# Initialize default admin
-with next(database.get_db()) as db:
-    auth.ensure_admin(db)
 
-app = FastAPI(title="PiFuelTracker")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if INIT_DB_ON_STARTUP:
+        await run_in_threadpool(cli.init_db)
+    yield
+    await groupcommit.shutdown()
+    passwords.shutdown()
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
+
+
+app = FastAPI(title="PiFuelTracker", lifespan=lifespan)
 
 # CORS for local development
 app.add_middleware(
@@ -25,7 +36,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, metrics.QUERY_COUNT_HEADER],
 )
+compression.add_compression(app)
+# Outermost, so request timing includes compression
+if metrics.METRICS_ENABLED:
+    metrics.instrument(database.engine)
+    if database.async_engine is not None:
+        metrics.instrument(database.async_engine.sync_engine)
+    app.add_middleware(metrics.MetricsMiddleware)
 
 
 # --- Dependencies ---
@@ -33,6 +52,19 @@ def get_db():
     return database.get_db()
 
 
+def db_route(method: str, path: str, **kwargs):
+    """Register a sync handler that takes db: Session.
+
+    With DATABASE_ASYNC=1 it is served as an async endpoint running on an
+    AsyncSession (see database.async_endpoint); otherwise FastAPI runs it on the threadpool.
+    """
+    def decorator(fn):
+        endpoint = database.async_endpoint(fn, kwargs.get("response_model")) if database.DATABASE_ASYNC else fn
+        app.api_route(path, methods=[method], **kwargs)(endpoint)
+        return fn
+    return decorator
+
+
 # --- Helper ---
 def ensure_settings(db: Session):
     settings = db.query(models.Setting).first()
@@ -44,40 +76,112 @@ def ensure_settings(db: Session):
     return settings
 
 
-def get_active_cycle(db: Session):
-    cycle = db.query(models.TankCycle).filter(models.TankCycle.is_active == True).first()
-    if not cycle:
-        cycle = models.TankCycle()
-        db.add(cycle)
-        db.commit()
-        db.refresh(cycle)
-    return cycle
+def load_ride(db: Session, ride_id: int) -> models.Ride:
+    """(Re)load a ride together with its driver in one statement, for RideOut responses."""
+    return (
+        db.query(models.Ride)
+        .options(joinedload(models.Ride.user))
+        .filter(models.Ride.id == ride_id)
+        .populate_existing()
+        .one()
+    )
+
+
+def lock_ride(db: Session, ride_id: int) -> models.Ride:
+    """Load a ride for changing it, locked until the transaction ends; 404 if it does not exist (any more).
+
+    Bumping its cycle's rides first serializes concurrent edits of the ride
+    (it takes the write lock on SQLite), so a second DELETE or PUT sees the
+    first one's result instead of applying its rollup delta to a stale row.
+    """
+    cycle_id = db.query(models.Ride.tank_cycle_id).filter(models.Ride.id == ride_id).scalar()
+    if cycle_id is not None:
+        state.bump(db, state.cycle_rides(cycle_id))
+        ride = db.query(models.Ride).filter(models.Ride.id == ride_id).with_for_update().first()
+        if ride:
+            return ride
+    raise HTTPException(status.HTTP_404_NOT_FOUND, "Ride not found")
+
+
+def run_and_release(fn, *args):
+    """Run blocking ORM work fn(*args, db), then return the connection to the pool.
+
+    Async handlers call this via database.run_db before awaiting bcrypt, so no
+    connection is held while the password pool is busy. Loaded objects stay readable.
+    """
+    try:
+        return fn(*args)
+    finally:
+        args[-1].close()
+
+
+def get_cached_settings(db: Session) -> schemas.SettingOut:
+    """Read-only copy of the settings row, cached until update_settings changes it."""
+    return state.read_through(
+        db, state.SETTINGS, lambda db: schemas.SettingOut.model_validate(ensure_settings(db))
+    )
+
+
+def get_cached_active_cycle(db: Session) -> schemas.TankCycleOut:
+    """Read-only copy of the active cycle, cached until close_cycle replaces it."""
+    return state.read_through(
+        db, state.ACTIVE_CYCLE, lambda db: schemas.TankCycleOut.model_validate(cycles.get_active(db))
+    )
 
 
 # --- Routes ---
 
-@app.get("/api/settings", response_model=schemas.SettingOut)
-def read_settings(db: Session = Depends(database.get_db)):
-    return ensure_settings(db)
+@db_route("GET", "/api/settings", response_model=schemas.SettingOut)
+def read_settings(request: Request, response: Response, db: Session = Depends(database.get_db)):
+    cached = httpcache.not_modified(request, response, httpcache.etag(db, request, state.SETTINGS))
+    if cached:
+        return cached
+    return get_cached_settings(db)
 
 
-@app.put("/api/settings", response_model=schemas.SettingOut)
+@db_route("PUT", "/api/settings", response_model=schemas.SettingOut)
 def update_settings(settings: schemas.SettingBase, db: Session = Depends(database.get_db)):
     db_settings = ensure_settings(db)
     db_settings.currency = settings.currency
+    if settings.fuel_price != db_settings.fuel_price:
+        # Rides from now on are charged the new price; logged rides keep their cost
+        prices.append(db, settings.fuel_price)
     db_settings.fuel_price = settings.fuel_price
+    state.bump(db, state.SETTINGS)
     db.commit()
+    live.notify()
     db.refresh(db_settings)
     return db_settings
 
 
-@app.get("/api/users", response_model=List[schemas.UserOut])
-def read_users(db: Session = Depends(database.get_db)):
+@db_route("GET", "/api/settings/prices", response_model=List[schemas.FuelPriceOut])
+def read_price_history(request: Request, response: Response, db: Session = Depends(database.get_db)):
+    """The fuel price history, newest first."""
+    cached = httpcache.not_modified(request, response, httpcache.etag(db, request, state.PRICES))
+    if cached:
+        return cached
+    return [
+        schemas.FuelPriceOut(valid_from=valid_from, price=price)
+        for valid_from, price in reversed(prices.history(db).entries)
+    ]
+
+
+@db_route("GET", "/api/users", response_model=List[schemas.UserOut])
+def read_users(request: Request, response: Response, db: Session = Depends(database.get_db)):
+    cached = httpcache.not_modified(request, response, httpcache.etag(db, request, state.USERS))
+    if cached:
+        return cached
     return db.query(models.User).filter(models.User.is_active == True).all()
 
 
 @app.post("/api/users", response_model=schemas.UserOut)
-def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)):
+async def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_session)):
+    # Hash password before storing, without holding a DB connection
+    password_hash = await auth.hash_password_async(user.password)
+    return await database.run_db(db, save_new_user, user, password_hash)
+
+
+def save_new_user(user: schemas.UserCreate, password_hash: str, db: Session):
     # Check if active user already exists with this name
     existing_active_user = db.query(models.User).filter(
         models.User.name == user.name,
@@ -86,24 +190,26 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(database.get_db)
     if existing_active_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User with this name already exists")
     
-    # Hash password before storing
-    password_hash = auth.hash_password(user.password)
     db_user = models.User(name=user.name, color=user.color, password_hash=password_hash)
     db.add(db_user)
+    state.bump(db, state.USERS)
     db.commit()
+    live.notify()
     db.refresh(db_user)
     return db_user
 
 
 @app.post("/api/users/login", response_model=schemas.UserToken)
-def user_login(login_data: schemas.UserLogin, db: Session = Depends(database.get_db)):
+async def user_login(login_data: schemas.UserLogin, db: Session = Depends(database.get_session)):
     """Authenticate user and return JWT token."""
-    user = db.query(models.User).filter(models.User.id == login_data.user_id).first()
+    user = await database.run_db(
+        db, run_and_release, lambda db: db.query(models.User).filter(models.User.id == login_data.user_id).first()
+    )
     
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
-    if not auth.verify_password(login_data.password, user.password_hash):
+    if not await auth.verify_password_async(login_data.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
     access_token = auth.create_access_token(data={"user_id": user.id})
@@ -117,11 +223,11 @@ def user_login(login_data: schemas.UserLogin, db: Session = Depends(database.get
 
 
 @app.post("/api/admin/login", response_model=schemas.UserToken)
-def admin_login(login_data: schemas.AdminLogin, db: Session = Depends(database.get_db)):
+async def admin_login(login_data: schemas.AdminLogin, db: Session = Depends(database.get_session)):
     """Authenticate admin and return JWT token."""
-    admin = auth.ensure_admin(db)
+    admin = await database.run_db(db, run_and_release, auth.ensure_admin)
     
-    if not auth.verify_password(login_data.password, admin.password_hash):
+    if not await auth.verify_password_async(login_data.password, admin.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
     
     access_token = auth.create_access_token(data={"sub": "admin"})
@@ -132,184 +238,363 @@ def admin_login(login_data: schemas.AdminLogin, db: Session = Depends(database.g
         "user_name": "Admin",
         "is_admin": True
     }
+
+
 def create_ride(ride_in: schemas.RideInput, db: Session = Depends(database.get_db)):
     # 1. Calc/Validate Math
     d, c, f = logic.calculate_ride_data(ride_in.distance_km, ride_in.consumption_l100km, ride_in.fuel_liters)
 
-    # 2. Get Active Cycle
-    cycle = get_active_cycle(db)
+    # 2. Lock the active cycle, so a concurrent close waits for this ride
+    cycle_id = cycles.lock_active_id(db)
 
-    # 3. Save
+    # 3. Save, with the cost at the price valid when the ride happened
     db_ride = models.Ride(
         user_id=ride_in.user_id,
-        tank_cycle_id=cycle.id,
+        tank_cycle_id=cycle_id,
         timestamp=ride_in.timestamp,
         distance_km=d,
         consumption_l100km=c,
-        fuel_liters=f
+        fuel_liters=f,
+        cost=prices.history(db).cost(ride_in.timestamp, f)
     )
     db.add(db_ride)
+    rollups.add_ride(db, db_ride)
+    db.flush()
+    ride_id = db_ride.id
     db.commit()
-    db.refresh(db_ride)
-    return db_ride
-
-
-@app.post("/api/admin/login", response_model=schemas.UserToken)
-def admin_login(login_data: schemas.AdminLogin, db: Session = Depends(database.get_db)):
-    """Authenticate admin and return JWT token."""
-    admin = auth.ensure_admin(db)
-    
-    if not auth.verify_password(login_data.password, admin.password_hash):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
-    
-    access_token = auth.create_access_token(data={"sub": "admin"})
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user_id": 0,
-        "user_name": "Admin",
-        "is_admin": True
-    }
+    live.notify()
+    return load_ride(db, ride_id)
 
 
-@app.post("/api/rides", response_model=schemas.RideOut)
-def create_ride(ride_in: schemas.RideInput, db: Session = Depends(database.get_db)):
-    # 1. Calc/Validate Math
+async def create_ride_grouped(ride_in: schemas.RideInput):
+    """Log a ride through the group-commit writer (GROUP_COMMIT=1); answers once its group has committed."""
     d, c, f = logic.calculate_ride_data(ride_in.distance_km, ride_in.consumption_l100km, ride_in.fuel_liters)
+    return await groupcommit.submit({
+        "user_id": ride_in.user_id,
+        "timestamp": ride_in.timestamp,
+        "distance_km": d,
+        "consumption_l100km": c,
+        "fuel_liters": f,
+    })
+
+
+if groupcommit.GROUP_COMMIT:
+    app.post("/api/rides", response_model=schemas.RideOut)(create_ride_grouped)
+else:
+    db_route("POST", "/api/rides", response_model=schemas.RideOut)(create_ride)
+
+
+@app.post("/api/rides/batch", response_model=schemas.RideBatchResult)
+async def create_rides_batch(request: Request, db: Session = Depends(database.get_session)):
+    """Log many rides at once from a JSON array, NDJSON or CSV body (or a multipart 'file' upload).
+
+    Invalid rows are reported by index; all valid rows are inserted in one transaction.
+    """
+    content_type = request.headers.get("content-type", "application/json")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Multipart upload must contain a 'file' field")
+        body = await upload.read()
+        content_type = ingest.upload_media_type(upload.filename, upload.content_type)
+    else:
+        body = await request.body()
+    return await database.run_db(db, save_ride_batch, body, content_type)
 
-    # 2. Get Active Cycle
-    cycle = get_active_cycle(db)
 
-    # 3. Save
-    db_ride = models.Ride(
-        user_id=ride_in.user_id,
-        tank_cycle_id=cycle.id,
-        timestamp=ride_in.timestamp,
-        distance_km=d,
-        consumption_l100km=c,
-        fuel_liters=f
-    )
-    db.add(db_ride)
+def save_ride_batch(body: bytes, content_type: str, db: Session):
+    records = ingest.parse_records(body, content_type)
+    rows, errors = ingest.prepare_rows(records)
+    if rows:
+        ingest.insert_rows(db, rows, cycles.lock_active_id(db))
     db.commit()
-    db.refresh(db_ride)
-    return db_ride
-
+    live.notify()
+    return schemas.RideBatchResult(inserted=len(rows), errors=errors)
+
+
+@db_route("GET", "/api/cycles", response_model=List[schemas.TankCycleOut])
+def get_cycles(
+    request: Request,
+    response: Response,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: Session = Depends(database.get_db)
+):
+    """List cycles newest first; pass limit/after to page through them."""
+    if format == "json":
+        cached = httpcache.not_modified(
+            request, response, httpcache.etag(db, request, state.ACTIVE_CYCLE, state.CYCLES)
+        )
+        if cached:
+            return cached
+
+    query = pagination.keyset_page(
+        db.query(models.TankCycle), models.TankCycle.start_date, models.TankCycle.id, after, limit
+    )
+    if format == "ndjson":
+        return pagination.stream_ndjson(query, schemas.TankCycleOut, database.SessionLocal())
 
-@app.get("/api/cycles", response_model=List[schemas.TankCycleOut])
-def get_cycles(db: Session = Depends(database.get_db)):
-    return db.query(models.TankCycle).order_by(desc(models.TankCycle.start_date)).all()
+    cycles = query.all()
+    pagination.set_next_cursor(response, cycles, limit, "start_date")
+    return cycles
 
 
-@app.post("/api/cycles/close", response_model=schemas.TankCycleOut)
+@db_route("POST", "/api/cycles/close", response_model=schemas.TankCycleOut)
 def close_cycle(db: Session = Depends(database.get_db)):
-    cycle = get_active_cycle(db)
-    cycle.is_active = False
-    cycle.end_date = datetime.now()
-
-    new_cycle = models.TankCycle()  # Auto creates active=True
-    db.add(new_cycle)
-
+    cycle = cycles.close_and_open(db)
     db.commit()
+    live.notify()
     db.refresh(cycle)
     return cycle
 
 
-@app.get("/api/stats", response_model=schemas.CycleStats)
-def get_stats(cycle_id: Optional[int] = None, db: Session = Depends(database.get_db)):
-    settings = ensure_settings(db)
+@db_route("GET", "/api/stats", response_model=schemas.CycleStats)
+def get_stats(
+    request: Request,
+    response: Response,
+    cycle_id: Optional[int] = None,
+    db: Session = Depends(database.get_db)
+):
+    if cycle_id and cycle_id != get_cached_active_cycle(db).id:
+        # A closed cycle gets no new rides; only admin edits, driver changes and repricing alter its stats
+        tag = httpcache.etag(db, request, state.PRICES, state.USERS, state.cycle_rides(cycle_id))
+        cached = httpcache.not_modified(request, response, tag, httpcache.CLOSED_STATS)
+        if cached:
+            return cached
 
     if cycle_id:
         cycle = db.query(models.TankCycle).filter(models.TankCycle.id == cycle_id).first()
         if not cycle: raise HTTPException(404, "Cycle not found")
     else:
-        cycle = get_active_cycle(db)
-
-    rides = db.query(models.Ride).filter(models.Ride.tank_cycle_id == cycle.id).all()
-
-    # Aggregation
-    total_dist = sum(r.distance_km for r in rides)
-    total_fuel = sum(r.fuel_liters for r in rides)
-    total_cost = total_fuel * settings.fuel_price
-
-    user_map = {}
-    users = db.query(models.User).all()
-
-    for u in users:
-        user_map[u.id] = {
-            "user_id": u.id, "user_name": u.name, "user_color": u.color,
-            "total_distance": 0.0, "total_fuel": 0.0, "total_cost": 0.0
-        }
-
-    for r in rides:
-        if r.user_id in user_map:
-            user_map[r.user_id]["total_distance"] += r.distance_km
-            user_map[r.user_id]["total_fuel"] += r.fuel_liters
-
-    # Finalize per user
-    user_stats_list = []
-    for uid, data in user_map.items():
-        if data["total_distance"] > 0 or data["total_fuel"] > 0:
-            data["total_cost"] = data["total_fuel"] * settings.fuel_price
-            data["avg_consumption"] = (data["total_fuel"] * 100 / data["total_distance"]) if data[
-                                                                                                 "total_distance"] > 0 else 0
-            # Rounding
-            data["total_distance"] = round(data["total_distance"], 2)
-            data["total_fuel"] = round(data["total_fuel"], 2)
-            data["total_cost"] = round(data["total_cost"], 2)
-            data["avg_consumption"] = round(data["avg_consumption"], 2)
-            user_stats_list.append(schemas.UserStat(**data))
-
-    return schemas.CycleStats(
-        cycle_id=cycle.id,
-        is_active=cycle.is_active,
-        total_distance=round(total_dist, 2),
-        total_fuel=round(total_fuel, 2),
-        total_cost=round(total_cost, 2),
-        user_stats=user_stats_list
+        cycle = get_cached_active_cycle(db)
+
+    return stats.compute_cycle_stats(db, cycle)
+
+
+def live_state(db: Session) -> dict:
+    """Everything the dashboard shows, for the live hub to diff and push."""
+    settings = get_cached_settings(db)
+    users = state.read_through(db, state.USERS, lambda db: [
+        schemas.UserOut.model_validate(user)
+        for user in db.query(models.User).filter(models.User.is_active == True).all()
+    ])
+    return {
+        "settings": settings,
+        "users": users,
+        "stats": stats.compute_cycle_stats(db, get_cached_active_cycle(db)),
+    }
+
+
+live.hub = live.Hub(live_state)
+
+
+@app.get("/api/live")
+async def live_updates():
+    """Server-Sent Events stream of the active cycle's stats, drivers and settings (see live.py)."""
+    queue = await live.hub.subscribe()
+    return StreamingResponse(
+        live.stream(live.hub, queue),
+        media_type="text/event-stream",
+        # No caching or proxy buffering, so events arrive as they are sent
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@db_route("GET", "/api/analytics/consumption", response_model=List[schemas.ConsumptionBucket])
+def get_consumption(
+    start: date,
+    end: date,
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    user_id: Optional[int] = None,
+    db: Session = Depends(database.get_db)
+):
+    """Distance, fuel, cost and L/100km per driver and day, week or month from start to end (inclusive), across cycles."""
+    if end < start:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "end must not be before start")
+    return analytics.consumption_buckets(db, start, end, bucket, user_id)
+
+
+@app.get("/api/export/rides")
+def export_rides(
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    cycle_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    current_admin: models.Admin = Depends(auth.get_current_admin)
+):
+    """Download rides (optionally of one cycle, driver or day range) as a streamed CSV or Parquet file."""
+    if start and end and end < start:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "end must not be before start")
+    session = database.SessionLocal()
+    query = export.rides_query(session, cycle_id, user_id, start, end)
+    return export.stream(
+        query, export.RIDE_COLUMNS, format, session, "rides",
+        before=lambda session: archive.export_rows(session, cycle_id, user_id, start, end),
     )
 
 
+@app.get("/api/export/cycles")
+def export_cycles(
+    format: str = Query("csv", pattern="^(csv|parquet)$"),
+    current_admin: models.Admin = Depends(auth.get_current_admin)
+):
+    """Download the tank cycle history with per-cycle totals as a streamed CSV or Parquet file."""
+    session = database.SessionLocal()
+    return export.stream(export.cycles_query(session), export.CYCLE_COLUMNS, format, session, "cycles")
+
+
 # --- Admin Routes ---
 
 @app.post("/api/admin/password")
-def change_admin_password(
+async def change_admin_password(
     password_data: schemas.AdminPasswordChange,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_session),
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
     """Change admin password."""
-    if not auth.verify_password(password_data.old_password, current_admin.password_hash):
+    # current_admin may come from the auth cache, which another worker's
+    # password change does not reach: check against the stored hash, and
+    # release the connection while bcrypt runs
+    def stored_hash(db: Session):
+        password_hash = db.query(models.Admin.password_hash).filter(models.Admin.id == current_admin.id).scalar()
+        db.close()
+        return password_hash
+
+    old_hash = await database.run_db(db, stored_hash)
+    if old_hash is None or not await auth.verify_password_async(password_data.old_password, old_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect old password")
     
-    current_admin.password_hash = auth.hash_password(password_data.new_password)
-    db.commit()
+    password_hash = await auth.hash_password_async(password_data.new_password)
+
+    def save(db: Session):
+        # Only if no other request changed it meanwhile
+        changed = db.query(models.Admin).filter(
+            models.Admin.id == current_admin.id, models.Admin.password_hash == old_hash
+        ).update({models.Admin.password_hash: password_hash})
+        if changed:
+            # Other workers drop their cached admin rows
+            state.bump(db, state.ADMIN)
+        db.commit()
+        return changed
+
+    changed = await database.run_db(db, save)
+    auth.invalidate_admin(current_admin.id)
+    if not changed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Password was changed meanwhile, try again")
     return {"message": "Password changed successfully"}
 
 
-@app.get("/api/admin/users/{user_id}/rides", response_model=List[schemas.RideOut])
+@app.get("/api/admin/metrics/auth-cache")
+def auth_cache_metrics(current_admin: models.Admin = Depends(auth.get_current_admin)):
+    """Hit/miss/invalidation counters of the authenticated principal cache."""
+    return auth.principal_cache.stats()
+
+
+@app.get("/api/admin/metrics/state-cache")
+def state_cache_metrics(current_admin: models.Admin = Depends(auth.get_current_admin)):
+    """Hit/miss counters of the settings/active-cycle cache."""
+    return state.stats()
+
+
+@app.get("/api/admin/metrics/passwords")
+def password_pool_metrics(current_admin: models.Admin = Depends(auth.get_current_admin)):
+    """Queue depth and throughput counters of the password hashing pool."""
+    return passwords.pool_stats()
+
+
+@app.get("/api/admin/metrics/group-commit")
+def group_commit_metrics(current_admin: models.Admin = Depends(auth.get_current_admin)):
+    """Queue depth and group sizes of the ride group-commit writer."""
+    return groupcommit.stats()
+
+
+@app.get("/api/admin/metrics/live")
+def live_metrics(current_admin: models.Admin = Depends(auth.get_current_admin)):
+    """Subscriber count and reload/broadcast counters of the live updates hub."""
+    return live.hub.stats()
+
+
+if metrics.METRICS_ENABLED:
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def prometheus_metrics():
+        """Per-route latency and SQL statement metrics of this worker, for Prometheus to scrape."""
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@db_route("GET", "/api/admin/users/{user_id}/rides",
+          response_model=Union[List[schemas.RideOut], schemas.RideListSlim])
 def get_user_rides_admin(
     user_id: int,
+    response: Response,
     cycle_id: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=pagination.MAX_PAGE_SIZE),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    shape: str = Query("full", pattern="^(full|slim)$"),
     db: Session = Depends(database.get_db),
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
-    """Get all rides for a specific user in a cycle (defaults to active cycle)."""
+    """Get rides for a specific user in a cycle (defaults to active cycle), newest first.
+
+    Pass limit (and the X-Next-Cursor value as after) to page, or format=ndjson to stream.
+    shape=slim returns {"rides": [...], "users": {id: user}} with each driver sent once
+    instead of embedded in every ride.
+    """
+    if shape == "slim" and format != "json":
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "shape=slim is only available with format=json")
     if cycle_id:
         cycle = db.query(models.TankCycle).filter(models.TankCycle.id == cycle_id).first()
         if not cycle:
             raise HTTPException(status.HTTP_404_NOT_FOUND, "Cycle not found")
     else:
-        cycle = get_active_cycle(db)
-    
-    rides = db.query(models.Ride).filter(
-        models.Ride.user_id == user_id,
-        models.Ride.tank_cycle_id == cycle.id
-    ).order_by(desc(models.Ride.timestamp)).all()
+        cycle = get_cached_active_cycle(db)
     
+    archived = archive.get_archive(db, cycle.id) if not cycle.is_active else None
+    if archived is not None:
+        rides = archive.rides_page(db, archived, user_id, after, limit, with_user=shape == "full")
+        if format == "ndjson":
+            return StreamingResponse(
+                (schemas.RideOut.model_validate(ride).model_dump_json() + "\n" for ride in rides),
+                media_type="application/x-ndjson",
+            )
+        return rides_response(db, response, rides, limit, shape)
+
+    criteria = (models.Ride.user_id == user_id, models.Ride.tank_cycle_id == cycle.id)
+    if fastjson.FAST_JSON and format == "json" and shape == "full":
+        rows = pagination.keyset_page(
+            fastjson.rides_query(db, *criteria), models.Ride.timestamp, models.Ride.id, after, limit
+        ).all()
+        fast = fastjson.ORJSONResponse(fastjson.ride_dicts(rows))
+        pagination.set_next_cursor(fast, rows, limit, "timestamp")
+        return fast
+
+    query = pagination.keyset_page(
+        db.query(models.Ride).filter(*criteria),
+        models.Ride.timestamp, models.Ride.id, after, limit
+    )
+    if shape == "full":
+        # Many-to-one, so the driver comes from the same SELECT, also in yield_per batches
+        query = query.options(joinedload(models.Ride.user))
+    if format == "ndjson":
+        return pagination.stream_ndjson(query, schemas.RideOut, database.SessionLocal())
+
+    return rides_response(db, response, query.all(), limit, shape)
+
+
+def rides_response(db: Session, response: Response, rides, limit, shape: str):
+    """A page of admin ride list results in the requested shape."""
+    pagination.set_next_cursor(response, rides, limit, "timestamp")
+    if shape == "slim":
+        user_ids = {ride.user_id for ride in rides}
+        users = db.query(models.User).filter(models.User.id.in_(user_ids)).all() if user_ids else []
+        return {"rides": rides, "users": {user.id: user for user in users}}
     return rides
 
 
-@app.put("/api/admin/rides/{ride_id}", response_model=schemas.RideOut)
+@db_route("PUT", "/api/admin/rides/{ride_id}", response_model=schemas.RideOut)
 def update_ride_admin(
     ride_id: int,
     ride_update: schemas.RideUpdate,
@@ -317,9 +602,7 @@ def update_ride_admin(
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
     """Update a specific ride."""
-    ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
-    if not ride:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Ride not found")
+    ride = lock_ride(db, ride_id)
     
     # Calculate missing values using logic
     distance = ride_update.distance_km if ride_update.distance_km is not None else ride.distance_km
@@ -328,39 +611,45 @@ def update_ride_admin(
     
     # Recalculate with new values
     d, c, f = logic.calculate_ride_data(distance, consumption, fuel)
+    cost = prices.history(db).cost(ride.timestamp, f)
     
+    rollups.change_ride(db, ride, d, f, cost)
     ride.distance_km = d
     ride.consumption_l100km = c
     ride.fuel_liters = f
+    ride.cost = cost
     
     db.commit()
-    db.refresh(ride)
-    return ride
+    live.notify()
+    return load_ride(db, ride_id)
 
 
-@app.delete("/api/admin/rides/{ride_id}")
+@db_route("DELETE", "/api/admin/rides/{ride_id}")
 def delete_ride_admin(
     ride_id: int,
     db: Session = Depends(database.get_db),
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
     """Delete a specific ride."""
-    ride = db.query(models.Ride).filter(models.Ride.id == ride_id).first()
-    if not ride:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Ride not found")
+    ride = lock_ride(db, ride_id)
     
+    rollups.remove_ride(db, ride)
     db.delete(ride)
     db.commit()
+    live.notify()
     return {"message": "Ride deleted successfully"}
 
 
-@app.delete("/api/admin/cycles/{cycle_id}")
+@db_route("DELETE", "/api/admin/cycles/{cycle_id}")
 def delete_cycle_admin(
     cycle_id: int,
     db: Session = Depends(database.get_db),
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
     """Delete an entire tank cycle and all associated rides."""
+    # Bump before touching the rides, in the order lock_ride and archive_cycle take these locks
+    state.bump(db, state.cycle_rides(cycle_id))
+    state.bump(db, state.CYCLES)
     cycle = db.query(models.TankCycle).filter(models.TankCycle.id == cycle_id).first()
     if not cycle:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Cycle not found")
@@ -368,23 +657,69 @@ def delete_cycle_admin(
     if cycle.is_active:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cannot delete active cycle")
     
-    # Delete all rides in this cycle
+    # Delete all rides in this cycle (rollups first, they subtract the rides' daily totals)
+    rollups.delete_cycle(db, cycle_id)
     db.query(models.Ride).filter(models.Ride.tank_cycle_id == cycle_id).delete()
+    archive.delete_archive(db, cycle_id)
     
     # Delete the cycle
     db.delete(cycle)
     db.commit()
+    live.notify()
     return {"message": "Cycle deleted successfully"}
 
 
+@db_route("GET", "/api/admin/archives", response_model=List[schemas.CycleArchiveOut])
+def list_archives_admin(
+    db: Session = Depends(database.get_db),
+    current_admin: models.Admin = Depends(auth.get_current_admin)
+):
+    """Archived cycles, oldest first (without their rides)."""
+    return db.query(models.CycleArchive).options(
+        defer(models.CycleArchive.rides), defer(models.CycleArchive.summary)
+    ).order_by(models.CycleArchive.tank_cycle_id).all()
+
+
+@db_route("POST", "/api/admin/cycles/{cycle_id}/archive", response_model=schemas.CycleArchiveOut)
+def archive_cycle_admin(
+    cycle_id: int,
+    db: Session = Depends(database.get_db),
+    current_admin: models.Admin = Depends(auth.get_current_admin)
+):
+    """Move a closed cycle's rides to the archive; its stats stay available."""
+    archived = schemas.CycleArchiveOut.model_validate(archive.archive_cycle(db, cycle_id))
+    db.commit()
+    return archived
+
+
+@db_route("POST", "/api/admin/cycles/{cycle_id}/restore")
+def restore_cycle_admin(
+    cycle_id: int,
+    db: Session = Depends(database.get_db),
+    current_admin: models.Admin = Depends(auth.get_current_admin)
+):
+    """Move an archived cycle's rides back into the rides table."""
+    ride_count = archive.restore_cycle(db, cycle_id)
+    db.commit()
+    return {"message": "Cycle restored successfully", "ride_count": ride_count}
+
+
 @app.put("/api/admin/users/{user_id}", response_model=schemas.UserOut)
-def update_user_admin(
+async def update_user_admin(
     user_id: int,
     user_update: schemas.UserUpdate,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_session),
     current_admin: models.Admin = Depends(auth.get_current_admin)
 ):
     """Update a driver's information."""
+    # Hash a new password up front, without holding a DB connection
+    password_hash = None
+    if user_update.password is not None:
+        password_hash = await auth.hash_password_async(user_update.password)
+    return await database.run_db(db, save_user_update, user_id, user_update, password_hash)
+
+
+def save_user_update(user_id: int, user_update: schemas.UserUpdate, password_hash: Optional[str], db: Session):
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
@@ -404,15 +739,18 @@ def update_user_admin(
     if user_update.color is not None:
         user.color = user_update.color
     
-    if user_update.password is not None:
-        user.password_hash = auth.hash_password(user_update.password)
+    if password_hash is not None:
+        user.password_hash = password_hash
     
+    state.bump(db, state.USERS)
     db.commit()
+    live.notify()
+    auth.invalidate_user(user_id)
     db.refresh(user)
     return user
 
 
-@app.delete("/api/admin/users/{user_id}")
+@db_route("DELETE", "/api/admin/users/{user_id}")
 def delete_user_admin(
     user_id: int,
     db: Session = Depends(database.get_db),
@@ -425,7 +763,10 @@ def delete_user_admin(
     
     # Soft delete - set is_active to False
     user.is_active = False
+    state.bump(db, state.USERS)
     db.commit()
+    live.notify()
+    auth.invalidate_user(user_id)
     return {"message": "User deleted successfully"}
 
 
@@ -0,0 +1,209 @@
+"""
+Request timing and SQL statement instrumentation.
+
+MetricsMiddleware times every HTTP request and, through SQLAlchemy cursor
+events on the instrumented engines, counts the statements it runs and the
+time spent in them. Totals are kept per route (the path template, so
+/api/stats?cycle_id=3 and ?cycle_id=4 are one series) in this worker's
+memory and rendered in the Prometheus text format by GET /metrics; with
+several workers, each one reports its own.
+
+Every response carries X-Query-Count (statements run before the headers
+went out), and a request running more than QUERY_BUDGET statements is
+logged with its most repeated statement, which is usually an N+1 lazy load.
+"""
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Statements per request before it is logged as a likely N+1 (0 = never)
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "25"))
+QUERY_COUNT_HEADER = "X-Query-Count"
+PREFIX = "fueltracker"
+
+# Upper bounds of the histogram buckets (the Prometheus client defaults for seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+
+
+class RequestStats:
+    """SQL statements run on behalf of one request."""
+
+    __slots__ = ("statements", "sql_seconds", "texts")
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.texts = Counter()
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current() -> Optional[RequestStats]:
+    """Stats of the request being served, if any."""
+    return _current.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None:
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is not None and conn.info.get("metrics_start"):
+        stats.sql_seconds += time.perf_counter() - conn.info["metrics_start"].pop()
+        stats.statements += 1
+        stats.texts[statement] += 1
+
+
+def instrument(engine):
+    """Count statements run on engine (a sync Engine, or AsyncEngine.sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class RouteMetrics:
+    __slots__ = ("latency", "statements", "sql_seconds", "over_budget", "responses")
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.over_budget = 0
+        self.responses: Dict[int, int] = Counter()
+
+
+# (method, route) -> RouteMetrics; only touched from the event loop
+routes: Dict[Tuple[str, str], RouteMetrics] = {}
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "<unmatched>"
+    return getattr(route, "path", "") or "/"
+
+
+def record(method: str, route: str, status: int, seconds: float, stats: RequestStats):
+    metrics = routes.get((method, route))
+    if metrics is None:
+        metrics = routes[(method, route)] = RouteMetrics()
+    metrics.latency.observe(seconds)
+    metrics.statements.observe(stats.statements)
+    metrics.sql_seconds += stats.sql_seconds
+    metrics.responses[status] += 1
+    if QUERY_BUDGET and stats.statements > QUERY_BUDGET:
+        metrics.over_budget += 1
+        statement, repeats = stats.texts.most_common(1)[0]
+        logger.warning(
+            "%s %s ran %d SQL statements (budget %d); %d x %s",
+            method, route, stats.statements, QUERY_BUDGET, repeats, " ".join(statement.split())[:200],
+        )
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_count(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message)[QUERY_COUNT_HEADER] = str(stats.statements)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_count)
+        finally:
+            _current.reset(token)
+            record(scope["method"], route_label(scope), status, time.perf_counter() - start, stats)
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram(lines, name, histogram: Histogram, labels: dict):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.sum}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+
+
+def render() -> str:
+    """All route metrics in the Prometheus text exposition format (version 0.0.4)."""
+    latency = f"{PREFIX}_http_request_duration_seconds"
+    responses = f"{PREFIX}_http_responses_total"
+    statements = f"{PREFIX}_sql_statements_per_request"
+    sql_seconds = f"{PREFIX}_sql_duration_seconds_total"
+    over_budget = f"{PREFIX}_query_budget_exceeded_total"
+    lines = [
+        f"# HELP {latency} Time from receiving a request to sending the last byte of its response.",
+        f"# TYPE {latency} histogram",
+    ]
+    items = sorted(routes.items())
+    for (method, route), metrics in items:
+        _histogram(lines, latency, metrics.latency, {"method": method, "route": route})
+    lines += [f"# HELP {responses} Responses by status code.", f"# TYPE {responses} counter"]
+    for (method, route), metrics in items:
+        for code, count in sorted(metrics.responses.items()):
+            lines.append(f"{responses}{_labels(method=method, route=route, status=code)} {count}")
+    lines += [f"# HELP {statements} SQL statements run while serving a request.", f"# TYPE {statements} histogram"]
+    for (method, route), metrics in items:
+        _histogram(lines, statements, metrics.statements, {"method": method, "route": route})
+    lines += [f"# HELP {sql_seconds} Time spent executing SQL statements.", f"# TYPE {sql_seconds} counter"]
+    for (method, route), metrics in items:
+        lines.append(f"{sql_seconds}{_labels(method=method, route=route)} {metrics.sql_seconds}")
+    lines += [f"# HELP {over_budget} Requests that ran more than QUERY_BUDGET SQL statements.",
+              f"# TYPE {over_budget} counter"]
+    for (method, route), metrics in items:
+        lines.append(f"{over_budget}{_labels(method=method, route=route)} {metrics.over_budget}")
+    return "\n".join(lines) + "\n"
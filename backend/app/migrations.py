@@ -0,0 +1,96 @@
+"""
+Lightweight schema upgrades for existing databases.
+
+metadata.create_all only creates missing tables; it never adds columns or
+indexes to a table that already exists. upgrade() adds any column and creates
+any index declared on the models that is missing from the database, so older
+fuel.db files pick them up on start, and drops indexes that a newer one replaced. Before the one-active-cycle unique
+index is built, any extra active cycles left by earlier races are closed.
+"""
+from datetime import datetime
+
+from sqlalchemy import inspect, select, update
+from sqlalchemy.exc import DBAPIError
+
+from . import models
+
+# Indexes superseded by another declared index, dropped on upgrade
+OBSOLETE_INDEXES = {"tank_cycles": ["ix_tank_cycles_active"]}
+
+
+def missing_columns(engine):
+    """Columns declared on the models that existing tables do not have yet."""
+    inspector = inspect(engine)
+    missing = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        missing.extend(column for column in table.columns if column.name not in existing)
+    return missing
+
+
+def add_column(engine, column):
+    """ALTER TABLE ADD COLUMN; existing rows of a NOT NULL column get its (scalar) default."""
+    ddl = f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+    if not column.nullable:
+        ddl += f" NOT NULL DEFAULT {column.default.arg!r}"
+    try:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(ddl)
+    except DBAPIError:
+        # Another worker starting at the same time may have added it first
+        if column.name not in {c["name"] for c in inspect(engine).get_columns(column.table.name)}:
+            raise
+
+
+def missing_indexes(engine):
+    """Indexes declared on the models that do not exist in the database yet."""
+    inspector = inspect(engine)
+    missing = []
+    for table in models.Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        missing.extend(ix for ix in table.indexes if ix.name not in existing)
+    return missing
+
+
+def close_extra_active_cycles(engine):
+    """Keep only the newest active cycle active, so the one-active unique index can be built."""
+    with engine.begin() as conn:
+        active = conn.execute(
+            select(models.TankCycle.id).where(models.TankCycle.is_active == True).order_by(models.TankCycle.id.desc())
+        ).scalars().all()
+        if len(active) > 1:
+            conn.execute(
+                update(models.TankCycle).where(models.TankCycle.id.in_(active[1:]))
+                .values(is_active=False, end_date=datetime.now())
+            )
+    return active[1:]
+
+
+def drop_obsolete_indexes(engine):
+    inspector = inspect(engine)
+    for table in models.Base.metadata.sorted_tables:
+        obsolete = OBSOLETE_INDEXES.get(table.name)
+        if not obsolete or not inspector.has_table(table.name):
+            continue
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        with engine.begin() as conn:
+            for name in obsolete:
+                if name in existing:
+                    conn.exec_driver_sql(f"DROP INDEX {name}")
+
+
+def upgrade(engine):
+    """Create missing tables, columns and indexes. Safe to run repeatedly."""
+    models.Base.metadata.create_all(bind=engine)
+    for column in missing_columns(engine):
+        add_column(engine, column)
+    missing = missing_indexes(engine)
+    if any(ix.name == "ux_tank_cycles_one_active" for ix in missing):
+        close_extra_active_cycles(engine)
+    for index in missing:
+        index.create(bind=engine, checkfirst=True)
+    drop_obsolete_indexes(engine)
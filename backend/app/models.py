@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Index, LargeBinary, Text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -8,9 +8,23 @@ class Setting(Base):
     __tablename__ = "settings"
     id = Column(Integer, primary_key=True, index=True)
     currency = Column(String, default="CZK")
+    # The price that applies now; its history is in fuel_prices
     fuel_price = Column(Float, default=35.50)
 
 
+class FuelPrice(Base):
+    """A fuel price, valid from valid_from until the next entry's valid_from (see app/prices.py)."""
+    __tablename__ = "fuel_prices"
+    id = Column(Integer, primary_key=True)
+    valid_from = Column(DateTime, nullable=False, default=datetime.now)
+    price = Column(Float, nullable=False)
+
+    __table_args__ = (
+        # Price lookups by ride timestamp
+        Index("ix_fuel_prices_valid_from", "valid_from"),
+    )
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -29,6 +43,14 @@ class TankCycle(Base):
 
     rides = relationship("Ride", back_populates="cycle")
 
+    __table_args__ = (
+        # get_cycles lists cycles newest first
+        Index("ix_tank_cycles_start_date", "start_date"),
+        # At most one active cycle; also serves the lookup of the active row
+        Index("ux_tank_cycles_one_active", "is_active", unique=True,
+              sqlite_where=is_active == True, postgresql_where=is_active == True),
+    )
+
 
 class Ride(Base):
     __tablename__ = "rides"
@@ -40,13 +62,69 @@ class Ride(Base):
     distance_km = Column(Float)
     consumption_l100km = Column(Float)
     fuel_liters = Column(Float)
+    # fuel_liters times the fuel price at timestamp, stored when the ride is written
+    cost = Column(Float)
 
     # Relationships
     user = relationship("User")
     cycle = relationship("TankCycle", back_populates="rides")
 
+    __table_args__ = (
+        # Serves per-cycle filters/aggregation and per-driver listing ordered by timestamp
+        Index("ix_rides_cycle_user_timestamp", "tank_cycle_id", "user_id", "timestamp"),
+    )
+
 
 class Admin(Base):
     __tablename__ = "admin"
     id = Column(Integer, primary_key=True, index=True)
-    password_hash = Column(String, nullable=False)
\ No newline at end of file
+    password_hash = Column(String, nullable=False)
+
+
+class CycleUserTotals(Base):
+    """Per-cycle, per-driver ride totals maintained on every ride write."""
+    __tablename__ = "cycle_user_totals"
+    tank_cycle_id = Column(Integer, ForeignKey("tank_cycles.id"), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_distance = Column(Float, nullable=False, default=0.0)
+    total_fuel = Column(Float, nullable=False, default=0.0)
+    ride_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)
+
+
+class UserDailyTotals(Base):
+    """Per-driver, per-day ride totals maintained on every ride write; backs the time-series analytics."""
+    __tablename__ = "user_daily_totals"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    total_distance = Column(Float, nullable=False, default=0.0)
+    total_fuel = Column(Float, nullable=False, default=0.0)
+    ride_count = Column(Integer, nullable=False, default=0)
+    total_cost = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        # Date-range queries across all drivers
+        Index("ix_user_daily_totals_day", "day"),
+    )
+
+
+class StateVersion(Base):
+    """Change counters for cached singleton state, shared by all worker processes."""
+    __tablename__ = "state_versions"
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class CycleArchive(Base):
+    """Rides of an archived closed cycle, moved out of rides into one compressed row (see app/archive.py)."""
+    __tablename__ = "cycle_archives"
+    tank_cycle_id = Column(Integer, ForeignKey("tank_cycles.id"), primary_key=True)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+    ride_count = Column(Integer, nullable=False)
+    total_distance = Column(Float, nullable=False)
+    total_fuel = Column(Float, nullable=False)
+    total_cost = Column(Float, nullable=False, default=0.0)
+    # Frozen per-driver and per-driver-day totals (JSON), so rollups can be rebuilt without the rides
+    summary = Column(Text, nullable=False)
+    # The rides as zlib-compressed JSON columns
+    rides = Column(LargeBinary, nullable=False)
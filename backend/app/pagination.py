@@ -0,0 +1,65 @@
+"""
+Keyset (cursor) pagination and NDJSON streaming helpers for list endpoints.
+
+Lists are ordered newest first by (timestamp column, id). A cursor is the
+"<timestamp ISO 8601>,<id>" of the last row of the previous page; the next
+page continues strictly after it, so pages stay stable while rows are added.
+"""
+from datetime import datetime
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, desc, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+
+def parse_cursor(after: str):
+    """Parse an "<timestamp>,<id>" cursor into (datetime, int)."""
+    try:
+        ts, _, row_id = after.rpartition(",")
+        return datetime.fromisoformat(ts), int(row_id)
+    except ValueError:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor, expected '<timestamp>,<id>'")
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    return f"{ts.isoformat()},{row_id}"
+
+
+def keyset_page(query, ts_column, id_column, after=None, limit=None):
+    """Order query newest first and apply the cursor and limit."""
+    query = query.order_by(desc(ts_column), desc(id_column))
+    if after:
+        ts, row_id = parse_cursor(after)
+        query = query.filter(or_(
+            ts_column < ts,
+            and_(ts_column == ts, id_column < row_id)
+        ))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def set_next_cursor(response, rows, limit, ts_attr):
+    """Expose the cursor of the next page when the page came back full."""
+    if limit is not None and len(rows) == limit:
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, ts_attr), last.id)
+
+
+def stream_ndjson(query, schema, session):
+    """
+    Stream rows of query as NDJSON, fetching them in batches from a server-side
+    cursor. The session is owned by the stream and closed when it finishes.
+    """
+    def generate():
+        try:
+            for row in query.with_session(session).yield_per(STREAM_BATCH_SIZE):
+                yield schema.model_validate(row).model_dump_json() + "\n"
+        finally:
+            session.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
@@ -0,0 +1,99 @@
+"""
+Bounded process pool for bcrypt work.
+
+bcrypt is deliberately slow; running it inline pins a request thread (and
+the GIL) for the whole hash. Password endpoints instead await the work on a
+small process pool, so a burst of logins cannot starve other endpoints.
+
+Configuration (environment variables):
+    BCRYPT_ROUNDS           bcrypt cost factor for new hashes (default 12)
+    PASSWORD_WORKERS        worker processes (default min(4, CPU count))
+    PASSWORD_QUEUE_LIMIT    max operations in flight before rejecting with 503 (default 64)
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", "64"))
+
+_pwd_context = None
+_executor = None
+_lock = threading.Lock()
+_counters = {"submitted": 0, "completed": 0, "rejected": 0, "in_flight": 0, "max_in_flight": 0}
+
+
+def pwd_context():
+    """passlib context, created on first use so that importing the app stays fast."""
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
+
+def hash_sync(secret: str) -> str:
+    return pwd_context().hash(secret)
+
+
+def verify_sync(secret: str, hashed: str) -> bool:
+    return pwd_context().verify(secret, hashed)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # spawn: forking a process that already runs server threads is unsafe
+            _executor = ProcessPoolExecutor(
+                max_workers=PASSWORD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+async def run(fn, *args):
+    """Run a password function on the pool, rejecting with 503 when the queue is full."""
+    with _lock:
+        if _counters["in_flight"] >= PASSWORD_QUEUE_LIMIT:
+            _counters["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password operations, try again",
+                headers={"Retry-After": "1"},
+            )
+        _counters["submitted"] += 1
+        _counters["in_flight"] += 1
+        _counters["max_in_flight"] = max(_counters["max_in_flight"], _counters["in_flight"])
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), fn, *args)
+    finally:
+        with _lock:
+            _counters["in_flight"] -= 1
+            _counters["completed"] += 1
+
+
+def pool_stats() -> dict:
+    """Snapshot of pool counters; queued = operations waiting for a free worker."""
+    with _lock:
+        snapshot = dict(_counters)
+    snapshot["workers"] = PASSWORD_WORKERS
+    snapshot["queue_limit"] = PASSWORD_QUEUE_LIMIT
+    snapshot["queued"] = max(0, snapshot["in_flight"] - PASSWORD_WORKERS)
+    snapshot["bcrypt_rounds"] = BCRYPT_ROUNDS
+    return snapshot
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
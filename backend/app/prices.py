@@ -0,0 +1,161 @@
+"""
+Fuel price history and per-ride cost.
+
+fuel_prices keeps every fuel price that was set, each valid from its
+valid_from until the next one. A ride's cost (its fuel times the price valid
+at its timestamp) is resolved when the ride is written and stored on the
+ride, and the rollups sum it like distance and fuel, so stats and analytics
+add up stored costs instead of multiplying by the current price. Changing
+the price in the settings appends to the history: rides already logged keep
+their cost, closed cycles keep theirs. Rides older than the first entry are
+charged its price.
+
+From backend/:
+    python -m app.prices list
+    python -m app.prices add --price 36.9 --from 2024-03-01   # a price that applied in the past; reprices rides
+    python -m app.prices backfill [--all]                      # cost rides that have none (--all: every ride)
+"""
+import argparse
+import sys
+from bisect import bisect_right
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import archive, database, migrations, models, rollups, state
+
+# valid_from of the entry a database's history starts with; it applies to every earlier ride anyway
+EPOCH = datetime(1970, 1, 1)
+
+
+class PriceHistory:
+    """Sorted (valid_from, price) entries with a lookup of the price valid at a time."""
+
+    def __init__(self, entries):
+        self.entries = sorted(entries)
+        self.starts = [valid_from for valid_from, _ in self.entries]
+
+    def at(self, timestamp: Optional[datetime]) -> float:
+        if timestamp is None:
+            return self.entries[0][1]
+        # Timestamps are stored naive
+        index = bisect_right(self.starts, timestamp.replace(tzinfo=None)) - 1
+        return self.entries[max(index, 0)][1]
+
+    def cost(self, timestamp: Optional[datetime], fuel: float) -> float:
+        return fuel * self.at(timestamp)
+
+
+def settings_price(db: Session) -> float:
+    """The price in the settings row, or its column default before the row exists."""
+    price = db.query(models.Setting.fuel_price).order_by(models.Setting.id).limit(1).scalar()
+    return price if price is not None else models.Setting.fuel_price.default.arg
+
+
+def load(db: Session) -> PriceHistory:
+    entries = db.query(models.FuelPrice.valid_from, models.FuelPrice.price).order_by(models.FuelPrice.valid_from).all()
+    if not entries:
+        # Before ensure_populated has run, every ride gets the settings price
+        entries = [(EPOCH, settings_price(db))]
+    return PriceHistory(entries)
+
+
+def history(db: Session) -> PriceHistory:
+    """The price history, cached until it changes."""
+    return state.read_through(db, state.PRICES, load)
+
+
+def append(db: Session, price: float, valid_from: Optional[datetime] = None) -> models.FuelPrice:
+    """Add a price valid from valid_from (default now). Does not commit or reprice stored rides."""
+    entry = models.FuelPrice(valid_from=valid_from or datetime.now(), price=price)
+    db.add(entry)
+    state.bump(db, state.PRICES)
+    return entry
+
+
+def backfill(db: Session, everything: bool = False) -> int:
+    """
+    Store the cost of rides that have none (or of every ride), including
+    archived ones, and rebuild the rollups if any changed. Returns the number
+    of rides costed. Does not commit.
+    """
+    price = (
+        select(models.FuelPrice.price)
+        .where(models.FuelPrice.valid_from <= models.Ride.timestamp)
+        .order_by(models.FuelPrice.valid_from.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    first = select(models.FuelPrice.price).order_by(models.FuelPrice.valid_from).limit(1).scalar_subquery()
+    query = db.query(models.Ride)
+    if not everything:
+        query = query.filter(models.Ride.cost.is_(None))
+    count = query.update(
+        {models.Ride.cost: models.Ride.fuel_liters * func.coalesce(price, first)}, synchronize_session=False
+    )
+
+    prices = load(db)
+    for (cycle_id,) in db.query(models.CycleArchive.tank_cycle_id).order_by(models.CycleArchive.tank_cycle_id).all():
+        count += archive.reprice(db, cycle_id, prices, everything)
+
+    if count:
+        rollups.rebuild(db)
+        rollups.rebuild_daily(db)
+        state.bump(db, state.PRICES)
+    return count
+
+
+def ensure_populated(db: Session):
+    """Start the history from the settings price and cost existing rides, for databases created before it."""
+    if db.query(models.FuelPrice.id).first() is not None:
+        return
+    db.add(models.FuelPrice(valid_from=EPOCH, price=settings_price(db)))
+    db.flush()
+    backfill(db)
+    state.bump(db, state.PRICES)
+    db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.prices", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["list", "add", "backfill"])
+    parser.add_argument("--price", type=float, default=None, help="Price per liter, for add")
+    parser.add_argument("--from", dest="valid_from", type=datetime.fromisoformat, default=None,
+                        help="When the price started to apply (YYYY-MM-DD[THH:MM]), for add")
+    parser.add_argument("--all", action="store_true", help="Recompute the cost of every ride, not only missing ones")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        ensure_populated(db)
+
+        if args.command == "list":
+            for valid_from, price in load(db).entries:
+                since = "since the start" if valid_from == EPOCH else f"from {valid_from:%Y-%m-%d %H:%M}"
+                print(f"{since:>22}: {price}")
+            return 0
+
+        if args.command == "add":
+            if args.price is None or args.price <= 0 or args.valid_from is None:
+                parser.error("add needs --price > 0 and --from")
+            append(db, args.price, args.valid_from)
+            db.flush()
+            # The settings show the price that applies now
+            current = load(db).at(datetime.now())
+            db.query(models.Setting).update({models.Setting.fuel_price: current}, synchronize_session=False)
+            state.bump(db, state.SETTINGS)
+            count = backfill(db, everything=True)
+            db.commit()
+            print(f"Added {args.price} from {args.valid_from:%Y-%m-%d %H:%M}, repriced {count} ride(s)")
+            return 0
+
+        count = backfill(db, everything=args.all)
+        db.commit()
+        print(f"Costed {count} ride(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
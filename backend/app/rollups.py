@@ -0,0 +1,266 @@
+"""
+Maintenance of the rollup tables: cycle_user_totals and user_daily_totals.
+
+Every ride write applies its delta (distance, fuel, ride count and cost)
+here inside the same transaction, so /api/stats can read one row per driver
+and /api/analytics/consumption one row per driver and day instead of
+scanning rides.
+
+Rides of archived cycles are no longer in the rides table; their frozen
+totals in cycle_archives stand in for them (see app/archive.py).
+
+Rebuild or verify the rollups from the rides table (from backend/):
+    python -m app.rollups verify
+    python -m app.rollups rebuild [--cycle-id N]
+"""
+import argparse
+import json
+import sys
+from datetime import date
+
+from sqlalchemy import Date, func
+from sqlalchemy.orm import Session
+
+from . import models, database, migrations
+
+# Float sums accumulated by deltas may differ from a fresh SUM in the last bits
+TOLERANCE = 1e-6
+# (distance, fuel, ride count, cost) of a key without rides
+EMPTY = (0.0, 0.0, 0, 0.0)
+
+
+def apply_ride_delta(db: Session, cycle_id: int, user_id: int, distance: float, fuel: float, count: int,
+                     cost: float):
+    """Add a ride delta to the rollup row of (cycle_id, user_id). Does not commit."""
+    database.upsert(
+        db, models.CycleUserTotals,
+        {"tank_cycle_id": cycle_id, "user_id": user_id,
+         "total_distance": distance, "total_fuel": fuel, "ride_count": count, "total_cost": cost},
+        {"total_distance": distance, "total_fuel": fuel, "ride_count": count, "total_cost": cost},
+    )
+
+
+def apply_daily_delta(db: Session, user_id: int, day, distance: float, fuel: float, count: int, cost: float):
+    """Add a ride delta to the daily rollup row of (user_id, day). Does not commit."""
+    database.upsert(
+        db, models.UserDailyTotals,
+        {"user_id": user_id, "day": day,
+         "total_distance": distance, "total_fuel": fuel, "ride_count": count, "total_cost": cost},
+        {"total_distance": distance, "total_fuel": fuel, "ride_count": count, "total_cost": cost},
+    )
+
+
+def add_ride(db: Session, ride: models.Ride):
+    cost = ride.cost or 0.0
+    apply_ride_delta(db, ride.tank_cycle_id, ride.user_id, ride.distance_km, ride.fuel_liters, 1, cost)
+    apply_daily_delta(db, ride.user_id, ride.timestamp.date(), ride.distance_km, ride.fuel_liters, 1, cost)
+
+
+def remove_ride(db: Session, ride: models.Ride):
+    cost = ride.cost or 0.0
+    apply_ride_delta(db, ride.tank_cycle_id, ride.user_id, -ride.distance_km, -ride.fuel_liters, -1, -cost)
+    apply_daily_delta(db, ride.user_id, ride.timestamp.date(), -ride.distance_km, -ride.fuel_liters, -1, -cost)
+
+
+def change_ride(db: Session, ride: models.Ride, distance: float, fuel: float, cost: float):
+    """Apply an edit of a ride's distance, fuel and cost to its rollups, before the ride is updated. Does not commit."""
+    delta = (distance - ride.distance_km, fuel - ride.fuel_liters, 0, cost - (ride.cost or 0.0))
+    apply_ride_delta(db, ride.tank_cycle_id, ride.user_id, *delta)
+    apply_daily_delta(db, ride.user_id, ride.timestamp.date(), *delta)
+
+
+def delete_cycle(db: Session, cycle_id: int):
+    """Drop all rollup rows of a cycle and take its rides out of the daily totals.
+
+    Call before the rides are deleted. Does not commit.
+    """
+    for (user_id, day), (dist, fuel, count, cost) in _computed_daily_totals(db, cycle_id).items():
+        apply_daily_delta(db, user_id, day, -dist, -fuel, -count, -cost)
+    db.query(models.CycleUserTotals).filter(
+        models.CycleUserTotals.tank_cycle_id == cycle_id
+    ).delete(synchronize_session=False)
+
+
+def _archived_summaries(db: Session, cycle_id=None):
+    """(cycle_id, summary dict) of archived cycles, optionally of one cycle only."""
+    query = db.query(models.CycleArchive.tank_cycle_id, models.CycleArchive.summary)
+    if cycle_id is not None:
+        query = query.filter(models.CycleArchive.tank_cycle_id == cycle_id)
+    return [(cid, json.loads(summary)) for cid, summary in query.all()]
+
+
+def _add(totals, key, dist, fuel, count, cost=0.0):
+    # Summaries archived before rides had a cost carry no cost
+    old = totals.get(key, EMPTY)
+    totals[key] = (old[0] + dist, old[1] + fuel, old[2] + count, old[3] + cost)
+
+
+def _computed_totals(db: Session, cycle_id=None):
+    """Recompute {(cycle_id, user_id): (distance, fuel, count, cost)} from rides and archived cycles."""
+    query = db.query(
+        models.Ride.tank_cycle_id,
+        models.Ride.user_id,
+        func.coalesce(func.sum(models.Ride.distance_km), 0.0),
+        func.coalesce(func.sum(models.Ride.fuel_liters), 0.0),
+        func.count(models.Ride.id),
+        func.coalesce(func.sum(models.Ride.cost), 0.0),
+    )
+    if cycle_id is not None:
+        query = query.filter(models.Ride.tank_cycle_id == cycle_id)
+    query = query.group_by(models.Ride.tank_cycle_id, models.Ride.user_id)
+
+    totals = {(cid, uid): tuple(values) for cid, uid, *values in query.all()}
+    for cid, summary in _archived_summaries(db, cycle_id):
+        for uid, *values in summary["users"]:
+            _add(totals, (cid, uid), *values)
+    return totals
+
+
+def _computed_daily_totals(db: Session, cycle_id=None):
+    """Like _computed_totals, keyed by (user_id, day); cycle_id limits it to the rides of one cycle."""
+    day = func.date(models.Ride.timestamp, type_=Date)
+    query = db.query(
+        models.Ride.user_id,
+        day,
+        func.coalesce(func.sum(models.Ride.distance_km), 0.0),
+        func.coalesce(func.sum(models.Ride.fuel_liters), 0.0),
+        func.count(models.Ride.id),
+        func.coalesce(func.sum(models.Ride.cost), 0.0),
+    ).filter(models.Ride.timestamp.isnot(None))
+    if cycle_id is not None:
+        query = query.filter(models.Ride.tank_cycle_id == cycle_id)
+    query = query.group_by(models.Ride.user_id, day)
+
+    totals = {(uid, d): tuple(values) for uid, d, *values in query.all()}
+    for _, summary in _archived_summaries(db, cycle_id):
+        for uid, d, *values in summary["days"]:
+            _add(totals, (uid, date.fromisoformat(d)), *values)
+    return totals
+
+
+def _stored_totals(db: Session, cycle_id=None):
+    query = db.query(models.CycleUserTotals)
+    if cycle_id is not None:
+        query = query.filter(models.CycleUserTotals.tank_cycle_id == cycle_id)
+    return {
+        (row.tank_cycle_id, row.user_id): (row.total_distance, row.total_fuel, row.ride_count, row.total_cost)
+        for row in query.all()
+    }
+
+
+def _stored_daily_totals(db: Session):
+    return {
+        (row.user_id, row.day): (row.total_distance, row.total_fuel, row.ride_count, row.total_cost)
+        for row in db.query(models.UserDailyTotals).all()
+    }
+
+
+def verify(db: Session, cycle_id=None):
+    """
+    Compare stored rollups with totals recomputed from rides (and archived cycles).
+    Returns a list of (cycle_id, user_id, stored, expected) for every drifted key.
+    """
+    return _drift(_stored_totals(db, cycle_id), _computed_totals(db, cycle_id))
+
+
+def verify_daily(db: Session):
+    """Like verify, for the daily rollups. Returns a list of (user_id, day, stored, expected)."""
+    return _drift(_stored_daily_totals(db), _computed_daily_totals(db))
+
+
+def _drift(stored, expected):
+    drift = []
+    for key in sorted(set(expected) | set(stored)):
+        exp = expected.get(key, EMPTY)
+        got = stored.get(key, EMPTY)
+        if (exp[2] != got[2]
+                or abs(exp[0] - got[0]) > TOLERANCE
+                or abs(exp[1] - got[1]) > TOLERANCE
+                or abs(exp[3] - got[3]) > TOLERANCE):
+            drift.append((key[0], key[1], got, exp))
+    return drift
+
+
+def rebuild(db: Session, cycle_id=None):
+    """Recompute rollups from rides and archived cycles, replacing stored rows. Does not commit."""
+    query = db.query(models.CycleUserTotals)
+    if cycle_id is not None:
+        query = query.filter(models.CycleUserTotals.tank_cycle_id == cycle_id)
+    query.delete(synchronize_session=False)
+
+    totals = _computed_totals(db, cycle_id)
+    db.add_all([
+        models.CycleUserTotals(
+            tank_cycle_id=cid, user_id=uid,
+            total_distance=dist, total_fuel=fuel, ride_count=count, total_cost=cost
+        )
+        for (cid, uid), (dist, fuel, count, cost) in totals.items()
+    ])
+    db.flush()
+    return len(totals)
+
+
+def rebuild_daily(db: Session):
+    """Recompute all daily rollups from rides and archived cycles, replacing stored rows. Does not commit."""
+    db.query(models.UserDailyTotals).delete(synchronize_session=False)
+
+    totals = _computed_daily_totals(db)
+    db.add_all([
+        models.UserDailyTotals(
+            user_id=uid, day=day,
+            total_distance=dist, total_fuel=fuel, ride_count=count, total_cost=cost
+        )
+        for (uid, day), (dist, fuel, count, cost) in totals.items()
+    ])
+    db.flush()
+    return len(totals)
+
+
+def ensure_populated(db: Session):
+    """Build rollups for databases created before a rollup table existed."""
+    has_rides = db.query(models.Ride.id).first() is not None
+    if not has_rides:
+        return
+    if db.query(models.CycleUserTotals.tank_cycle_id).first() is None:
+        rebuild(db)
+    if db.query(models.UserDailyTotals.user_id).first() is None:
+        rebuild_daily(db)
+    db.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.rollups", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--cycle-id", type=int, default=None, help="Limit to a single tank cycle")
+    args = parser.parse_args(argv)
+
+    migrations.upgrade(database.engine)
+    with database.SessionLocal() as db:
+        drift = verify(db, args.cycle_id)
+        for cid, uid, got, exp in drift:
+            print(f"cycle {cid} user {uid}: stored dist={got[0]:.4f} fuel={got[1]:.4f} rides={got[2]}"
+                  f" cost={got[3]:.4f} / expected dist={exp[0]:.4f} fuel={exp[1]:.4f} rides={exp[2]}"
+                  f" cost={exp[3]:.4f}")
+        # Daily rollups span cycles, so they are only checked as a whole
+        if args.cycle_id is None:
+            daily_drift = verify_daily(db)
+            for uid, day, got, exp in daily_drift:
+                print(f"day {day} user {uid}: stored dist={got[0]:.4f} fuel={got[1]:.4f} rides={got[2]}"
+                      f" cost={got[3]:.4f} / expected dist={exp[0]:.4f} fuel={exp[1]:.4f} rides={exp[2]}"
+                      f" cost={exp[3]:.4f}")
+            drift += daily_drift
+        print(f"{len(drift)} drifted rollup row(s)")
+
+        if args.command == "rebuild":
+            count = rebuild(db, args.cycle_id)
+            if args.cycle_id is None:
+                count += rebuild_daily(db)
+            db.commit()
+            print(f"Rebuilt {count} rollup row(s)")
+            return 0
+
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,6 @@
-from pydantic import BaseModel, Field, field_validator
-from typing import Optional, List
-from datetime import datetime, timezone
+from pydantic import BaseModel, Field, field_serializer, field_validator
+from typing import Dict, Optional, List
+from datetime import date, datetime, timezone
 
 # --- Settings ---
 class SettingBase(BaseModel):
@@ -12,6 +12,12 @@ class SettingOut(SettingBase):
     class Config:
         from_attributes = True
 
+class FuelPriceOut(BaseModel):
+    valid_from: datetime
+    price: float
+    class Config:
+        from_attributes = True
+
 # --- Users ---
 class UserBase(BaseModel):
     name: str = Field(min_length=1, max_length=50)
@@ -48,7 +54,7 @@ class RideInput(BaseModel):
             pass
         return v
 
-class RideOut(BaseModel):
+class RideSlimOut(BaseModel):
     id: int
     user_id: int
     tank_cycle_id: int
@@ -56,11 +62,33 @@ class RideOut(BaseModel):
     distance_km: float
     consumption_l100km: float
     fuel_liters: float
-    user: UserOut
+    # Fuel times the price valid at timestamp; None until backfilled
+    cost: Optional[float] = None
+
+    @field_serializer('cost')
+    def round_cost(self, v):
+        # Stored unrounded so that sums stay exact; shown like the stats totals
+        return None if v is None else round(v, 2)
 
     class Config:
         from_attributes = True
 
+class RideOut(RideSlimOut):
+    user: UserOut
+
+class RideListSlim(BaseModel):
+    """Rides without their embedded driver; each driver appears once in users, keyed by id."""
+    rides: List[RideSlimOut]
+    users: Dict[int, UserOut]
+
+class RideBatchError(BaseModel):
+    index: int
+    detail: str
+
+class RideBatchResult(BaseModel):
+    inserted: int
+    errors: List[RideBatchError]
+
 # --- Cycles ---
 class TankCycleOut(BaseModel):
     id: int
@@ -70,6 +98,16 @@ class TankCycleOut(BaseModel):
     class Config:
         from_attributes = True
 
+class CycleArchiveOut(BaseModel):
+    tank_cycle_id: int
+    archived_at: datetime
+    ride_count: int
+    total_distance: float
+    total_fuel: float
+    total_cost: float
+    class Config:
+        from_attributes = True
+
 # --- Stats ---
 class UserStat(BaseModel):
     user_id: int
@@ -88,6 +126,17 @@ class CycleStats(BaseModel):
     total_cost: float
     user_stats: List[UserStat]
 
+class ConsumptionBucket(BaseModel):
+    bucket_start: date
+    user_id: int
+    user_name: str
+    user_color: str
+    ride_count: int
+    total_distance: float
+    total_fuel: float
+    total_cost: float
+    avg_consumption: float
+
 # --- Admin ---
 class AdminLogin(BaseModel):
     password: str = Field(min_length=1)
@@ -0,0 +1,126 @@
+"""
+Process-local read-through cache for singleton state (settings, active cycle,
+fuel price history).
+
+Every write to a cached piece of state bumps its counter in the
+state_versions table in the same transaction. Readers compare the counters
+against the version their cached copy was loaded at, which keeps the cache
+correct across several uvicorn workers. The counters are read with one
+query per request (memoized on the session), or less often when
+STATE_CACHE_CHECK_INTERVAL allows a bounded staleness.
+
+The same counters (plus ones for the users, the cycle list and each cycle's
+rides) version the HTTP ETags of the read endpoints, see httpcache.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from . import models, database
+
+SETTINGS = "settings"
+ACTIVE_CYCLE = "active_cycle"
+USERS = "users"
+ADMIN = "admin"
+CYCLES = "cycles"
+PRICES = "prices"
+
+# Seconds a process may trust the last counters it read; 0 checks on every request
+STATE_CACHE_CHECK_INTERVAL = float(os.getenv("STATE_CACHE_CHECK_INTERVAL", "0"))
+
+_lock = threading.Lock()
+_values = {}
+_last_versions = None
+_last_checked = 0.0
+_counters = {"hits": 0, "misses": 0}
+
+
+def _current_versions(db: Session) -> dict:
+    global _last_versions, _last_checked
+    if "state_versions" in db.info:
+        return db.info["state_versions"]
+
+    now = time.monotonic()
+    with _lock:
+        if _last_versions is not None and now - _last_checked < STATE_CACHE_CHECK_INTERVAL:
+            return _last_versions
+
+    versions = dict(db.query(models.StateVersion.name, models.StateVersion.version).all())
+    with _lock:
+        _last_versions = versions
+        _last_checked = now
+    db.info["state_versions"] = versions
+    return versions
+
+
+def cycle_rides(cycle_id: int) -> str:
+    """Counter of admin changes to the rides of one cycle."""
+    return f"cycle_rides:{cycle_id}"
+
+
+def version(db: Session, name: str) -> int:
+    """Current version of name (0 if it was never bumped)."""
+    return _current_versions(db).get(name, 0)
+
+
+def read_through(db: Session, name: str, loader):
+    """Return the cached value of name, reloading it with loader(db) when its version moved."""
+    current = version(db, name)
+    with _lock:
+        entry = _values.get(name)
+        if entry is not None and entry[0] == current:
+            _counters["hits"] += 1
+            return entry[1]
+        _counters["misses"] += 1
+
+    value = loader(db)
+    with _lock:
+        _values[name] = (current, value)
+    return value
+
+
+def bump(db: Session, name: str):
+    """Record a change to name so every process reloads it. Call before commit.
+
+    The counter row stays write-locked until the transaction ends, so bumping
+    first also serializes concurrent writers of name across workers.
+    """
+    database.upsert(db, models.StateVersion, {"name": name, "version": 1}, {"version": 1})
+    db.info.pop("state_versions", None)
+    invalidate(name)
+
+
+def hold(db: Session, name: str):
+    """Keep name from being bumped by other transactions until this one ends.
+
+    Takes a shared lock on the counter row (PostgreSQL), or the database
+    write lock (SQLite, which has a single writer anyway).
+    """
+    row = models.StateVersion.name == name
+    if db.get_bind().dialect.name == "sqlite":
+        held = db.query(models.StateVersion).filter(row).update(
+            {models.StateVersion.version: models.StateVersion.version}, synchronize_session=False
+        )
+    else:
+        held = db.query(models.StateVersion.version).filter(row).with_for_update(read=True).first() is not None
+    if not held:
+        # No counter row to lock yet: create it, which locks it exclusively
+        bump(db, name)
+
+
+def invalidate(name: str):
+    """Drop the local copy of name."""
+    global _last_versions
+    with _lock:
+        _values.pop(name, None)
+        _last_versions = None
+
+
+def stats() -> dict:
+    with _lock:
+        snapshot = dict(_counters)
+        snapshot["cached"] = sorted(_values)
+    snapshot["check_interval_seconds"] = STATE_CACHE_CHECK_INTERVAL
+    return snapshot
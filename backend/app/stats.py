@@ -0,0 +1,97 @@
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+
+
+def cycle_user_totals(db: Session, cycle_id: int):
+    """
+    Aggregate rides of a cycle per driver in a single GROUP BY query.
+    Returns rows of (user_id, user_name, user_color, total_distance, total_fuel, ride_count, total_cost).
+    user_name/user_color are None for rides whose driver row no longer exists.
+    """
+    return (
+        db.query(
+            models.Ride.user_id,
+            models.User.name,
+            models.User.color,
+            func.coalesce(func.sum(models.Ride.distance_km), 0.0),
+            func.coalesce(func.sum(models.Ride.fuel_liters), 0.0),
+            func.count(models.Ride.id),
+            func.coalesce(func.sum(models.Ride.cost), 0.0),
+        )
+        .outerjoin(models.User, models.User.id == models.Ride.user_id)
+        .filter(models.Ride.tank_cycle_id == cycle_id)
+        .group_by(models.Ride.user_id, models.User.name, models.User.color)
+        .order_by(models.Ride.user_id)
+        .all()
+    )
+
+
+def rollup_user_totals(db: Session, cycle_id: int):
+    """Per-driver rows in the same shape as cycle_user_totals, read from the rollup table."""
+    return (
+        db.query(
+            models.CycleUserTotals.user_id,
+            models.User.name,
+            models.User.color,
+            models.CycleUserTotals.total_distance,
+            models.CycleUserTotals.total_fuel,
+            models.CycleUserTotals.ride_count,
+            models.CycleUserTotals.total_cost,
+        )
+        .outerjoin(models.User, models.User.id == models.CycleUserTotals.user_id)
+        .filter(
+            models.CycleUserTotals.tank_cycle_id == cycle_id,
+            models.CycleUserTotals.ride_count > 0
+        )
+        .order_by(models.CycleUserTotals.user_id)
+        .all()
+    )
+
+
+def build_cycle_stats(cycle: models.TankCycle, rows) -> schemas.CycleStats:
+    """
+    Turn per-driver (user_id, name, color, distance, fuel, ride count, cost) rows into CycleStats.
+    Rounding matches the original per-ride Python aggregation.
+    """
+    total_dist = 0.0
+    total_fuel = 0.0
+    total_cost = 0.0
+    user_stats_list = []
+
+    for user_id, name, color, dist, fuel, _, cost in rows:
+        total_dist += dist
+        total_fuel += fuel
+        total_cost += cost
+
+        # Rides of a driver that no longer exists count towards totals only
+        if name is None:
+            continue
+        if not (dist > 0 or fuel > 0):
+            continue
+
+        avg_consumption = (fuel * 100 / dist) if dist > 0 else 0
+        user_stats_list.append(schemas.UserStat(
+            user_id=user_id,
+            user_name=name,
+            user_color=color,
+            total_distance=round(dist, 2),
+            total_fuel=round(fuel, 2),
+            total_cost=round(cost, 2),
+            avg_consumption=round(avg_consumption, 2),
+        ))
+
+    return schemas.CycleStats(
+        cycle_id=cycle.id,
+        is_active=cycle.is_active,
+        total_distance=round(total_dist, 2),
+        total_fuel=round(total_fuel, 2),
+        total_cost=round(total_cost, 2),
+        user_stats=user_stats_list
+    )
+
+
+def compute_cycle_stats(db: Session, cycle: models.TankCycle) -> schemas.CycleStats:
+    """Compute statistics of a cycle from the maintained per-driver rollups."""
+    return build_cycle_stats(cycle, rollup_user_totals(db, cycle.id))
@@ -0,0 +1,74 @@
+"""
+Benchmark /api/analytics/consumption: daily rollup buckets vs grouping the rides table.
+
+Seeds rides one minute apart (1M rides span almost two years), backfills the
+daily rollups and times three dashboard queries both ways, checking that
+they return the same buckets:
+    day   - the last 30 days
+    week  - the last 52 weeks
+    month - the whole history
+
+Usage (from backend/):
+    python -m benchmarks.bench_analytics [rides ...]
+
+Defaults to 1M and 2M rides.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import Date, create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from app import analytics, models, rollups
+from .bench_stats import seed, timed
+
+
+def scan_buckets(db, start, end, bucket):
+    """The same buckets computed from rides, as an endpoint without rollups would."""
+    day = func.date(models.Ride.timestamp, type_=Date)
+    rows = (
+        db.query(models.Ride.user_id, models.User.name, models.User.color, day,
+                 func.sum(models.Ride.distance_km), func.sum(models.Ride.fuel_liters), func.count(models.Ride.id),
+                 func.sum(models.Ride.cost))
+        .join(models.User, models.User.id == models.Ride.user_id)
+        .filter(models.Ride.timestamp >= start, models.Ride.timestamp < end + timedelta(days=1))
+        .group_by(models.Ride.user_id, models.User.name, models.User.color, day)
+        .all()
+    )
+    return analytics.build_buckets(rows, bucket)
+
+
+def run(ride_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, ride_count)
+        Session = sessionmaker(bind=engine)
+        with Session() as db:
+            t0 = time.perf_counter()
+            days = rollups.rebuild_daily(db)
+            db.commit()
+            backfill_s = time.perf_counter() - t0
+
+            last = db.query(func.max(models.Ride.timestamp)).scalar().date()
+            queries = [
+                ("day", last - timedelta(days=29), last),
+                ("week", last - timedelta(weeks=52), last),
+                ("month", date(2000, 1, 1), last),
+            ]
+            print(f"{ride_count:>9} rides  {days} daily rollup rows, backfill {backfill_s:.1f} s")
+            for bucket, start, end in queries:
+                fast = analytics.consumption_buckets(db, start, end, bucket)
+                assert fast == scan_buckets(db, start, end, bucket), f"{bucket} buckets differ"
+                scan_ms = timed(lambda: scan_buckets(db, start, end, bucket), 2)
+                rollup_ms = timed(lambda: analytics.consumption_buckets(db, start, end, bucket), 5)
+                print(f"    {bucket:<6} {len(fast):>5} buckets   rides scan: {scan_ms:8.1f} ms   rollups: {rollup_ms:6.2f} ms")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]] or [1_000_000, 2_000_000]
+    for n in counts:
+        run(n)
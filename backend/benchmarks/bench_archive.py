@@ -0,0 +1,153 @@
+"""
+Benchmark archiving: hot-table latency before and after moving years of closed cycles to the archive.
+
+Seeds YEARS of two-week cycles with RIDES rides (benchmarks.seed) into a
+throwaway SQLite database and times, in-process, the requests that read or
+write the rides table: the dashboard stats, a driver's rides in the active
+cycle, a new ride, the active cycle's export and a full rollups verify. It
+then archives every closed cycle but the KEEP newest (and VACUUMs), times
+the same requests again, plus a driver's rides in an archived cycle (read
+from the archive) and a restore, and checks that /api/stats?cycle_id= and
+/api/cycles return exactly what they did before and the rollups show no
+drift.
+
+Usage (from backend/):
+    python -m benchmarks.bench_archive [--years 5] [--rides 500000] [--keep 6]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+CYCLE_DAYS = 14
+REPEAT = 20
+
+
+def measure(client, headers, cycle_id, user_id, ride):
+    """Best-of latency in ms of the hot requests."""
+    from app import database, rollups
+    from .bench_stats import timed
+
+    def get(path, **params):
+        response = client.get(path, params=params, headers=headers)
+        assert response.status_code == 200, (path, response.status_code, response.text)
+
+    def post_ride():
+        response = client.post("/api/rides", json=ride)
+        assert response.status_code == 200, response.text
+
+    def verify():
+        with database.SessionLocal() as db:
+            assert not rollups.verify(db)
+
+    return {
+        "GET /api/stats": timed(lambda: get("/api/stats"), REPEAT),
+        "GET /api/admin/users/{id}/rides?cycle_id (active)": timed(
+            lambda: get(f"/api/admin/users/{user_id}/rides", cycle_id=cycle_id, limit=50), REPEAT),
+        "POST /api/rides": timed(post_ride, REPEAT),
+        "GET /api/export/rides?cycle_id (active)": timed(lambda: get("/api/export/rides", cycle_id=cycle_id), 5),
+        "rollups verify": timed(verify, 3),
+    }
+
+
+def snapshot(client, cycle_ids):
+    """What the history view shows: the cycle list and every closed cycle's stats."""
+    cycles = client.get("/api/cycles").json()
+    return cycles, [client.get("/api/stats", params={"cycle_id": cycle_id}).json() for cycle_id in cycle_ids]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_archive",
+                                     description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--rides", type=int, default=500_000)
+    parser.add_argument("--keep", type=int, default=6, help="Closed cycles left in the rides table")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    db_path = os.path.join(tmp, "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import text
+    # app reads DATABASE_URL on import
+    from app import archive, database, main as app_main, models, rollups
+    from . import seed
+    from .bench_stats import timed
+
+    cycles = args.years * 365 // CYCLE_DAYS
+    t0 = time.perf_counter()
+    info = seed.populate(database.engine, cycles=cycles, rides=args.rides)
+    print(f"seeded {cycles} cycles, {args.rides} rides in {time.perf_counter() - t0:.1f}s")
+
+    client = TestClient(app_main.app)
+    token = client.post("/api/admin/login", json={"password": "Bagr123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    active_id, closed_ids, user_id = info["cycles"][-1], info["cycles"][:-1], info["users"][0]
+    with database.SessionLocal() as db:
+        active_start = db.get(models.TankCycle, active_id).start_date
+    ride = {"user_id": user_id, "timestamp": (active_start + timedelta(days=1)).isoformat(),
+            "distance_km": 20.0, "consumption_l100km": 6.0}
+
+    def table_rides():
+        with database.SessionLocal() as db:
+            return db.query(models.Ride.id).count()
+
+    def file_size():
+        # Move the write-ahead log into the database file first
+        with database.engine.connect() as conn:
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+        return os.path.getsize(db_path)
+
+    history = snapshot(client, closed_ids)
+    sizes = [(table_rides(), file_size())]
+    before = measure(client, headers, active_id, user_id, ride)
+
+    with database.SessionLocal() as db:
+        to_archive = archive.candidates(db, keep=args.keep)
+    t0 = time.perf_counter()
+    with database.SessionLocal() as db:
+        for cycle_id in to_archive:
+            archive.archive_cycle(db, cycle_id)
+            db.commit()
+    archive_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    with database.engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    vacuum_s = time.perf_counter() - t0
+
+    assert snapshot(client, closed_ids) == history, "history changed after archiving"
+    with database.SessionLocal() as db:
+        assert not rollups.verify(db) and not rollups.verify_daily(db), "rollups drifted after archiving"
+    sizes.append((table_rides(), file_size()))
+    after = measure(client, headers, active_id, user_id, ride)
+
+    cold_id = to_archive[len(to_archive) // 2]
+    after["GET /api/admin/users/{id}/rides?cycle_id (archived)"] = timed(
+        lambda: client.get(f"/api/admin/users/{user_id}/rides", params={"cycle_id": cold_id, "limit": 50},
+                           headers=headers).raise_for_status(), REPEAT)
+    with database.SessionLocal() as db:
+        t0 = time.perf_counter()
+        restored = archive.restore_cycle(db, cold_id)
+        db.commit()
+        restore_ms = (time.perf_counter() - t0) * 1000
+        archive.archive_cycle(db, cold_id)
+        db.commit()
+
+    print(f"archived {len(to_archive)} cycles in {archive_s:.1f}s, VACUUM {vacuum_s:.1f}s, "
+          f"restored one cycle ({restored} rides) in {restore_ms:.0f} ms")
+    for label, (rides, size) in zip(("before", "after"), sizes):
+        print(f"{label:>6}: {rides:>8} rides in the rides table, {size / 2**20:7.1f} MiB on disk")
+    print(f"{'request':<52} {'before ms':>10} {'after ms':>10}")
+    for name in after:
+        was = f"{before[name]:10.2f}" if name in before else f"{'-':>10}"
+        print(f"{name:<52} {was} {after[name]:10.2f}")
+    print("history (cycle list and per-cycle stats) unchanged, rollups verify: no drift")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
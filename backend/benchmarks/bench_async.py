@@ -0,0 +1,71 @@
+"""
+Requests/s of the sync (threadpool) and async (AsyncSession + aiosqlite) database modes.
+
+Starts uvicorn once per mode (DATABASE_ASYNC=0 and 1) on a throwaway SQLite
+database and drives it with CONCURRENCY_LEVELS concurrent clients, each
+looping over a read-heavy mix of GET /api/stats, GET /api/settings and
+POST /api/rides for DURATION seconds.
+
+Usage (from backend/):
+    python -m benchmarks.bench_async [seconds_per_level]
+"""
+import asyncio
+import sys
+import time
+
+from .server import uvicorn_server, wait_until_up
+
+CONCURRENCY_LEVELS = (10, 100, 500)
+DURATION = 10.0
+
+
+async def run_level(client, concurrency, duration):
+    counts = {"ok": 0, "failed": 0}
+    deadline = time.perf_counter() + duration
+
+    async def worker(n):
+        i = n
+        while time.perf_counter() < deadline:
+            if i % 5 == 0:
+                response = await client.post("/api/rides", json={
+                    "user_id": 1, "timestamp": "2024-05-01T08:00:00",
+                    "distance_km": 12.5, "consumption_l100km": 6.0,
+                })
+            elif i % 5 == 1:
+                response = await client.get("/api/settings")
+            else:
+                response = await client.get("/api/stats")
+            counts["ok" if response.status_code == 200 else "failed"] += 1
+            i += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return counts["ok"] / (time.perf_counter() - t0), counts["failed"]
+
+
+async def bench_mode(async_mode, duration):
+    import httpx
+
+    results = {}
+    limits = httpx.Limits(max_connections=max(CONCURRENCY_LEVELS), max_keepalive_connections=max(CONCURRENCY_LEVELS))
+    with uvicorn_server({"DATABASE_ASYNC": "1" if async_mode else "0"}) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await wait_until_up(client)
+            await client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+            for concurrency in CONCURRENCY_LEVELS:
+                results[concurrency] = await run_level(client, concurrency, duration)
+    return results
+
+
+def main(duration):
+    sync_results = asyncio.run(bench_mode(False, duration))
+    async_results = asyncio.run(bench_mode(True, duration))
+    print(f"{'clients':>8} {'sync req/s':>12} {'async req/s':>12} {'ratio':>7}")
+    for concurrency in CONCURRENCY_LEVELS:
+        (sync_rate, sync_failed), (async_rate, async_failed) = sync_results[concurrency], async_results[concurrency]
+        failed = f"  ({sync_failed}/{async_failed} failed)" if sync_failed or async_failed else ""
+        print(f"{concurrency:>8} {sync_rate:>12.0f} {async_rate:>12.0f} {async_rate / sync_rate:>6.2f}x{failed}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else DURATION)
@@ -0,0 +1,85 @@
+"""
+Equivalence check and timing of logic.calculate_ride_data_batch vs the scalar function.
+
+Generates random rows (missing values, zero distance, values on the 0.1 L
+tolerance boundary and on 2-decimal rounding ties), asserts that the batch
+API returns exactly what calculate_ride_data returns or raises for every
+row, then times both.
+
+Usage (from backend/):
+    python -m benchmarks.bench_calc [rows]
+"""
+import math
+import random
+import sys
+import time
+
+import numpy as np
+from fastapi import HTTPException
+
+from app import logic
+
+
+def random_value(rng):
+    kind = rng.random()
+    if kind < 0.15:
+        return None
+    if kind < 0.2:
+        return 0.0
+    if kind < 0.4:
+        # Values with 3 decimals hit rounding ties such as 2.675
+        return rng.randint(1, 200000) / 1000
+    return rng.uniform(0.1, 500)
+
+
+def random_row(rng):
+    d, c, f = random_value(rng), random_value(rng), random_value(rng)
+    if d is not None and c is not None and rng.random() < 0.5:
+        # Put fuel around the consistency tolerance
+        f = d * c / 100 + rng.choice([-0.1, 0.1, -0.1000001, 0.0999999, 0.0, rng.uniform(-0.3, 0.3)])
+    return d, c, f
+
+
+def scalar(row):
+    try:
+        return logic.calculate_ride_data(*row), None
+    except HTTPException as e:
+        return None, e.detail
+    except ZeroDivisionError:
+        return None, "zero divisor"
+
+
+def check(rows):
+    as_col = lambda i: [math.nan if r[i] is None else r[i] for r in rows]
+    d, c, f, errors = logic.calculate_ride_data_batch(as_col(0), as_col(1), as_col(2))
+    for i, row in enumerate(rows):
+        expected, detail = scalar(row)
+        if expected is None:
+            assert errors[i] != logic.RIDE_OK, (row, detail)
+            if detail != "zero divisor":
+                assert logic.batch_error_detail(errors[i], *row) == detail, (row, detail)
+        else:
+            assert errors[i] == logic.RIDE_OK, (row, errors[i])
+            assert (d[i], c[i], f[i]) == expected, (row, expected, (d[i], c[i], f[i]))
+
+
+def main(count):
+    rng = random.Random(42)
+    rows = [random_row(rng) for _ in range(count)]
+    check(rows)
+    print(f"{count} rows: batch results identical to calculate_ride_data")
+
+    t0 = time.perf_counter()
+    for row in rows:
+        scalar(row)
+    scalar_s = time.perf_counter() - t0
+
+    cols = [np.array([math.nan if r[i] is None else r[i] for r in rows]) for i in range(3)]
+    t0 = time.perf_counter()
+    logic.calculate_ride_data_batch(*cols)
+    batch_s = time.perf_counter() - t0
+    print(f"scalar: {count / scalar_s:12.0f} rows/s   batch: {count / batch_s:12.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
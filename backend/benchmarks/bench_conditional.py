@@ -0,0 +1,69 @@
+"""
+Full GET vs conditional GET (If-None-Match -> 304) on the cached read endpoints.
+
+Seeds USERS drivers and CYCLES closed tank cycles with rides into a throwaway
+SQLite database, then requests every endpoint once to get its ETag and times
+it with and without If-None-Match in-process, counting the SQL statements of
+each request.
+
+Usage (from backend/):
+    python -m benchmarks.bench_conditional [repeat]
+"""
+import os
+import sys
+import tempfile
+import time
+
+USERS = 50
+CYCLES = 2000
+RIDES_PER_CYCLE = 20
+REPEAT = 200
+
+ENDPOINTS = ["/api/settings", "/api/users", "/api/cycles", "/api/stats?cycle_id=1"]
+
+
+def seed(client):
+    for i in range(USERS):
+        client.post("/api/users", json={"name": f"driver{i}", "color": "#336699", "password": "pw"})
+    for c in range(CYCLES):
+        client.post("/api/rides/batch", json=[
+            {"user_id": r % USERS + 1, "timestamp": "2024-05-01T08:00:00", "distance_km": 12.5, "consumption_l100km": 6.0}
+            for r in range(RIDES_PER_CYCLE)
+        ])
+        client.post("/api/cycles/close")
+
+
+def main(repeat):
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app import main as app_main, database, cli
+
+    cli.init_db()
+    statements = []
+    event.listen(database.engine, "before_cursor_execute", lambda *args: statements.append(1))
+    if database.DATABASE_ASYNC:
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    with TestClient(app_main.app) as client:
+        seed(client)
+        print(f"{USERS} drivers, {CYCLES} cycles, {CYCLES * RIDES_PER_CYCLE} rides")
+        print(f"{'endpoint':<24} {'200 ms':>8} {'SQL':>4} {'304 ms':>8} {'SQL':>4}")
+        for url in ENDPOINTS:
+            tag = client.get(url).headers["etag"]
+            row = []
+            for headers, expected in (({}, 200), ({"If-None-Match": tag}, 304)):
+                statements.clear()
+                t0 = time.perf_counter()
+                for _ in range(repeat):
+                    response = client.get(url, headers=headers)
+                elapsed = (time.perf_counter() - t0) * 1000 / repeat
+                assert response.status_code == expected, (url, response.status_code)
+                row += [elapsed, len(statements) / repeat]
+            print(f"{url:<24} {row[0]:8.2f} {row[1]:4.0f} {row[2]:8.2f} {row[3]:4.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REPEAT)
@@ -0,0 +1,124 @@
+"""
+Peak server memory while streaming GET /api/export/rides.
+
+Seeds rides into a throwaway SQLite file, starts uvicorn on it and downloads
+the full export in every available format (Parquet needs pyarrow). For each
+download it resets the server's peak RSS, reads it again afterwards from
+/proc (so Linux only) and checks the row count. Exits 1 if a download grows
+the server's peak RSS by more than RSS_LIMIT_MB or loses rows.
+
+Usage (from backend/):
+    python -m benchmarks.bench_export [rides]
+
+Defaults to 1M rides.
+"""
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from .bench_stats import seed
+from .server import BACKEND_DIR, free_port
+
+ROWS = 1_000_000
+RSS_LIMIT_MB = 64
+
+
+def rss_mb(pid, field):
+    """VmRSS (current) or VmHWM (peak) of a process, in MiB."""
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError(f"{field} not found")
+
+
+def reset_peak_rss(pid):
+    with open(f"/proc/{pid}/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+
+
+def count_rows(path, format):
+    if format == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, "rb") as exported:
+        return sum(1 for _ in exported) - 1  # header
+
+
+def download(client, headers, params, path):
+    with client.stream("GET", "/api/export/rides", params=params, headers=headers) as response:
+        response.raise_for_status()
+        with open(path, "wb") as out:
+            for chunk in response.iter_bytes():
+                out.write(chunk)
+
+
+def main(ride_count):
+    import httpx
+
+    formats = ["csv"]
+    try:
+        import pyarrow  # noqa: F401
+        formats.append("parquet")
+    except ImportError:
+        print("parquet: skipped (pyarrow is not installed)")
+
+    tmp = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(tmp, 'fuel.db')}")
+    seed(engine, ride_count)
+    engine.dispose()
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning", "--no-access-log"],
+        cwd=tmp,
+    )
+    failed = False
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+            for _ in range(600):
+                try:
+                    client.get("/api/settings")
+                    break
+                except httpx.TransportError:
+                    time.sleep(0.1)
+            token = client.post("/api/admin/login", json={"password": "Bagr123"}).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+
+            print(f"{'format':<8} {'rows':>9} {'MiB':>7} {'seconds':>8} {'rows/s':>9} {'idle RSS':>9} {'peak RSS':>9}")
+            for format in formats:
+                path = os.path.join(tmp, f"rides.{format}")
+                # A one-day export first, so imports and caches are part of the idle baseline
+                download(client, headers, {"format": format, "start": "2024-01-01", "end": "2024-01-01"}, path)
+                reset_peak_rss(server.pid)
+                idle = rss_mb(server.pid, "VmRSS")
+
+                t0 = time.perf_counter()
+                download(client, headers, {"format": format}, path)
+                seconds = time.perf_counter() - t0
+                peak = rss_mb(server.pid, "VmHWM")
+                rows = count_rows(path, format)
+
+                print(f"{format:<8} {rows:>9} {os.path.getsize(path) / 2**20:7.1f} {seconds:8.1f} "
+                      f"{rows / seconds:9.0f} {idle:7.1f}MB {peak:7.1f}MB")
+                if rows != ride_count:
+                    print(f"FAILED: {format} export has {rows} rows, expected {ride_count}")
+                    failed = True
+                if peak - idle > RSS_LIMIT_MB:
+                    print(f"FAILED: {format} export grew the server by {peak - idle:.1f} MB (limit {RSS_LIMIT_MB} MB)")
+                    failed = True
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS))
@@ -0,0 +1,88 @@
+"""
+POST /api/rides throughput and latency: one commit per ride vs group commit.
+
+Starts uvicorn once per mode (GROUP_COMMIT=0 and 1) on a throwaway SQLite
+database with SQLITE_SYNCHRONOUS=FULL, so every commit is synced to disk as
+in a durable setup, and drives it with CONCURRENCY_LEVELS concurrent
+writers posting rides for DURATION seconds each. Reports rides/s and the
+p50/p99 request latency, then checks that /api/stats counts every ride
+that was acknowledged.
+
+Usage (from backend/):
+    python -m benchmarks.bench_group_commit [seconds_per_level]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from .server import uvicorn_server, wait_until_up
+
+CONCURRENCY_LEVELS = (1, 10, 100)
+DURATION = 5.0
+DISTANCE = 12.5
+
+
+async def run_level(client, concurrency, duration):
+    latencies = []
+    failed = 0
+    deadline = time.perf_counter() + duration
+
+    async def writer():
+        nonlocal failed
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            response = await client.post("/api/rides", json={
+                "user_id": 1, "timestamp": "2024-05-01T08:00:00",
+                "distance_km": DISTANCE, "consumption_l100km": 6.0,
+            })
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - t0)
+            else:
+                failed += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(writer() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    cuts = statistics.quantiles(latencies, n=100)
+    return {"rate": len(latencies) / elapsed, "p50": cuts[49] * 1000, "p99": cuts[98] * 1000,
+            "ok": len(latencies), "failed": failed}
+
+
+async def bench_mode(group_commit, duration):
+    import httpx
+
+    results = {}
+    limits = httpx.Limits(max_connections=max(CONCURRENCY_LEVELS), max_keepalive_connections=max(CONCURRENCY_LEVELS))
+    env = {"GROUP_COMMIT": "1" if group_commit else "0", "SQLITE_SYNCHRONOUS": "FULL"}
+    with uvicorn_server(env) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await wait_until_up(client)
+            await client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+            for concurrency in CONCURRENCY_LEVELS:
+                results[concurrency] = await run_level(client, concurrency, duration)
+            acknowledged = sum(result["ok"] for result in results.values())
+            stored = (await client.get("/api/stats")).json()["total_distance"] / DISTANCE
+    return results, acknowledged, round(stored)
+
+
+def main(duration):
+    failed = False
+    modes = {}
+    for group_commit in (False, True):
+        results, acknowledged, stored = asyncio.run(bench_mode(group_commit, duration))
+        modes[group_commit] = results
+        if stored != acknowledged:
+            print(f"FAILED: GROUP_COMMIT={int(group_commit)} acknowledged {acknowledged} rides, stats count {stored}")
+            failed = True
+
+    print(f"{'writers':>8} {'mode':<14} {'rides/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'failed':>7}")
+    for concurrency in CONCURRENCY_LEVELS:
+        for group_commit, label in ((False, "per request"), (True, "group commit")):
+            r = modes[group_commit][concurrency]
+            print(f"{concurrency:>8} {label:<14} {r['rate']:9.0f} {r['p50']:8.1f} {r['p99']:8.1f} {r['failed']:>7}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else DURATION))
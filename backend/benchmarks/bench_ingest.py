@@ -0,0 +1,62 @@
+"""
+Ride ingestion throughput: POST /api/rides one by one vs POST /api/rides/batch.
+
+Runs the app in-process against a throwaway SQLite database.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BATCH_SIZE = 5000
+
+
+def make_rides(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    rides = []
+    for i in range(count):
+        rides.append({
+            "user_id": 1,
+            "timestamp": (start + timedelta(minutes=i)).isoformat(),
+            "distance_km": round(rng.uniform(2, 150), 2),
+            "consumption_l100km": round(rng.uniform(4, 9), 2),
+        })
+    return rides
+
+
+def main(count):
+    from fastapi.testclient import TestClient
+    from app import main as app_main, cli
+
+    cli.init_db()
+    client = TestClient(app_main.app)
+    client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+
+    single = make_rides(min(count, 2000), seed=1)
+    t0 = time.perf_counter()
+    for ride in single:
+        assert client.post("/api/rides", json=ride).status_code == 200
+    single_rate = len(single) / (time.perf_counter() - t0)
+
+    batch = make_rides(count, seed=2)
+    t0 = time.perf_counter()
+    inserted = 0
+    for i in range(0, count, BATCH_SIZE):
+        result = client.post("/api/rides/batch", json=batch[i:i + BATCH_SIZE]).json()
+        inserted += result["inserted"]
+    batch_rate = inserted / (time.perf_counter() - t0)
+
+    print(f"single POST /api/rides   {len(single):>8} rows  {single_rate:10.0f} rows/s")
+    print(f"POST /api/rides/batch    {inserted:>8} rows  {batch_rate:10.0f} rows/s  ({batch_rate / single_rate:.1f}x)")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
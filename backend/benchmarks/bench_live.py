@@ -0,0 +1,122 @@
+"""
+GET /api/live fan-out: delivery latency to hundreds of subscribers.
+
+Starts uvicorn on a throwaway SQLite database and, for each level of
+SUBSCRIBER_LEVELS, opens that many SSE streams, posts RIDES rides one after
+another and measures the time from sending each POST to every subscriber
+seeing its delta. Reports p50/p99/max delivery latency and the hub reloads
+per ride from /api/admin/metrics/live, which must not grow with the number
+of subscribers (one reload per change, shared by all streams). Exits 1 if a
+subscriber misses a ride or the hub reloads more than once per ride.
+
+Usage (from backend/):
+    python -m benchmarks.bench_live [rides_per_level]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+from .server import uvicorn_server, wait_until_up
+
+SUBSCRIBER_LEVELS = (1, 100, 500)
+RIDES = 20
+DISTANCE = 10.0
+# Rides are spaced out so each one is delivered (and measured) on its own
+PAUSE = 0.25
+
+
+async def subscribe(client, seen, ready):
+    """Follow one stream; append (time, total_distance) for every stats or delta event."""
+    event = None
+    async with client.stream("GET", "/api/live") as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event in ("stats", "delta"):
+                seen.append((time.perf_counter(), json.loads(line[6:])["total_distance"]))
+                if event == "stats":
+                    ready()
+
+
+async def run_level(client, admin_headers, subscribers, rides):
+    streams = [[] for _ in range(subscribers)]
+    connected = 0
+    all_connected = asyncio.Event()
+
+    def ready():
+        nonlocal connected
+        connected += 1
+        if connected == subscribers:
+            all_connected.set()
+
+    tasks = [asyncio.create_task(subscribe(client, seen, ready)) for seen in streams]
+    await asyncio.wait_for(all_connected.wait(), 60)
+    start_total = streams[0][-1][1]
+    before = (await client.get("/api/admin/metrics/live", headers=admin_headers)).json()
+
+    sent = []
+    for i in range(rides):
+        sent.append((time.perf_counter(), start_total + (i + 1) * DISTANCE))
+        response = await client.post("/api/rides", json={
+            "user_id": 1, "timestamp": "2024-05-01T08:00:00", "distance_km": DISTANCE, "consumption_l100km": 6.0,
+        })
+        response.raise_for_status()
+        await asyncio.sleep(PAUSE)
+
+    after = (await client.get("/api/admin/metrics/live", headers=admin_headers)).json()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = []
+    missed = 0
+    for seen in streams:
+        for sent_at, total in sent:
+            arrival = next((at for at, seen_total in seen if at >= sent_at and seen_total >= total - 1e-6), None)
+            if arrival is None:
+                missed += 1
+            else:
+                latencies.append(arrival - sent_at)
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "p50": cuts[49] * 1000, "p99": cuts[98] * 1000, "max": max(latencies, default=0) * 1000,
+        "missed": missed, "reloads_per_ride": (after["reloads"] - before["reloads"]) / rides,
+    }
+
+
+async def bench(rides):
+    import httpx
+
+    connections = max(SUBSCRIBER_LEVELS) + 10
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    # A long poll interval, so reloads come from ride commits only
+    with uvicorn_server({"LIVE_POLL_INTERVAL": "3600"}) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            await wait_until_up(client)
+            await client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+            token = (await client.post("/api/admin/login", json={"password": "Bagr123"})).json()["access_token"]
+            admin_headers = {"Authorization": f"Bearer {token}"}
+            results = {}
+            for subscribers in SUBSCRIBER_LEVELS:
+                results[subscribers] = await run_level(client, admin_headers, subscribers, rides)
+    return results
+
+
+def main(rides):
+    results = asyncio.run(bench(rides))
+    failed = False
+    print(f"{'subscribers':>11} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'reloads/ride':>13} {'missed':>7}")
+    for subscribers, r in results.items():
+        print(f"{subscribers:>11} {r['p50']:8.1f} {r['p99']:8.1f} {r['max']:8.1f} "
+              f"{r['reloads_per_ride']:13.2f} {r['missed']:>7}")
+        if r["missed"] or r["reloads_per_ride"] > 1:
+            failed = True
+    if failed:
+        print("FAILED: a subscriber missed a ride or the hub reloaded more than once per ride")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else RIDES))
@@ -0,0 +1,75 @@
+"""
+Load test: /api/stats latency while a burst of logins is in flight.
+
+Runs the app in-process over ASGI, measures /api/stats latency on an idle
+server, then again while CONCURRENT_LOGINS user logins hammer bcrypt.
+
+Usage (from backend/):
+    python -m benchmarks.bench_login_load [concurrent_logins]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+STATS_SAMPLES = 100
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def sample_stats(client, count):
+    latencies = []
+    for _ in range(count):
+        t0 = time.perf_counter()
+        response = await client.get("/api/stats")
+        latencies.append((time.perf_counter() - t0) * 1000)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+async def login_burst(client, count):
+    async def login():
+        response = await client.post("/api/users/login", json={"user_id": 1, "password": "secret"})
+        assert response.status_code in (200, 503), response.text
+        return response.status_code
+
+    return await asyncio.gather(*(login() for _ in range(count)))
+
+
+def report(label, latencies):
+    print(f"{label:<28} p50 {statistics.median(latencies):7.2f} ms   "
+          f"p95 {percentile(latencies, 95):7.2f} ms   max {max(latencies):7.2f} ms")
+
+
+async def main(concurrent_logins):
+    import httpx
+    from app import main as app_main, passwords, cli
+
+    cli.init_db()
+    transport = httpx.ASGITransport(app=app_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+        # Warm up the pool so worker start-up is not measured
+        await login_burst(client, passwords.PASSWORD_WORKERS)
+
+        report("/api/stats idle", await sample_stats(client, STATS_SAMPLES))
+
+        t0 = time.perf_counter()
+        burst = asyncio.create_task(login_burst(client, concurrent_logins))
+        busy = await sample_stats(client, STATS_SAMPLES)
+        codes = await burst
+        elapsed = time.perf_counter() - t0
+        report(f"/api/stats + {concurrent_logins} logins", busy)
+
+    print(f"{codes.count(200)} logins ok, {codes.count(503)} rejected in {elapsed:.2f} s; pool: {passwords.pool_stats()}")
+
+
+if __name__ == "__main__":
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,113 @@
+"""
+Serialize time and bytes on the wire for a ride list.
+
+Seeds rides into a throwaway SQLite file and renders all of them the way
+GET /api/admin/users/{id}/rides does: ORM objects through the RideOut
+response model (the default), and row tuples through orjson (FAST_JSON=1)
+or the standard json module. Checks that the fast path produces the same
+JSON, then reports the body size raw and compressed with the settings of
+app.compression. orjson and brotli are optional and skipped when missing.
+
+Usage (from backend/):
+    python -m benchmarks.bench_serialize [rides]
+
+Defaults to 10k rides.
+"""
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import compression, fastjson, models, schemas
+from .bench_stats import seed, timed
+
+ROWS = 10_000
+REPEAT = 5
+
+
+RIDES_OUT = TypeAdapter(List[schemas.RideOut])
+
+
+def orm_json(db):
+    # What FastAPI does for response_model: validate, dump to JSON-able data, JSONResponse
+    rides = db.query(models.Ride).filter(models.Ride.tank_cycle_id == 1).order_by(models.Ride.id).all()
+    data = RIDES_OUT.dump_python(RIDES_OUT.validate_python(rides, from_attributes=True), mode="json")
+    return JSONResponse(data).body
+
+
+def rows(db):
+    return fastjson.rides_query(db, models.Ride.tank_cycle_id == 1).order_by(models.Ride.id).all()
+
+
+def orjson_json(db):
+    import orjson
+    return orjson.dumps(fastjson.ride_dicts(rows(db)))
+
+
+def stdlib_json(db):
+    return json.dumps(fastjson.ride_dicts(rows(db)), ensure_ascii=False, separators=(",", ":"),
+                      default=lambda value: value.isoformat()).encode()
+
+
+def main(ride_count):
+    ways = [("ORM + RideOut", orm_json), ("rows + json", stdlib_json)]
+    try:
+        import orjson  # noqa: F401
+        ways.insert(1, ("rows + orjson", orjson_json))
+    except ImportError:
+        print("rows + orjson: skipped (orjson is not installed)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, ride_count)
+        Session = sessionmaker(bind=engine)
+
+        print(f"{ride_count} rides")
+        print(f"{'serializer':<16} {'ms':>8}")
+        bodies = {}
+        for name, render in ways:
+            def run():
+                # A fresh session each time, as each request gets one
+                with Session() as db:
+                    bodies[name] = render(db)
+            print(f"{name:<16} {timed(run, REPEAT):8.1f}")
+        engine.dispose()
+
+    reference = bodies["ORM + RideOut"]
+    failed = False
+    for name, body in bodies.items():
+        if json.loads(body) != json.loads(reference):
+            print(f"FAILED: {name} differs from the RideOut output")
+            failed = True
+        elif body != reference:
+            print(f"{name}: same data, different bytes")
+
+    encodings = [("identity", lambda body: body),
+                 (f"gzip -{compression.GZIP_LEVEL}", lambda body: gzip.compress(body, compression.GZIP_LEVEL))]
+    if compression.brotli is not None:
+        encodings.append((f"br q{compression.BROTLI_QUALITY}",
+                          lambda body: compression.brotli.compress(body, quality=compression.BROTLI_QUALITY)))
+    else:
+        print("br: skipped (brotli is not installed)")
+
+    print(f"{'encoding':<16} {'KiB':>8} {'ratio':>6} {'ms':>8}")
+    for name, encode in encodings:
+        best = float("inf")
+        for _ in range(REPEAT):
+            t0 = time.perf_counter()
+            encoded = encode(reference)
+            best = min(best, time.perf_counter() - t0)
+        print(f"{name:<16} {len(encoded) / 1024:8.1f} {len(reference) / len(encoded):6.1f} {best * 1000:8.1f}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else ROWS))
@@ -0,0 +1,77 @@
+"""
+/api/stats reader latency while rides are being inserted, per SQLite profile.
+
+Starts uvicorn once per profile (SERVER_WORKERS processes sharing a throwaway
+database file), then runs WRITERS clients posting rides back to back while
+one reader samples GET /api/stats.
+The "legacy" profile reproduces the engine before the SQLite settings were
+configurable (rollback journal, synchronous=FULL, default cache, no mmap).
+
+Usage (from backend/):
+    python -m benchmarks.bench_sqlite_profile [seconds]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from .bench_login_load import percentile
+from .server import uvicorn_server, wait_until_up
+
+WRITERS = 8
+SERVER_WORKERS = 2
+DURATION = 10.0
+
+PROFILES = {
+    "legacy": {
+        "SQLITE_JOURNAL_MODE": "DELETE",
+        "SQLITE_SYNCHRONOUS": "FULL",
+        "SQLITE_MMAP_SIZE": "0",
+        "SQLITE_CACHE_SIZE": "-2000",
+        "SQLITE_BUSY_TIMEOUT": "5000",
+    },
+    "default": {},
+}
+
+
+async def run_profile(env, duration):
+    import httpx
+
+    latencies = []
+    counts = {"writes": 0, "failed": 0}
+    with uvicorn_server(env, workers=SERVER_WORKERS) as base_url:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await wait_until_up(client)
+            await client.post("/api/users", json={"name": "bench", "color": "#336699", "password": "secret"})
+            deadline = time.perf_counter() + duration
+
+            async def writer():
+                while time.perf_counter() < deadline:
+                    response = await client.post("/api/rides", json={
+                        "user_id": 1, "timestamp": "2024-05-01T08:00:00",
+                        "distance_km": 12.5, "consumption_l100km": 6.0,
+                    })
+                    counts["writes" if response.status_code == 200 else "failed"] += 1
+
+            async def reader():
+                while time.perf_counter() < deadline:
+                    t0 = time.perf_counter()
+                    response = await client.get("/api/stats")
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    if response.status_code != 200:
+                        counts["failed"] += 1
+
+            await asyncio.gather(reader(), *(writer() for _ in range(WRITERS)))
+    return latencies, counts
+
+
+def main(duration):
+    print(f"{'profile':<10} {'stats p50':>10} {'p95':>9} {'max':>9} {'writes/s':>9} {'failed':>7}")
+    for name, env in PROFILES.items():
+        latencies, counts = asyncio.run(run_profile(env, duration))
+        print(f"{name:<10} {statistics.median(latencies):8.2f}ms {percentile(latencies, 95):7.2f}ms "
+              f"{max(latencies):7.2f}ms {counts['writes'] / duration:9.0f} {counts['failed']:>7}")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else DURATION)
@@ -0,0 +1,115 @@
+"""
+Startup cost of the backend: import time and time to first response.
+
+Import: runs `python -X importtime -c "import app.main"` RUNS times in an empty
+directory, reports the median total and the slowest modules, and fails if the
+import touched the database (created fuel.db).
+
+First response: starts uvicorn and polls GET /api/settings until it answers,
+on an empty database (startup creates the schema and hashes the default
+admin password) and on one prepared by `python -m app.cli init-db` with
+INIT_DB_ON_STARTUP=0.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup [--json results.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .server import BACKEND_DIR, free_port
+
+RUNS = 5
+TOP_MODULES = 10
+
+
+def import_profile():
+    """(total microseconds, {module: self microseconds}, created fuel.db) of one cold import."""
+    cwd = tempfile.mkdtemp()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=cwd, env=dict(os.environ, PYTHONPATH=BACKEND_DIR), capture_output=True, text=True, check=True,
+    )
+    total = 0
+    self_times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        self_times[name.strip()] = int(self_us)
+        if name.strip() == "app.main":
+            total = int(cumulative_us)
+    return total, self_times, os.path.exists(os.path.join(cwd, "fuel.db"))
+
+
+def first_response(env, init_db=False):
+    """Seconds from spawning uvicorn until GET /api/settings returns 200."""
+    import httpx
+
+    cwd = tempfile.mkdtemp()
+    env = dict(os.environ, **env)
+    if init_db:
+        subprocess.run([sys.executable, "-m", "app.cli", "init-db"], cwd=cwd, check=True,
+                       env=dict(env, PYTHONPATH=BACKEND_DIR), stdout=subprocess.DEVNULL)
+    port = free_port()
+    t0 = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--log-level", "warning"],
+        cwd=cwd, env=env,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/api/settings").status_code == 200:
+                    return time.perf_counter() - t0
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_startup")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    profiles = [import_profile() for _ in range(RUNS)]
+    import_ms = statistics.median(total for total, _, _ in profiles) / 1000
+    touched_db = any(created for _, _, created in profiles)
+    slowest = sorted(profiles[-1][1].items(), key=lambda item: item[1], reverse=True)[:TOP_MODULES]
+
+    cold = statistics.median(first_response({}) for _ in range(RUNS))
+    prepared = statistics.median(first_response({"INIT_DB_ON_STARTUP": "0"}, init_db=True) for _ in range(RUNS))
+
+    print(f"import app.main           {import_ms:8.1f} ms (median of {RUNS})")
+    for name, self_us in slowest:
+        print(f"    {name:<36} {self_us / 1000:7.1f} ms self")
+    print(f"first response, empty db  {cold * 1000:8.1f} ms")
+    print(f"first response, init-db   {prepared * 1000:8.1f} ms (INIT_DB_ON_STARTUP=0)")
+    if touched_db:
+        print("FAILED: importing app.main created fuel.db")
+
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump({
+                "import_ms": import_ms,
+                "slowest_modules_ms": {name: self_us / 1000 for name, self_us in slowest},
+                "first_response_empty_db_ms": cold * 1000,
+                "first_response_prepared_db_ms": prepared * 1000,
+                "import_touched_db": touched_db,
+            }, out, indent=2)
+    return 1 if touched_db else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""
+Benchmark /api/stats aggregation: per-ride Python loop vs SQL GROUP BY vs rollup read.
+
+Usage (from backend/):
+    python -m benchmarks.bench_stats [rides ...]
+
+Defaults to 1k, 100k and 1M rides in a single cycle.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, stats, rollups
+
+USERS = 8
+FUEL_PRICE = 35.5
+
+
+def seed(engine, ride_count):
+    models.Base.metadata.create_all(bind=engine)
+    rng = random.Random(ride_count)
+    start = datetime(2024, 1, 1)
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.executemany(
+            "INSERT INTO users (id, name, color, password_hash, is_active) VALUES (?, ?, ?, ?, 1)",
+            [(i, f"driver{i}", "#336699", "x") for i in range(1, USERS + 1)],
+        )
+        cur.execute("INSERT INTO tank_cycles (id, start_date, is_active) VALUES (1, ?, 1)", (start,))
+        rows = []
+        for i in range(ride_count):
+            dist = round(rng.uniform(2, 150), 2)
+            cons = round(rng.uniform(4, 9), 2)
+            fuel = round(dist * cons / 100, 2)
+            rows.append((rng.randint(1, USERS), 1, start + timedelta(minutes=i), dist, cons, fuel, fuel * FUEL_PRICE))
+        cur.executemany(
+            "INSERT INTO rides (user_id, tank_cycle_id, timestamp, distance_km, consumption_l100km, fuel_liters, cost) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def legacy_stats(db, cycle):
+    """The previous implementation: load every ride and user, sum in Python."""
+    rides = db.query(models.Ride).filter(models.Ride.tank_cycle_id == cycle.id).all()
+    total_fuel = sum(r.fuel_liters for r in rides)
+    user_map = {u.id: [0.0, 0.0] for u in db.query(models.User).all()}
+    for r in rides:
+        if r.user_id in user_map:
+            user_map[r.user_id][0] += r.distance_km
+            user_map[r.user_id][1] += r.fuel_liters
+    return round(total_fuel, 2)
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def run(ride_count):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        seed(engine, ride_count)
+        Session = sessionmaker(bind=engine)
+        repeat = 5 if ride_count <= 100_000 else 2
+        with Session() as db:
+            rollups.rebuild(db)
+            db.commit()
+            cycle = db.get(models.TankCycle, 1)
+            new = stats.compute_cycle_stats(db, cycle)
+            assert new.total_fuel == legacy_stats(db, cycle)
+            sql_ms = timed(lambda: stats.build_cycle_stats(cycle, stats.cycle_user_totals(db, cycle.id)), repeat)
+            rollup_ms = timed(lambda: stats.compute_cycle_stats(db, cycle), repeat)
+            db.expire_all()
+            py_ms = timed(lambda: (legacy_stats(db, cycle), db.expunge_all()), repeat)
+        engine.dispose()
+    print(f"{ride_count:>9} rides  python: {py_ms:9.1f} ms   sql: {sql_ms:8.1f} ms   rollup: {rollup_ms:6.2f} ms")
+
+
+if __name__ == "__main__":
+    counts = [int(a) for a in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+    for n in counts:
+        run(n)
@@ -0,0 +1,130 @@
+"""
+The auth principal cache must save queries and be invalidated when its rows change.
+
+Drives the app in-process against a throwaway SQLite database and checks that
+a cached admin or driver token is resolved without loading its row (only the
+state_versions counters are read), that updating and deactivating a driver
+and changing the admin password evict the tokens they affect, also when
+another worker made the change, that a password change checks the old
+password against the database rather than a cached row another worker may
+have outdated, and that /api/admin/metrics/auth-cache counts the hits, misses
+and invalidations.
+Exits 1 if any check fails.
+
+Usage (from backend/):
+    python -m benchmarks.check_auth_cache
+"""
+import os
+import sys
+import tempfile
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi import HTTPException
+    from fastapi.security import HTTPAuthorizationCredentials
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app import main as app_main, auth, database, cli, models, state
+
+    cli.init_db()
+    statements = []
+    event.listen(database.engine, "before_cursor_execute", lambda conn, cursor, sql, *args: statements.append(sql))
+    if database.DATABASE_ASYNC:
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute",
+                     lambda conn, cursor, sql, *args: statements.append(sql))
+
+    results = []
+
+    def check(label, ok):
+        results.append(ok)
+        print(f"{'ok' if ok else 'FAILED':<7}{label}")
+
+    def resolve_user(token):
+        """Run the driver auth dependency on token; None if it rejects it."""
+        with database.SessionLocal() as db:
+            try:
+                return auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), db)
+            except HTTPException:
+                return None
+
+    def cached(kind, token):
+        return (kind, token) in auth.principal_cache
+
+    def loads_principal():
+        """Statements run since the last clear that read something besides the state counters."""
+        return [sql for sql in statements if "state_versions" not in sql]
+
+    def bump_elsewhere(name):
+        """Bump a state counter the way another worker would, leaving this process's caches alone."""
+        with database.SessionLocal() as db:
+            database.upsert(db, models.StateVersion, {"name": name, "version": 1}, {"version": 1})
+            db.commit()
+
+    with TestClient(app_main.app) as client:
+        user_id = client.post("/api/users", json={"name": "driver", "color": "#336699", "password": "pw"}).json()["id"]
+        user_token = client.post("/api/users/login", json={"user_id": user_id, "password": "pw"}).json()["access_token"]
+        admin_token = client.post("/api/admin/login", json={"password": "Bagr123"}).json()["access_token"]
+        admin = {"Authorization": f"Bearer {admin_token}"}
+        metrics_url = "/api/admin/metrics/auth-cache"
+
+        before = client.get(metrics_url, headers=admin).json()
+        statements.clear()
+        client.get(metrics_url, headers=admin).raise_for_status()
+        check(f"cached admin token: {len(statements)} statements, none loading the admin", not loads_principal())
+
+        resolve_user(user_token)
+        statements.clear()
+        check("cached driver token resolved", resolve_user(user_token) is not None)
+        check(f"cached driver token: {len(statements)} statements, none loading the driver", not loads_principal())
+
+        # Another worker renames the driver
+        with database.SessionLocal() as db:
+            db.query(models.User).filter(models.User.id == user_id).update({models.User.name: "renamed"})
+            db.commit()
+        bump_elsewhere(state.USERS)
+        principal = resolve_user(user_token)
+        check("another worker's driver change reloads the row", principal is not None and principal.name == "renamed")
+
+        client.put(f"/api/admin/users/{user_id}", json={"color": "#993366"}, headers=admin).raise_for_status()
+        check("updating a driver evicts their tokens", not cached("user", user_token))
+        principal = resolve_user(user_token)
+        check("driver token reloads the updated row", principal is not None and principal.color == "#993366")
+
+        client.delete(f"/api/admin/users/{user_id}", headers=admin).raise_for_status()
+        check("deactivating a driver evicts their tokens", not cached("user", user_token))
+        check("deactivated driver's token is rejected", resolve_user(user_token) is None)
+
+        # Change the password behind the app's back; this worker still has the old admin row cached
+        with database.SessionLocal() as db:
+            db.query(models.Admin).update({models.Admin.password_hash: auth.hash_password("Other123")})
+            db.commit()
+        check("admin token still cached", cached("admin", admin_token))
+        response = client.post("/api/admin/password", json={"old_password": "Bagr123", "new_password": "New123"},
+                               headers=admin)
+        check(f"old password from a stale cached row rejected ({response.status_code})", response.status_code == 401)
+
+        response = client.post("/api/admin/password", json={"old_password": "Other123", "new_password": "New123"},
+                               headers=admin)
+        check(f"password change with the stored password ({response.status_code})", response.status_code == 200)
+        check("changing the admin password evicts the admin's tokens", not cached("admin", admin_token))
+
+        client.get(metrics_url, headers=admin).raise_for_status()
+        bump_elsewhere(state.ADMIN)
+        statements.clear()
+        client.get(metrics_url, headers=admin).raise_for_status()
+        check("another worker's admin password change reloads the admin", bool(loads_principal()))
+
+        after = client.get(metrics_url, headers=admin).json()
+        for counter in ("hits", "misses", "invalidations"):
+            check(f"metrics {counter}: {before[counter]} -> {after[counter]}", after[counter] > before[counter])
+
+    if not all(results):
+        print("FAILED: auth cache checks")
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""
+SQL statements per request must not grow with the number of rides.
+
+Drives the endpoints that return rides with their drivers in-process against
+a throwaway SQLite database, growing the active cycle from 10 to 1000 rides
+per driver, and counts the statements each request runs (after one warm-up
+call, so the auth and state caches are filled). Exits 1 if any endpoint's
+count changes with the ride count, which is what an N+1 lazy load looks like.
+
+Usage (from backend/):
+    python -m benchmarks.check_query_counts
+"""
+import os
+import sys
+import tempfile
+
+USERS = 5
+RIDES_PER_USER = (10, 100, 1000)
+
+
+def endpoint_calls(client, admin_headers):
+    """(label, callable) pairs of the requests to count."""
+    ride = {"user_id": 2, "timestamp": "2024-05-01T08:00:00", "distance_km": 42.0, "consumption_l100km": 6.5}
+    rides_url = "/api/admin/users/1/rides"
+    return [
+        ("GET  admin rides", lambda: client.get(rides_url, headers=admin_headers)),
+        ("GET  admin rides slim", lambda: client.get(rides_url, params={"shape": "slim"}, headers=admin_headers)),
+        ("GET  admin rides ndjson", lambda: client.get(rides_url, params={"format": "ndjson"}, headers=admin_headers)),
+        ("POST /api/rides", lambda: client.post("/api/rides", json=ride)),
+        ("PUT  admin ride", lambda: client.put("/api/admin/rides/1", json={"distance_km": 50.0, "fuel_liters": 3.0},
+                                               headers=admin_headers)),
+    ]
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app import main as app_main, database, cli
+
+    cli.init_db()
+    statements = []
+    event.listen(database.engine, "before_cursor_execute", lambda *args: statements.append(1))
+    if database.DATABASE_ASYNC:
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", lambda *args: statements.append(1))
+
+    counts = {}
+    with TestClient(app_main.app) as client:
+        for i in range(USERS):
+            client.post("/api/users", json={"name": f"driver{i}", "color": "#336699", "password": "pw"})
+        token = client.post("/api/admin/login", json={"password": "Bagr123"}).json()["access_token"]
+        calls = endpoint_calls(client, {"Authorization": f"Bearer {token}"})
+
+        seeded = 0
+        for per_user in RIDES_PER_USER:
+            client.post("/api/rides/batch", json=[
+                {"user_id": r % USERS + 1, "timestamp": "2024-05-01T08:00:00", "distance_km": 12.5, "consumption_l100km": 6.0}
+                for r in range((per_user - seeded) * USERS)
+            ])
+            seeded = per_user
+            for label, call in calls:
+                call().raise_for_status()
+                statements.clear()
+                call().raise_for_status()
+                counts.setdefault(label, []).append(len(statements))
+
+    print(f"{'request':<24}" + "".join(f"{n:>7}" for n in RIDES_PER_USER) + "  (rides per driver)")
+    failed = False
+    for label, row in counts.items():
+        print(f"{label:<24}" + "".join(f"{n:>7}" for n in row))
+        if len(set(row)) > 1:
+            failed = True
+    if failed:
+        print("FAILED: statement counts grow with the number of rides")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
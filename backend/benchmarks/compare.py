@@ -0,0 +1,78 @@
+"""
+Compare two benchmarks.suite reports, e.g. of the base branch and a change.
+
+Prints every endpoint's p95 latency, throughput and SQL statements per
+request side by side with the change, and exits 1 on a regression: p95
+slower by more than --threshold (default 25%, and at least --min-ms), more
+statements per request, or error responses the base did not have.
+
+Usage (from backend/):
+    python -m benchmarks.suite --output base.json     # on the base commit
+    python -m benchmarks.suite --output head.json     # on the change
+    python -m benchmarks.compare base.json head.json [--threshold 0.25] [--min-ms 1]
+"""
+import argparse
+import json
+import sys
+
+
+def change(old, new):
+    if old is None or new is None:
+        return ""
+    if not old:
+        return "" if not new else "new"
+    return f"{(new - old) / old:+.0%}"
+
+
+def compare(base, head, threshold, min_ms):
+    """Yield table lines and (mode, endpoint, reason) regressions."""
+    regressions = []
+    lines = [f"{'mode':<10} {'endpoint':<48} {'p95 ms':>18} {'req/s':>18} {'queries':>14}"]
+    for mode, results in head["modes"].items():
+        for name, new in results.items():
+            old = base["modes"].get(mode, {}).get(name)
+            if old is None:
+                lines.append(f"{mode:<10} {name:<48} {'(new endpoint)':>18}")
+                continue
+            p95 = (old["p95_ms"], new["p95_ms"])
+            rps = (old["throughput_rps"], new["throughput_rps"])
+            queries = (old["queries_per_request"], new["queries_per_request"])
+            lines.append(
+                f"{mode:<10} {name:<48} "
+                f"{p95[0]:>7.1f}>{p95[1]:<7.1f}{change(*p95):>4} "
+                f"{rps[0]:>7.0f}>{rps[1]:<7.0f}{change(*rps):>4} "
+                f"{queries[0] or 0:>5.1f}>{queries[1] or 0:<5.1f}"
+            )
+            if p95[1] > p95[0] * (1 + threshold) and p95[1] - p95[0] >= min_ms:
+                regressions.append((mode, name, f"p95 {p95[0]} -> {p95[1]} ms"))
+            if (queries[1] or 0) > (queries[0] or 0) + 0.5:
+                regressions.append((mode, name, f"queries {queries[0]} -> {queries[1]}"))
+            if new["errors"] and not old["errors"]:
+                regressions.append((mode, name, f"{new['errors']} error responses"))
+    return lines, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Relative p95 slowdown that fails (0.25 = 25%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Ignore p95 slowdowns smaller than this")
+    args = parser.parse_args(argv)
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    if base["config"] != head["config"] or base["environment"] != head["environment"]:
+        print("Note: the reports were run with different settings or on different machines")
+    print(f"base {base.get('commit') or '?'}  ->  head {head.get('commit') or '?'}")
+    lines, regressions = compare(base, head, args.threshold, args.min_ms)
+    print("\n".join(lines))
+    for mode, name, reason in regressions:
+        print(f"REGRESSION {mode} {name}: {reason}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Query-plan regression check.
+
+Drives every API endpoint in-process against a throwaway SQLite database,
+captures each SQL statement it issues and runs EXPLAIN QUERY PLAN on it.
+Exits non-zero if any statement falls back to a full table scan of a table
+that can grow without bound.
+
+Usage (from backend/):
+    python -m benchmarks.query_plans [-v]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+from collections import defaultdict
+
+# Singleton or fleet-sized tables where a scan is expected and cheap
+SCAN_ALLOWED = {"settings", "admin", "users", "state_versions"}
+# Tables listed in full by an endpoint (or loaded in full into a cache); the scan
+# must still walk an index (or the integer primary key) instead of sorting
+INDEX_SCAN_ALLOWED = {"tank_cycles", "cycle_archives", "fuel_prices"}
+
+
+def _capture(engine, sink):
+    from sqlalchemy import event
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("SELECT", "UPDATE", "DELETE") and not executemany:
+            sink.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    return lambda: event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _endpoint_calls(client, admin_headers):
+    """(label, callable) pairs covering every route in app.main."""
+    ride = {"user_id": 1, "timestamp": "2024-05-01T08:00:00", "distance_km": 42.0, "consumption_l100km": 6.5}
+    return [
+        ("GET /api/settings", lambda: client.get("/api/settings")),
+        ("PUT /api/settings", lambda: client.put("/api/settings", json={"currency": "CZK", "fuel_price": 36.9})),
+        ("GET /api/settings/prices", lambda: client.get("/api/settings/prices")),
+        ("GET /api/users", lambda: client.get("/api/users")),
+        ("POST /api/users", lambda: client.post("/api/users", json={"name": "plan", "color": "#123456", "password": "pw"})),
+        ("POST /api/users/login", lambda: client.post("/api/users/login", json={"user_id": 1, "password": "pw"})),
+        ("POST /api/rides", lambda: client.post("/api/rides", json=ride)),
+        ("POST /api/rides/batch", lambda: client.post("/api/rides/batch", json=[ride, ride])),
+        ("GET /api/cycles", lambda: client.get("/api/cycles")),
+        ("GET /api/cycles?after", lambda: client.get(
+            "/api/cycles", params={"after": "2100-01-01T00:00:00,1000", "limit": 10})),
+        ("GET /api/stats", lambda: client.get("/api/stats")),
+        ("GET /api/stats?cycle_id", lambda: client.get("/api/stats", params={"cycle_id": 1})),
+        ("GET /api/analytics/consumption", lambda: client.get(
+            "/api/analytics/consumption", params={"start": "2024-04-01", "end": "2024-05-31"})),
+        ("GET /api/analytics/consumption?user_id", lambda: client.get(
+            "/api/analytics/consumption", params={"start": "2024-01-01", "end": "2024-12-31",
+                                                  "bucket": "month", "user_id": 1})),
+        # Unfiltered exports read whole tables by design; the per-cycle one must use the index
+        ("GET /api/export/rides?cycle_id", lambda: client.get(
+            "/api/export/rides", params={"cycle_id": 1}, headers=admin_headers)),
+        ("GET /api/admin/users/{id}/rides", lambda: client.get("/api/admin/users/1/rides", headers=admin_headers)),
+        ("GET /api/admin/users/{id}/rides?cycle_id", lambda: client.get(
+            "/api/admin/users/1/rides", params={"cycle_id": 1}, headers=admin_headers)),
+        ("GET /api/admin/users/{id}/rides?after", lambda: client.get(
+            "/api/admin/users/1/rides", params={"after": "2024-04-02T08:00:00,2", "limit": 10},
+            headers=admin_headers)),
+        ("GET /api/admin/users/{id}/rides?shape=slim", lambda: client.get(
+            "/api/admin/users/1/rides", params={"shape": "slim"}, headers=admin_headers)),
+        ("PUT /api/admin/rides/{id}", lambda: client.put(
+            "/api/admin/rides/1", json={"distance_km": 40.0, "fuel_liters": 2.6}, headers=admin_headers)),
+        ("DELETE /api/admin/rides/{id}", lambda: client.delete("/api/admin/rides/2", headers=admin_headers)),
+        ("POST /api/cycles/close", lambda: client.post("/api/cycles/close")),
+        ("POST /api/admin/cycles/{id}/archive", lambda: client.post(
+            "/api/admin/cycles/1/archive", headers=admin_headers)),
+        ("GET /api/admin/archives", lambda: client.get("/api/admin/archives", headers=admin_headers)),
+        ("GET /api/admin/users/{id}/rides?cycle_id (archived)", lambda: client.get(
+            "/api/admin/users/1/rides", params={"cycle_id": 1}, headers=admin_headers)),
+        ("POST /api/admin/cycles/{id}/restore", lambda: client.post(
+            "/api/admin/cycles/1/restore", headers=admin_headers)),
+        ("DELETE /api/admin/cycles/{id}", lambda: client.delete("/api/admin/cycles/1", headers=admin_headers)),
+        ("PUT /api/admin/users/{id}", lambda: client.put(
+            "/api/admin/users/2", json={"name": "renamed", "color": "#654321"}, headers=admin_headers)),
+        ("DELETE /api/admin/users/{id}", lambda: client.delete("/api/admin/users/2", headers=admin_headers)),
+        ("POST /api/admin/password", lambda: client.post(
+            "/api/admin/password", json={"old_password": "Bagr123", "new_password": "Bagr123"}, headers=admin_headers)),
+        ("POST /api/admin/login", lambda: client.post("/api/admin/login", json={"password": "Bagr123"})),
+    ]
+
+
+def full_scans(db_path, statement, parameters):
+    """Return the EXPLAIN QUERY PLAN lines where a statement scans a growing table."""
+    conn = sqlite3.connect(db_path)
+    try:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + statement, parameters or ()).fetchall()
+    finally:
+        conn.close()
+    sorted_by_temp = any(row[-1].startswith("USE TEMP B-TREE") for row in plan)
+    scans = []
+    for row in plan:
+        detail = row[-1]
+        if not detail.startswith("SCAN "):
+            continue
+        table = detail.split()[1]
+        if table in SCAN_ALLOWED:
+            continue
+        if table in INDEX_SCAN_ALLOWED and ("USING" in detail or not sorted_by_temp):
+            continue
+        scans.append(detail)
+    return scans
+
+
+def run(verbose=False):
+    tmp = tempfile.mkdtemp()
+    os.chdir(tmp)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from fastapi.testclient import TestClient
+    from app import main, database, cli
+
+    db_path = database.engine.url.database
+    cli.init_db()
+    client = TestClient(main.app)
+    client.post("/api/users", json={"name": "driver", "color": "#336699", "password": "pw"})
+    for i in range(3):
+        client.post("/api/rides", json={
+            "user_id": 1, "timestamp": f"2024-04-0{i + 1}T08:00:00",
+            "distance_km": 10.0 + i, "consumption_l100km": 6.0
+        })
+    token = client.post("/api/admin/login", json={"password": "Bagr123"}).json()["access_token"]
+    admin_headers = {"Authorization": f"Bearer {token}"}
+
+    engines = [database.engine]
+    if database.DATABASE_ASYNC:
+        engines.append(database.async_engine.sync_engine)
+
+    failures = defaultdict(list)
+    checked = 0
+    for label, call in _endpoint_calls(client, admin_headers):
+        captured = []
+        stops = [_capture(engine, captured) for engine in engines]
+        try:
+            response = call()
+        finally:
+            for stop in stops:
+                stop()
+        if response.status_code >= 500:
+            failures[label].append(f"HTTP {response.status_code}")
+        for statement, parameters in captured:
+            checked += 1
+            scans = full_scans(db_path, statement, parameters)
+            if verbose:
+                print(f"{label}: {' '.join(statement.split())}")
+            for scan in scans:
+                failures[label].append(f"{scan}  <-  {' '.join(statement.split())}")
+
+    for label, problems in failures.items():
+        for problem in problems:
+            print(f"FAIL {label}: {problem}")
+    print(f"{checked} statement(s) checked, {sum(len(p) for p in failures.values())} full scan(s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run(verbose="-v" in sys.argv[1:]))
@@ -0,0 +1,159 @@
+"""
+Synthetic data generator: drivers, tank cycles and rides.
+
+Fills an empty database with USERS drivers, CYCLES tank cycles (all closed
+but the last) and RIDES rides, reproducibly from a random seed. Every ride
+goes through logic.calculate_ride_data like one entered in the app: the
+generator draws a trip and sends two of distance, consumption and fuel (the
+same mix of inputs the dashboard sees), and stores what the function
+completes. Drivers differ in how often they drive, their typical trip
+length (log-normal) and their car's consumption, short trips use more fuel,
+and rides fall in the daytime of their cycle's days. Rollups are rebuilt
+afterwards, so stats and analytics are ready.
+
+Every driver's password is PASSWORD; the admin keeps the default one.
+
+Usage (from backend/), into DATABASE_URL (default ./fuel.db):
+    python -m benchmarks.seed [--users 10] [--cycles 24] [--rides 20000] [--seed 0]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import auth, logic, migrations, models, prices, rollups, state
+
+USERS = 10
+CYCLES = 24
+RIDES = 20000
+PASSWORD = "bench"
+START = datetime(2024, 1, 1)
+CYCLE_DAYS = 14
+COLORS = ["#e6194b", "#3cb44b", "#4363d8", "#f58231", "#911eb4", "#42d4f4", "#f032e6", "#bfef45"]
+# How a ride is entered: distance + consumption from the trip computer, distance + fuel
+# from the pump receipt, or consumption + fuel
+INPUT_MIX = (("dist_cons", 0.7), ("dist_fuel", 0.2), ("cons_fuel", 0.1))
+CHUNK = 10000
+
+
+def drivers(rng, count):
+    """(weight, median trip km, car L/100km) per driver; a few drivers make most trips."""
+    return [
+        (1 / (rank + 1) ** 0.8, rng.uniform(8, 35), rng.uniform(4.5, 9.5))
+        for rank in range(count)
+    ]
+
+
+def ride_inputs(rng, median_km, car_consumption):
+    """The two values a driver would enter for one trip, the third left as None."""
+    dist = min(max(rng.lognormvariate(math.log(median_km), 0.7), 0.5), 900)
+    # Cold starts make short trips thirstier
+    cons = car_consumption * rng.gauss(1, 0.08) + (1.5 if dist < 5 else 0)
+    cons = min(max(cons, 2.0), 25.0)
+    fuel = dist * cons / 100
+    mode = rng.choices([m for m, _ in INPUT_MIX], [w for _, w in INPUT_MIX])[0]
+    if mode == "dist_cons":
+        return round(dist, 1), round(cons, 1), None
+    if mode == "dist_fuel":
+        return round(dist, 1), None, round(fuel, 2)
+    return None, round(cons, 1), round(fuel, 2)
+
+
+def generate(rng, users, cycles, rides):
+    """Yield (cycle index, user index, timestamp, dist, cons, fuel) rows, grouped by cycle, in time order."""
+    profiles = drivers(rng, users)
+    weights = [p[0] for p in profiles]
+    # Tank fills vary: some cycles get more rides than others
+    cycle_weights = [rng.uniform(0.7, 1.3) for _ in range(cycles)]
+    per_cycle = [0] * cycles
+    for index in rng.choices(range(cycles), cycle_weights, k=rides):
+        per_cycle[index] += 1
+    for cycle, count in enumerate(per_cycle):
+        cycle_start = START + timedelta(days=cycle * CYCLE_DAYS)
+        stamps = sorted(
+            cycle_start + timedelta(days=rng.randrange(CYCLE_DAYS), hours=rng.uniform(6, 22))
+            for _ in range(count)
+        )
+        for timestamp in stamps:
+            user = rng.choices(range(users), weights)[0]
+            dist, cons, fuel = logic.calculate_ride_data(*ride_inputs(rng, profiles[user][1], profiles[user][2]))
+            yield cycle, user, timestamp, dist, cons, fuel
+
+
+def populate(engine, users=USERS, cycles=CYCLES, rides=RIDES, seed=0) -> dict:
+    """Create the schema and fill an empty database on engine. Returns the ids and counts it created."""
+    if cycles < 1:
+        raise ValueError("at least one cycle is needed")
+    migrations.upgrade(engine)
+    rng = random.Random(seed)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        if db.query(models.Ride.id).first() is not None or db.query(models.User.id).first() is not None:
+            raise ValueError(f"{engine.url.render_as_string(hide_password=True)} already has drivers or rides")
+        auth.ensure_admin(db)
+        prices.ensure_populated(db)
+        history = prices.load(db)
+        # A fresh database may already have its first (empty) active cycle
+        db.query(models.TankCycle).delete(synchronize_session=False)
+
+        password_hash = auth.hash_password(PASSWORD)
+        user_ids = db.execute(insert(models.User).returning(models.User.id, sort_by_parameter_order=True), [
+            {"name": f"driver{i + 1:02d}", "color": COLORS[i % len(COLORS)], "password_hash": password_hash,
+             "is_active": True}
+            for i in range(users)
+        ]).scalars().all()
+        cycle_ids = db.execute(insert(models.TankCycle).returning(models.TankCycle.id, sort_by_parameter_order=True), [
+            {"start_date": START + timedelta(days=c * CYCLE_DAYS),
+             "end_date": START + timedelta(days=(c + 1) * CYCLE_DAYS) if c < cycles - 1 else None,
+             "is_active": c == cycles - 1}
+            for c in range(cycles)
+        ]).scalars().all()
+
+        chunk = []
+        for cycle, user, timestamp, dist, cons, fuel in generate(rng, users, cycles, rides):
+            chunk.append({"user_id": user_ids[user], "tank_cycle_id": cycle_ids[cycle], "timestamp": timestamp,
+                          "distance_km": dist, "consumption_l100km": cons, "fuel_liters": fuel,
+                          "cost": history.cost(timestamp, fuel)})
+            if len(chunk) == CHUNK:
+                db.execute(insert(models.Ride), chunk)
+                chunk = []
+        if chunk:
+            db.execute(insert(models.Ride), chunk)
+
+        rollups.rebuild(db)
+        rollups.rebuild_daily(db)
+        for name in (state.USERS, state.CYCLES, state.ACTIVE_CYCLE):
+            state.bump(db, name)
+        db.commit()
+        ride_ids = db.query(func.min(models.Ride.id), func.max(models.Ride.id)).one()
+    return {"users": list(user_ids), "cycles": list(cycle_ids), "rides": rides, "ride_ids": tuple(ride_ids)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.seed", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=USERS)
+    parser.add_argument("--cycles", type=int, default=CYCLES)
+    parser.add_argument("--rides", type=int, default=RIDES)
+    parser.add_argument("--seed", type=int, default=0, help="Random seed; the same seed gives the same data")
+    args = parser.parse_args(argv)
+
+    from app import database
+
+    t0 = time.perf_counter()
+    try:
+        populate(database.engine, args.users, args.cycles, args.rides, args.seed)
+    except ValueError as exc:
+        print(f"Not seeded: {exc}")
+        return 1
+    print(f"Seeded {args.users} drivers, {args.cycles} cycles and {args.rides} rides into "
+          f"{database.engine.url.render_as_string(hide_password=True)} in {time.perf_counter() - t0:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Run the backend under uvicorn in a subprocess for HTTP benchmarks.
+"""
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(env=None, workers=1):
+    """Start uvicorn on a free port with a throwaway database; yields the base URL."""
+    port = free_port()
+    cwd = tempfile.mkdtemp()
+    env = dict(os.environ, **(env or {}))
+    if workers > 1:
+        # Create the schema once so the workers do not race on it at startup
+        subprocess.run([sys.executable, "-m", "app.cli", "init-db"], cwd=cwd, check=True,
+                       env=dict(env, PYTHONPATH=BACKEND_DIR), stdout=subprocess.DEVNULL)
+        env["INIT_DB_ON_STARTUP"] = "0"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", BACKEND_DIR,
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+         "--timeout-graceful-shutdown", "5"],
+        cwd=cwd, env=env,
+    )
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def wait_until_up(client):
+    for _ in range(100):
+        try:
+            await client.get("/api/settings")
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
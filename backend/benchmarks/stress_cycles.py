@@ -0,0 +1,126 @@
+"""
+Stress test of the active cycle: many threads posting rides and closing cycles.
+
+THREADS client threads hit two uvicorn workers with POST /api/rides and, now
+and then, POST /api/cycles/close, starting before any cycle exists. Fails
+unless, afterwards:
+  - exactly one cycle is active,
+  - no ride points at a missing cycle,
+  - no ride that was sent after a close had returned landed in the closed
+    (or an older) cycle,
+  - the rollups match the rides table.
+
+Runs on SQLite, and on PostgreSQL when TEST_POSTGRES_URL is set (see
+check_backends).
+
+Usage (from backend/):
+    python -m benchmarks.stress_cycles [threads] [requests_per_thread]
+"""
+import asyncio
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .check_backends import backends, rollup_drift
+from .server import uvicorn_server, wait_until_up
+
+THREADS = 32
+REQUESTS_PER_THREAD = 40
+CLOSE_EVERY = 10  # on average, one close per this many requests
+# This checks correctness, not latency: with dozens of writers queued on one
+# SQLite file a write can wait longer than the default busy timeout
+SERVER_ENV = {"SQLITE_BUSY_TIMEOUT": "30000"}
+
+
+def client_thread(base_url, seed, count, rides, closes, errors):
+    import httpx
+
+    rng = random.Random(seed)
+    with httpx.Client(base_url=base_url, timeout=60) as client:
+        for i in range(count):
+            sent = time.monotonic()
+            if rng.randrange(CLOSE_EVERY) == 0:
+                response = client.post("/api/cycles/close")
+                if response.status_code == 200:
+                    closes.append((time.monotonic(), response.json()["id"]))
+            else:
+                response = client.post("/api/rides", json={
+                    "user_id": 1, "timestamp": f"2024-07-01T09:{i % 60:02d}:00",
+                    "distance_km": 10.0, "consumption_l100km": 6.0,
+                })
+                if response.status_code == 200:
+                    rides.append((sent, response.json()["tank_cycle_id"]))
+            if response.status_code != 200:
+                errors.append(f"{response.request.url.path}: HTTP {response.status_code} {response.text[:200]}")
+
+
+async def server_up(base_url):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        await wait_until_up(client)
+
+
+def stress(url, threads, count):
+    import httpx
+    from sqlalchemy import create_engine, text
+
+    rides, closes, problems = [], [], []
+    with uvicorn_server(dict(SERVER_ENV, DATABASE_URL=url), workers=2) as base_url:
+        asyncio.run(server_up(base_url))
+        httpx.post(f"{base_url}/api/users", json={"name": "stress", "color": "#336699", "password": "secret"})
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            for seed in range(threads):
+                pool.submit(client_thread, base_url, seed, count, rides, closes, problems)
+        elapsed = time.perf_counter() - t0
+
+    # A ride sent after a close returned must belong to a newer cycle
+    closes.sort()
+    for sent, cycle_id in rides:
+        stale = [closed_id for returned, closed_id in closes if returned < sent and cycle_id <= closed_id]
+        if stale:
+            problems.append(f"ride sent after cycle {stale[0]} was closed landed in cycle {cycle_id}")
+
+    engine = create_engine(url)
+    with engine.connect() as conn:
+        active = conn.execute(text("SELECT COUNT(*) FROM tank_cycles WHERE is_active")).scalar()
+        orphans = conn.execute(text(
+            "SELECT COUNT(*) FROM rides LEFT JOIN tank_cycles ON tank_cycles.id = rides.tank_cycle_id "
+            "WHERE tank_cycles.id IS NULL"
+        )).scalar()
+        stored = conn.execute(text("SELECT COUNT(*) FROM rides")).scalar()
+    engine.dispose()
+    if active != 1:
+        problems.append(f"{active} active cycles")
+    if orphans:
+        problems.append(f"{orphans} rides point at a missing cycle")
+    if stored != len(rides):
+        problems.append(f"{stored} rides stored, {len(rides)} acknowledged")
+    problems += rollup_drift(url)
+
+    print(f"  {len(rides)} rides and {len(closes)} closes from {threads} threads in {elapsed:.1f} s")
+    return problems
+
+
+def main(threads, count):
+    failed = False
+    for name, url, skip_reason in backends():
+        if skip_reason:
+            print(f"{name}: skipped ({skip_reason})")
+            continue
+        print(f"{name}:")
+        problems = stress(url, threads, count)
+        print(f"  {'FAILED' if problems else 'ok'}")
+        for problem in problems[:20]:
+            print(f"  {problem}")
+        failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else THREADS,
+        int(sys.argv[2]) if len(sys.argv) > 2 else REQUESTS_PER_THREAD,
+    ))
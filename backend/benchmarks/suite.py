@@ -0,0 +1,356 @@
+"""
+Benchmark suite: every endpoint, in-process and over HTTP, as JSON.
+
+Seeds a throwaway database with benchmarks.seed (the same data for the same
+--seed), then sends --requests requests to each endpoint of app.main: first
+in-process through TestClient, one at a time, then over HTTP to uvicorn with
+--concurrency clients. Read endpoints get one unmeasured warm-up request.
+Endpoints that hash passwords run at most BCRYPT_REQUESTS requests, and
+destructive ones use up seeded rows (each DELETE targets a different ride,
+cycle or driver), so they run last. GET /api/live is left to bench_live.
+
+For each endpoint the report has the request count, non-2xx responses,
+throughput, mean/p50/p95/p99 latency and SQL statements per request
+(in-process: counted on the engine; over HTTP: the X-Query-Count header,
+which leaves out statements run after a streamed response's headers). The
+report is written as JSON to --output (default: stdout) together with the
+commit, settings and dataset size, so two runs can be diffed with
+benchmarks.compare.
+
+Usage (from backend/):
+    python -m benchmarks.suite [--users 10 --cycles 24 --rides 20000] [--requests 100] [--concurrency 8]
+                               [--mode both|inprocess|http] [--output report.json]
+    python -m benchmarks.suite --database-url postgresql+psycopg://.../scratch   # its tables are dropped!
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REQUESTS = 100
+CONCURRENCY = 8
+BCRYPT_REQUESTS = 5
+CLOSE_REQUESTS = 20
+BATCH_SIZE = 100
+ADMIN_PASSWORD = "Bagr123"
+
+
+class Context:
+    """Seeded ids, the admin token and the rows destructive endpoints have used up."""
+
+    def __init__(self, seeded, admin_headers):
+        self.users = seeded["users"]
+        self.cycles = seeded["cycles"]
+        self.closed = self.cycles[:-1]
+        self.first_ride, self.last_ride = seeded["ride_ids"]
+        self.admin = admin_headers
+        self.created_users = []
+
+    def closed_cycle(self, i):
+        return self.closed[i % len(self.closed)]
+
+
+def ride(i, ctx):
+    return {"user_id": ctx.users[i % len(ctx.users)], "timestamp": "2024-12-01T08:00:00",
+            "distance_km": 10.0 + i % 50, "consumption_l100km": 6.5}
+
+
+def endpoints(requests):
+    """(name, requests, warm up?, build(i, ctx) -> (method, url, request kwargs)) in run order."""
+    rides_url = lambda i, ctx: f"/api/admin/users/{ctx.users[i % len(ctx.users)]}/rides"
+    reads = [
+        ("GET /api/settings", lambda i, ctx: ("GET", "/api/settings", {})),
+        ("GET /api/users", lambda i, ctx: ("GET", "/api/users", {})),
+        ("GET /api/cycles", lambda i, ctx: ("GET", "/api/cycles", {})),
+        ("GET /api/cycles?limit=20", lambda i, ctx: ("GET", "/api/cycles", {"params": {"limit": 20}})),
+        ("GET /api/stats", lambda i, ctx: ("GET", "/api/stats", {})),
+        ("GET /api/stats?cycle_id=closed",
+         lambda i, ctx: ("GET", "/api/stats", {"params": {"cycle_id": ctx.closed_cycle(i)}})),
+        ("GET /api/analytics/consumption?bucket=week", lambda i, ctx: ("GET", "/api/analytics/consumption", {
+            "params": {"start": "2024-01-01", "end": "2024-12-31", "bucket": "week"}})),
+        ("GET /api/admin/users/{id}/rides", lambda i, ctx: ("GET", rides_url(i, ctx), {"headers": ctx.admin})),
+        ("GET /api/admin/users/{id}/rides?shape=slim", lambda i, ctx: ("GET", rides_url(i, ctx), {
+            "params": {"shape": "slim"}, "headers": ctx.admin})),
+        ("GET /api/admin/users/{id}/rides?format=ndjson", lambda i, ctx: ("GET", rides_url(i, ctx), {
+            "params": {"format": "ndjson"}, "headers": ctx.admin})),
+        ("GET /api/export/rides?cycle_id=closed", lambda i, ctx: ("GET", "/api/export/rides", {
+            "params": {"cycle_id": ctx.closed_cycle(i)}, "headers": ctx.admin})),
+        ("GET /api/export/cycles", lambda i, ctx: ("GET", "/api/export/cycles", {"headers": ctx.admin})),
+    ]
+    for name in ("auth-cache", "state-cache", "passwords", "group-commit", "live"):
+        reads.append((f"GET /api/admin/metrics/{name}",
+                      lambda i, ctx, name=name: ("GET", f"/api/admin/metrics/{name}", {"headers": ctx.admin})))
+    reads.append(("GET /metrics", lambda i, ctx: ("GET", "/metrics", {})))
+
+    writes = [
+        ("PUT /api/settings", requests, lambda i, ctx: ("PUT", "/api/settings", {
+            "json": {"currency": "CZK", "fuel_price": 35.5 + i % 3}})),
+        ("POST /api/rides", requests, lambda i, ctx: ("POST", "/api/rides", {"json": ride(i, ctx)})),
+        (f"POST /api/rides/batch ({BATCH_SIZE} rides)", requests, lambda i, ctx: ("POST", "/api/rides/batch", {
+            "json": [ride(i * BATCH_SIZE + r, ctx) for r in range(BATCH_SIZE)]})),
+        ("PUT /api/admin/rides/{id}", requests, lambda i, ctx: (
+            "PUT", f"/api/admin/rides/{ctx.first_ride + i}",
+            {"json": {"distance_km": 50.0, "consumption_l100km": 6.0, "fuel_liters": 3.0}, "headers": ctx.admin})),
+        ("PUT /api/admin/users/{id}", requests, lambda i, ctx: (
+            "PUT", f"/api/admin/users/{ctx.users[i % len(ctx.users)]}",
+            {"json": {"color": f"#{i % 256:02x}6699"}, "headers": ctx.admin})),
+        ("POST /api/users", BCRYPT_REQUESTS, lambda i, ctx: ("POST", "/api/users", {
+            "json": {"name": f"bench{i}-{time.time_ns()}", "color": "#336699", "password": "secret"}})),
+        ("POST /api/users/login", BCRYPT_REQUESTS, lambda i, ctx: ("POST", "/api/users/login", {
+            "json": {"user_id": ctx.users[0], "password": "bench"}})),
+        ("POST /api/admin/login", BCRYPT_REQUESTS, lambda i, ctx: ("POST", "/api/admin/login", {
+            "json": {"password": ADMIN_PASSWORD}})),
+        ("POST /api/admin/password", BCRYPT_REQUESTS, lambda i, ctx: ("POST", "/api/admin/password", {
+            "json": {"old_password": ADMIN_PASSWORD, "new_password": ADMIN_PASSWORD}, "headers": ctx.admin})),
+        ("POST /api/cycles/close", min(requests, CLOSE_REQUESTS), lambda i, ctx: ("POST", "/api/cycles/close", {})),
+        ("DELETE /api/admin/rides/{id}", requests, lambda i, ctx: (
+            "DELETE", f"/api/admin/rides/{ctx.last_ride - i}", {"headers": ctx.admin})),
+        ("DELETE /api/admin/cycles/{id}", requests, lambda i, ctx: (
+            "DELETE", f"/api/admin/cycles/{ctx.closed[-1 - i]}", {"headers": ctx.admin})),
+        ("DELETE /api/admin/users/{id}", BCRYPT_REQUESTS, lambda i, ctx: (
+            "DELETE", f"/api/admin/users/{ctx.created_users[i]}", {"headers": ctx.admin})),
+    ]
+    return [(name, requests, True, build) for name, build in reads] + [
+        (name, count, False, build) for name, count, build in writes
+    ]
+
+
+def capped(name, count, requests, ctx):
+    """count, or fewer if the endpoint would run out of rows to use up."""
+    limits = {
+        "DELETE /api/admin/cycles/{id}": len(ctx.closed) - 1,
+        "DELETE /api/admin/rides/{id}": ctx.last_ride - ctx.first_ride - requests,
+        "DELETE /api/admin/users/{id}": len(ctx.created_users),
+    }
+    return max(0, min(count, limits.get(name, count)))
+
+
+def summarize(method, latencies, statuses, queries, elapsed):
+    cuts = statistics.quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else latencies * 99
+    counted = [q for q in queries if q is not None]
+    return {
+        "method": method,
+        "requests": len(latencies),
+        "errors": sum(1 for code in statuses if code >= 400),
+        "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+        "queries_per_request": round(statistics.fmean(counted), 2) if counted else None,
+        "max_queries": max(counted) if counted else None,
+    }
+
+
+def track_created_users(name, response, ctx):
+    if name == "POST /api/users" and response.status_code == 200:
+        ctx.created_users.append(response.json()["id"])
+
+
+def run_inprocess(seeded, requests):
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app import database, main as app_main
+
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    engines = [database.engine] + ([database.async_engine.sync_engine] if database.DATABASE_ASYNC else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+
+    results = {}
+    with TestClient(app_main.app) as client:
+        token = client.post("/api/admin/login", json={"password": ADMIN_PASSWORD}).json()["access_token"]
+        ctx = Context(seeded, {"Authorization": f"Bearer {token}"})
+        for name, count_requests, warm_up, build in endpoints(requests):
+            count_requests = capped(name, count_requests, requests, ctx)
+            if not count_requests:
+                continue
+            if warm_up:
+                method, url, kwargs = build(0, ctx)
+                client.request(method, url, **kwargs)
+            latencies, statuses, queries = [], [], []
+            start = time.perf_counter()
+            for i in range(count_requests):
+                method, url, kwargs = build(i, ctx)
+                statements[0] = 0
+                t0 = time.perf_counter()
+                response = client.request(method, url, **kwargs)
+                latencies.append(time.perf_counter() - t0)
+                statuses.append(response.status_code)
+                queries.append(statements[0])
+                track_created_users(name, response, ctx)
+            results[name] = summarize(method, latencies, statuses, queries, time.perf_counter() - start)
+            print(f"  in-process {name}: {results[name]['p50_ms']} ms p50", file=sys.stderr)
+
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", count)
+    return results
+
+
+async def run_http(base_url, seeded, requests, concurrency):
+    import httpx
+    from .server import wait_until_up
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        await wait_until_up(client)
+        token = (await client.post("/api/admin/login", json={"password": ADMIN_PASSWORD})).json()["access_token"]
+        ctx = Context(seeded, {"Authorization": f"Bearer {token}"})
+        for name, count_requests, warm_up, build in endpoints(requests):
+            count_requests = capped(name, count_requests, requests, ctx)
+            if not count_requests:
+                continue
+            if warm_up:
+                method, url, kwargs = build(0, ctx)
+                await client.request(method, url, **kwargs)
+            latencies, statuses, queries = [], [], []
+            next_index = iter(range(count_requests))
+
+            async def worker():
+                for i in next_index:
+                    method, url, kwargs = build(i, ctx)
+                    t0 = time.perf_counter()
+                    response = await client.request(method, url, **kwargs)
+                    latencies.append(time.perf_counter() - t0)
+                    statuses.append(response.status_code)
+                    header = response.headers.get("X-Query-Count")
+                    queries.append(int(header) if header is not None else None)
+                    track_created_users(name, response, ctx)
+
+            # Deleting drivers needs the ids of the drivers created just before
+            workers = 1 if name == "DELETE /api/admin/users/{id}" else concurrency
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(workers)))
+            method = build(0, ctx)[0]
+            results[name] = summarize(method, latencies, statuses, queries, time.perf_counter() - start)
+            print(f"  http {name}: {results[name]['throughput_rps']} req/s", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def reset(url):
+    """Drop every table of the scratch database at url."""
+    from sqlalchemy import create_engine
+    from app import models
+
+    engine = create_engine(url)
+    models.Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def seed_database(url, args):
+    from sqlalchemy import create_engine
+    from app import database
+    from . import seed
+
+    engine = database.configure(create_engine(url, **database.engine_options(url)))
+    t0 = time.perf_counter()
+    try:
+        seeded = seed.populate(engine, args.users, args.cycles, args.rides, args.seed)
+    finally:
+        engine.dispose()
+    return seeded, time.perf_counter() - t0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--cycles", type=int, default=24)
+    parser.add_argument("--rides", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="Requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Concurrent HTTP clients")
+    parser.add_argument("--mode", choices=["both", "inprocess", "http"], default="both")
+    parser.add_argument("--database-url", help="Scratch database to use instead of SQLite; its tables are dropped")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.cycles < 3:
+        parser.error("--cycles must be at least 3")
+    if args.rides < 2 * args.requests + 1:
+        parser.error("--rides must be more than twice --requests")
+
+    workdir = tempfile.mkdtemp()
+    sys.path.insert(0, BACKEND_DIR)
+
+    modes = ["inprocess", "http"] if args.mode == "both" else [args.mode]
+    urls = {}
+    for mode in modes:
+        if args.database_url:
+            urls[mode] = args.database_url
+        else:
+            os.makedirs(os.path.join(workdir, mode))
+            urls[mode] = f"sqlite:///{os.path.join(workdir, mode, 'fuel.db')}"
+    # The in-process app binds its engine to DATABASE_URL on import, so set it before importing app
+    os.environ["DATABASE_URL"] = urls[modes[0]]
+    from app import database, fastjson, groupcommit, metrics
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {name: getattr(args, name)
+                   for name in ("users", "cycles", "rides", "seed", "requests", "concurrency")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "database": database.engine.dialect.name,
+            "database_async": database.DATABASE_ASYNC,
+            "group_commit": groupcommit.GROUP_COMMIT,
+            "fast_json": fastjson.FAST_JSON,
+            "metrics_enabled": metrics.METRICS_ENABLED,
+        },
+        "seed_seconds": {},
+        "modes": {},
+    }
+    for mode in modes:
+        url = urls[mode]
+        if args.database_url:
+            reset(url)
+        print(f"Seeding {args.rides} rides for {mode}...", file=sys.stderr)
+        seeded, seconds = seed_database(url, args)
+        report["seed_seconds"][mode] = round(seconds, 2)
+        if mode == "inprocess":
+            report["modes"][mode] = run_inprocess(seeded, args.requests)
+        else:
+            from .server import uvicorn_server
+
+            with uvicorn_server({"DATABASE_URL": url}) as base_url:
+                report["modes"][mode] = asyncio.run(run_http(base_url, seeded, args.requests, args.concurrency))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    failed = [f"{mode}: {name}" for mode, results in report["modes"].items()
+              for name, result in results.items() if result["errors"]]
+    if failed:
+        print("Endpoints with error responses: " + ", ".join(failed), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,9 @@ import axios from 'axios'
 
 const api = axios.create({ baseURL: '/api' });
 
+// Server-Sent Events stream of stats, drivers and settings (GET /api/live)
+let liveSource = null;
+
 export const useAppStore = defineStore('app', {
   state: () => ({
     users: [],
@@ -12,7 +15,8 @@ export const useAppStore = defineStore('app', {
     isAuthenticated: false,
     currentUser: null,
     isAdmin: false,
-    authToken: null
+    authToken: null,
+    liveConnected: false
   }),
   getters: {
     availableDrivers: (state) => {
@@ -47,6 +51,48 @@ export const useAppStore = defineStore('app', {
       this.currentStats = cs.data;
     },
     
+    subscribeLive() {
+      if (liveSource || typeof EventSource === 'undefined') return;
+      liveSource = new EventSource('/api/live');
+      // EventSource reconnects by itself and the stream starts with the full state again
+      liveSource.onopen = () => { this.liveConnected = true; };
+      liveSource.onerror = () => { this.liveConnected = false; };
+      liveSource.addEventListener('stats', (e) => {
+        this.currentStats = JSON.parse(e.data);
+      });
+      liveSource.addEventListener('delta', (e) => {
+        const delta = JSON.parse(e.data);
+        if (!this.currentStats || this.currentStats.cycle_id !== delta.cycle_id) return;
+        const userStats = this.currentStats.user_stats.filter(u => !delta.removed.includes(u.user_id));
+        for (const changed of delta.user_stats) {
+          const index = userStats.findIndex(u => u.user_id === changed.user_id);
+          if (index >= 0) userStats[index] = changed;
+          else userStats.push(changed);
+        }
+        this.currentStats = {
+          ...this.currentStats,
+          total_distance: delta.total_distance,
+          total_fuel: delta.total_fuel,
+          total_cost: delta.total_cost,
+          user_stats: userStats
+        };
+      });
+      liveSource.addEventListener('users', (e) => {
+        this.users = JSON.parse(e.data);
+      });
+      liveSource.addEventListener('settings', (e) => {
+        this.settings = JSON.parse(e.data);
+      });
+    },
+
+    unsubscribeLive() {
+      if (liveSource) {
+        liveSource.close();
+        liveSource = null;
+      }
+      this.liveConnected = false;
+    },
+    
     async userLogin(userId, password) {
       const response = await api.post('/users/login', { user_id: userId, password });
       this.authToken = response.data.access_token;
@@ -93,6 +139,7 @@ export const useAppStore = defineStore('app', {
       this.isAdmin = false;
       this.currentUser = null;
       this.setAuthHeader();
+      this.unsubscribeLive();
       
       // Clear localStorage
       localStorage.removeItem('authToken');
@@ -121,11 +168,12 @@ export const useAppStore = defineStore('app', {
     
     async addRide(payload) {
       await api.post('/rides', payload);
-      await this.fetchInit(); // refresh stats
+      // The live stream delivers the new stats
+      if (!this.liveConnected) await this.fetchInit(); // refresh stats
     },
     async closeCycle() {
       await api.post('/cycles/close');
-      await this.fetchInit();
+      if (!this.liveConnected) await this.fetchInit();
     },
     async addUser(name, color, password) {
         await api.post('/users', {name, color, password});
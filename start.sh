@@ -45,11 +45,13 @@ cd backend
 
 source venv/bin/activate
 pip install -r requirements.txt
+python -m app.cli init-db
 
-uvicorn app.main:app \
+INIT_DB_ON_STARTUP=0 uvicorn app.main:app \
     --reload \
     --host 127.0.0.1 \
-    --port 8000 &
+    --port 8000 \
+    --timeout-graceful-shutdown 5 &
 BACKEND_PID=$!
 
 cd ..